@@ -2,13 +2,15 @@ import numpy as np
 import soundfile as sf
 import sounddevice as sd
 from pydub import AudioSegment
-import math
+
+from effects import Effect8D, EffectChain, room_reverb
 
 # -----------------------------
 # USER SETTINGS
 # -----------------------------
 rotation_speed = 0.8     # 0.3 slow – 1.5 fast
 reverb_amount = 0.20     # 0.0 – 0.3
+impulse_response = None  # reverb IR as a WAV file; None uses a synthetic room
 depth_strength = 0.30    # 0.1 – 0.5
 input_file = "song.wav"  # WAV needed
 # -----------------------------
@@ -29,41 +31,35 @@ else:
 
 print("🎵 Starting LIVE 8D playback...\nPress CTRL+C to stop\n")
 
-angle = 0
+effect = EffectChain([
+    Effect8D(samplerate, rotation_speed, reverb_amount=0.0, depth_strength=depth_strength),
+    room_reverb(reverb_amount, impulse_response),
+], samplerate)
+block = np.zeros((4096, 2))
 index = 0
 
 def audio_callback(outdata, frames, time, status):
-    global angle, index
+    global index, block
 
     if status:
         print(status)
 
-    chunk_left = []
-    chunk_right = []
+    if len(block) < frames:
+        block = np.zeros((frames, 2))
+    chunk = block[:frames]
 
-    for _ in range(frames):
+    # Loop the song
+    filled = 0
+    while filled < frames:
         if index >= len(mono):
-            index = 0   # loop song
-
-        angle += rotation_speed * (1.0 / samplerate)
-        pan = (math.sin(angle) + 1) / 2
-        depth = 1 - (math.cos(angle) * depth_strength)
-
-        left = mono[index] * (1 - pan) * depth
-        right = mono[index] * pan * depth
-
-        # reverb (simple echo)
-        if index > 500:
-            left += mono[index-500] * reverb_amount
-            right += mono[index-500] * reverb_amount
-
-        chunk_left.append(left)
-        chunk_right.append(right)
-
-        index += 1
-
-    stereo_chunk = np.column_stack((chunk_left, chunk_right)).astype(np.float32)
-    outdata[:] = stereo_chunk
+            index = 0
+        n = min(frames - filled, len(mono) - index)
+        chunk[filled:filled + n, 0] = mono[index:index + n]
+        filled += n
+        index += n
+    chunk[:, 1] = chunk[:, 0]
+
+    outdata[:] = effect.process(chunk)
 
 # Start stream
 with sd.OutputStream(channels=2, callback=audio_callback, samplerate=samplerate):
@@ -0,0 +1,296 @@
+import os
+import sys
+import math
+import zlib
+import ctypes
+import numpy as np
+import scipy.signal as sig
+import librosa
+from collections import namedtuple
+from functools import lru_cache
+
+from audio_cache import track_key
+from audio_stream import open_reader, decode_chunks
+
+
+# Rate tracks are decoded at for analysis
+ANALYSIS_SR = 22050
+
+
+# ================= BEATS =================
+def detect_beats(y, sr):
+    """Tempo (BPM) and beat times in seconds of a mono signal"""
+    tempo, frames = librosa.beat.beat_track(y=y, sr=sr)
+    tempo = float(np.atleast_1d(tempo)[0])
+    return tempo, np.asarray(librosa.frames_to_time(frames, sr=sr), dtype=np.float64)
+
+
+def beat_frames(times, sr):
+    """Sorted beat positions in frames at playback rate `sr`"""
+    return np.sort(np.round(np.asarray(times) * sr).astype(np.int64))
+
+
+class BeatCache:
+    """Beat analysis results stored next to the PCM cache, one .npz per track.
+
+    Keyed like the PCM cache, so an edited file is analysed again.
+    """
+
+    def __init__(self, directory="analysis_cache"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, path):
+        return os.path.join(self.directory, track_key(path, "beats") + ".npz")
+
+    def get(self, path):
+        """(tempo, beat times) or None"""
+        try:
+            with np.load(self.entry_path(path)) as data:
+                return float(data["tempo"]), data["times"]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put(self, path, tempo, times):
+        try:
+            np.savez(self.entry_path(path), tempo=tempo, times=times)
+        except OSError as e:
+            print(f"Beat cache: could not store {os.path.basename(path)}: {e}")
+
+
+def track_beats(path, cache=None):
+    """Tempo and beat times for a file, from `cache` when it has them"""
+    if cache is not None:
+        cached = cache.get(path)
+        if cached is not None:
+            return cached
+    y, sr = librosa.load(path, sr=ANALYSIS_SR, mono=True)
+    tempo, times = detect_beats(y, sr)
+    if cache is not None:
+        cache.put(path, tempo, times)
+    return tempo, times
+
+
+# ================= LOUDNESS =================
+# Playback level tracks are brought to (ReplayGain 2 uses -18, streaming
+# services -14)
+TARGET_LUFS = -16.0
+# Quiet tracks are raised by at most this much...
+MAX_BOOST_DB = 9.0
+# ...and only as far as this many dB of true peak over full scale, which the
+# output limiter then takes off
+PEAK_HEADROOM_DB = 3.0
+
+
+@lru_cache(maxsize=8)
+def k_weighting_sos(sr):
+    """BS.1770 K-weighting (head shelf + RLB high-pass) for any rate, cached per rate"""
+    # Stage 1: high shelf
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sr)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # Stage 2: high-pass
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sr)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
+
+
+class LoudnessMeter:
+    """Streaming EBU R128 integrated loudness and true peak.
+
+    Feed (frames, channels) chunks to add(); only the K-weighted energy of
+    every 100 ms is kept, so a whole track is measured in constant memory.
+    integrated() gates 400 ms blocks (75% overlap) at -70 LUFS and then 10
+    LU below their mean, as BS.1770-4 specifies. The true peak is read
+    from a 4x polyphase upsampling that carries its history across chunks.
+    """
+
+    TRUE_PEAK_SPAN = 6
+
+    def __init__(self, sr):
+        self.sr = sr
+        self.sos = k_weighting_sos(sr)
+        self.zi = None
+        self.hop = max(1, int(round(0.1 * sr)))
+        self._hops = []
+        self._carry = np.zeros(0)
+        span = self.TRUE_PEAK_SPAN
+        self._oversample = sig.firwin(8 * span + 1, 1 / 4) * 4
+        self._history = None
+        self.peak = 0.0
+
+    def add(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if chunk.ndim == 1:
+            chunk = chunk[:, None]
+        if self.zi is None:
+            self.zi = np.zeros((len(self.sos), 2, chunk.shape[1]))
+            self._history = np.zeros((2 * self.TRUE_PEAK_SPAN, chunk.shape[1]))
+
+        weighted, self.zi = sig.sosfilt(self.sos, chunk, axis=0, zi=self.zi)
+        # Channel weights are 1 for left, right and mono
+        energy = np.square(weighted).sum(axis=1)
+        energy = np.concatenate((self._carry, energy))
+        full = len(energy) // self.hop * self.hop
+        self._hops.append(energy[:full].reshape(-1, self.hop).sum(axis=1))
+        self._carry = energy[full:]
+
+        span = self.TRUE_PEAK_SPAN
+        ext = np.concatenate((self._history, chunk))
+        delay = (len(self._oversample) - 1) // 2
+        up = sig.upfirdn(self._oversample, ext, up=4, axis=0)
+        up = up[delay + 4 * span:delay + 4 * (len(ext) - span)]
+        if len(up):
+            self.peak = max(self.peak, float(np.abs(up).max()))
+        self._history = ext[len(ext) - 2 * span:]
+
+    def integrated(self):
+        """Integrated loudness in LUFS; -70 for silence or under 400 ms"""
+        hops = np.concatenate(self._hops) if self._hops else np.zeros(0)
+        if len(hops) < 4:
+            return -70.0
+        blocks = (hops[:-3] + hops[1:-2] + hops[2:-1] + hops[3:]) / (4 * self.hop)
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[loudness > -70.0]
+        if not len(gated):
+            return -70.0
+        relative = -0.691 + 10 * math.log10(gated.mean()) - 10.0
+        gated = blocks[(loudness > -70.0) & (loudness > relative)]
+        return -0.691 + 10 * math.log10(gated.mean())
+
+    def true_peak_db(self):
+        return 20 * math.log10(max(self.peak, 1e-9))
+
+
+def measure_loudness(path):
+    """(integrated LUFS, true peak dBTP) of a file, decoded in chunks.
+
+    Top-level so it can run in a process pool.
+    """
+    reader = open_reader(path)
+    try:
+        meter = LoudnessMeter(reader.sr)
+        for chunk in decode_chunks(reader, mono=False):
+            meter.add(chunk)
+    finally:
+        reader.close()
+    return meter.integrated(), meter.true_peak_db()
+
+
+def loudness_gain(lufs, peak_db, target=TARGET_LUFS):
+    """Linear playback gain that brings a track to `target` LUFS"""
+    gain_db = min(target - lufs, MAX_BOOST_DB, PEAK_HEADROOM_DB - peak_db)
+    return 10 ** (gain_db / 20)
+
+
+# ================= LIBRARY ANALYSIS =================
+# Hop of the onset-strength envelope at ANALYSIS_SR (about 23 ms)
+ONSET_HOP = 512
+
+# Krumhansl-Kessler key profiles, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+PITCH_CLASSES = ("C", "C#", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B")
+
+# bpm, beats and onset are packed (see pack_beats / pack_envelope)
+TrackAnalysis = namedtuple("TrackAnalysis", "bpm beats key key_strength onset")
+
+
+def _key_templates():
+    """(24, 12) standardised profiles of every major then minor key"""
+    rows = [np.roll(profile, tonic) for profile in (MAJOR_PROFILE, MINOR_PROFILE) for tonic in range(12)]
+    templates = np.array(rows)
+    templates -= templates.mean(axis=1, keepdims=True)
+    templates /= templates.std(axis=1, keepdims=True)
+    return templates
+
+
+KEY_TEMPLATES = _key_templates()
+
+
+def detect_key(chroma):
+    """(key name, correlation) of a (12, frames) chromagram, Krumhansl-Schmuckler"""
+    profile = chroma.mean(axis=1)
+    spread = profile.std()
+    if spread == 0:
+        return None, 0.0
+    profile = (profile - profile.mean()) / spread
+    scores = KEY_TEMPLATES @ profile / 12
+    best = int(np.argmax(scores))
+    mode = "major" if best < 12 else "minor"
+    return f"{PITCH_CLASSES[best % 12]} {mode}", float(scores[best])
+
+
+def pack_beats(times):
+    """Beat times as zlib-compressed millisecond steps (2 bytes per beat)"""
+    ms = np.round(np.asarray(times) * 1000).astype(np.int64)
+    steps = np.diff(ms, prepend=0)
+    if len(steps) and (steps.min() < 0 or steps.max() > 0xFFFF):
+        # Unsorted or a gap over a minute: fall back to absolute times
+        return b"a" + zlib.compress(ms.astype("<u4").tobytes())
+    return b"d" + zlib.compress(steps.astype("<u2").tobytes())
+
+
+def unpack_beats(blob):
+    """Beat times in seconds from pack_beats()"""
+    if not blob:
+        return np.zeros(0)
+    data = zlib.decompress(blob[1:])
+    if blob[:1] == b"a":
+        ms = np.frombuffer(data, dtype="<u4").astype(np.int64)
+    else:
+        ms = np.cumsum(np.frombuffer(data, dtype="<u2"), dtype=np.int64)
+    return ms / 1000.0
+
+
+def pack_envelope(envelope):
+    """An envelope scaled to its peak and quantised to one byte per frame"""
+    envelope = np.asarray(envelope, dtype=np.float64)
+    peak = envelope.max() if len(envelope) else 0.0
+    scaled = np.round(envelope / peak * 255) if peak > 0 else np.zeros(len(envelope))
+    return zlib.compress(scaled.astype(np.uint8).tobytes())
+
+
+def unpack_envelope(blob):
+    """Envelope from pack_envelope(), 0..1"""
+    if not blob:
+        return np.zeros(0)
+    return np.frombuffer(zlib.decompress(blob), dtype=np.uint8) / 255.0
+
+
+def analyze_track(path, beat_cache_directory=None):
+    """Tempo, beat grid, key and onset strength of a file.
+
+    Top-level so it can run in a process pool. The beats also go to the
+    BeatCache in `beat_cache_directory`, where playback picks them up.
+    """
+    y, sr = librosa.load(path, sr=ANALYSIS_SR, mono=True)
+    onset = librosa.onset.onset_strength(y=y, sr=sr, hop_length=ONSET_HOP)
+    tempo, frames = librosa.beat.beat_track(onset_envelope=onset, sr=sr, hop_length=ONSET_HOP)
+    tempo = float(np.atleast_1d(tempo)[0])
+    times = np.asarray(librosa.frames_to_time(frames, sr=sr, hop_length=ONSET_HOP), dtype=np.float64)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=4 * ONSET_HOP)
+    key, strength = detect_key(chroma)
+    if beat_cache_directory is not None:
+        BeatCache(beat_cache_directory).put(path, tempo, times)
+    return TrackAnalysis(tempo, pack_beats(times), key, strength, pack_envelope(onset))
+
+
+def lower_priority():
+    """Process pool initializer: run analysis workers below normal priority"""
+    try:
+        if sys.platform == "win32":
+            below_normal = 0x4000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), below_normal)
+        else:
+            os.nice(10)
+    except (OSError, AttributeError) as e:
+        print(f"Analysis worker: could not lower priority: {e}")
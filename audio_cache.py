@@ -0,0 +1,254 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+# Entry header: magic, sample rate, channel count, reserved
+HEADER_MAGIC = b"SDPC"
+HEADER_BYTES = 16
+# Longest track kept in memory: ten minutes of 44.1 kHz stereo float32 (~212 MB)
+MAX_MEMORY_ENTRY_BYTES = 10 * 60 * 44100 * 2 * 4
+
+
+def track_key(path, mode):
+    """Cache key for the decoded PCM of `path`; changes when the file is edited.
+
+    `mode` names the decode settings (e.g. "native" or "22050x1").
+    """
+    st = os.stat(path)
+    ident = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{mode}"
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+# ================= DISK CACHE =================
+class CacheWriter:
+    """Appends decoded chunks to a temporary file that becomes a cache entry on commit"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        fd, self.temp_path = tempfile.mkstemp(suffix=".part", dir=cache.directory)
+        self.file = os.fdopen(fd, "wb")
+
+    def begin(self, sr, channels):
+        """Write the entry header; called before the first chunk"""
+        if self.file is not None:
+            self.file.write(HEADER_MAGIC + np.array([sr, channels, 0], dtype="<i4").tobytes())
+
+    def write(self, chunk):
+        if self.file is not None:
+            self.file.write(np.ascontiguousarray(chunk, dtype=np.float32).tobytes())
+
+    def commit(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        try:
+            os.replace(self.temp_path, self.cache.entry_path(self.key))
+            self.cache.evict()
+        except OSError as e:
+            print(f"PCM cache: could not store entry: {e}")
+            self.abort()
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class PCMDiskCache:
+    """Decoded PCM stored once per track as raw float32 and memory-mapped for playback.
+
+    Entries are keyed by path, mtime and size (plus the decode mode), so an
+    edited file is decoded again. Each entry starts with a small header
+    holding its sample rate and channel count. The total size is capped at
+    `max_bytes`; the least recently played entries go first.
+    """
+
+    def __init__(self, directory="pcm_cache", max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # Leftovers from decodes that were interrupted by a crash
+        for name in os.listdir(directory):
+            if name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def key(self, path, mode):
+        return track_key(path, mode)
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + ".pcm")
+
+    def contains(self, path, mode):
+        try:
+            return os.path.exists(self.entry_path(self.key(path, mode)))
+        except OSError:
+            return False
+
+    def open(self, path, mode):
+        """Memory-map the cached PCM for `path`; returns (samples, sr) or None"""
+        try:
+            entry = self.entry_path(self.key(path, mode))
+            if not os.path.exists(entry) or os.path.getsize(entry) <= HEADER_BYTES:
+                return None
+            with open(entry, "rb") as f:
+                header = f.read(HEADER_BYTES)
+            if header[:4] != HEADER_MAGIC:
+                return None
+            sr, channels, _ = np.frombuffer(header[4:], dtype="<i4")
+            # Bump the mtime: it is the LRU clock used by evict()
+            os.utime(entry)
+            samples = np.memmap(entry, dtype=np.float32, mode="r", offset=HEADER_BYTES)
+            return samples.reshape(-1, int(channels)), int(sr)
+        except (OSError, ValueError) as e:
+            print(f"PCM cache: could not open entry for {os.path.basename(path)}: {e}")
+            return None
+
+    def writer(self, path, mode):
+        """Start a new cache entry for `path`"""
+        try:
+            return CacheWriter(self, self.key(path, mode))
+        except OSError as e:
+            print(f"PCM cache: could not create entry: {e}")
+            return None
+
+    def total_bytes(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pcm"):
+                continue
+            full = os.path.join(self.directory, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, full, st.st_size))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, full, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(full)
+                total -= size
+            except OSError:
+                # Still mapped by a playing source on some platforms
+                pass
+
+
+# ================= MEMORY CACHE =================
+class MemoryTrackCache:
+    """LRU cache of decoded track buffers bounded by a byte budget.
+
+    Tracks are kept as decoded, i.e. native-rate stereo float32 (about 85 MB
+    for four minutes), so the default budget holds several typical tracks;
+    tracks over `max_entry_bytes` are left to the disk cache.
+    """
+
+    def __init__(self, max_bytes=768 * 1024 ** 2, max_entry_bytes=MAX_MEMORY_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.entries = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (samples, sr) or None"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key):
+        """Like get(), but leaves the hit/miss counts and the LRU order alone"""
+        with self._lock:
+            return self.entries.get(key)
+
+    def put(self, key, samples, sr):
+        if samples.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes_used -= old[0].nbytes
+            self.entries[key] = (samples, sr)
+            self.bytes_used += samples.nbytes
+            while self.bytes_used > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.bytes_used -= evicted.nbytes
+
+    def capture(self, key, max_entry_bytes=None):
+        """Sink that collects a streamed decode and stores it on commit"""
+        return MemoryCapture(self, key, max_entry_bytes or self.max_entry_bytes)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes_used,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class MemoryCapture:
+    """Decoder sink that assembles a track in memory for MemoryTrackCache"""
+
+    def __init__(self, cache, key, max_bytes):
+        self.cache = cache
+        self.key = key
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self.size = 0
+        self.sr = None
+
+    def begin(self, sr, channels):
+        self.sr = sr
+
+    def write(self, chunk):
+        if self.chunks is None:
+            return
+        self.size += chunk.nbytes
+        if self.size > self.max_bytes:
+            # Too long to keep in memory; the disk cache still covers it
+            self.chunks = None
+            return
+        self.chunks.append(np.array(chunk, dtype=np.float32))
+
+    def commit(self):
+        if self.chunks:
+            self.cache.put(self.key, np.concatenate(self.chunks), self.sr)
+        self.chunks = None
+
+    def abort(self):
+        self.chunks = None
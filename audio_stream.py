@@ -0,0 +1,543 @@
+import threading
+import numpy as np
+import soundfile as sf
+import scipy.signal as sig
+
+
+# ================= RING BUFFER =================
+class RingBuffer:
+    """Bounded single-producer / single-consumer FIFO of audio frames.
+
+    The decoder thread writes, the PortAudio callback reads. Each side only
+    moves its own index, so the reader never takes a lock. A seek empties
+    the buffer in two steps: the reader interrupt()s it, which reads as
+    empty and stops the writer, and the writer reset()s it before writing
+    from the new position.
+    """
+
+    def __init__(self, capacity, channels=1):
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.data = np.zeros((self.capacity, channels), dtype=np.float32)
+        self.read_pos = 0
+        self.write_pos = 0
+        self.eof = False
+        self.closed = False
+        self.interrupted = False
+        self._space = threading.Event()
+        self._filled = threading.Event()
+
+    @property
+    def available(self):
+        if self.interrupted:
+            return 0
+        return self.write_pos - self.read_pos
+
+    @property
+    def drained(self):
+        """The stream ended and every frame was read"""
+        return self.eof and self.available == 0 and not self.interrupted
+
+    @property
+    def free(self):
+        return self.capacity - self.available
+
+    def write(self, frames):
+        """Block until all frames are queued; returns False if the buffer was closed"""
+        offset = 0
+        total = len(frames)
+        while offset < total:
+            if self.closed or self.interrupted:
+                return False
+            free = self.free
+            if free == 0:
+                self._space.clear()
+                if self.free == 0:
+                    self._space.wait(0.1)
+                continue
+            n = min(free, total - offset)
+            start = self.write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[start:start + first] = frames[offset:offset + first]
+            self.data[:n - first] = frames[offset + first:offset + n]
+            self.write_pos += n
+            offset += n
+            self._filled.set()
+        return True
+
+    def read_into(self, out):
+        """Copy up to len(out) frames into `out` without blocking; returns frames read"""
+        n = min(len(out), self.available)
+        if n <= 0:
+            return 0
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        self.read_pos += n
+        self._space.set()
+        return n
+
+    def finish(self):
+        """Mark the end of the stream"""
+        self.eof = True
+        self._filled.set()
+
+    def close(self):
+        self.closed = True
+        self._space.set()
+        self._filled.set()
+
+    def interrupt(self):
+        """Reader side: drop what is buffered; nothing is read until reset()"""
+        self.interrupted = True
+        self._space.set()
+
+    def reset(self):
+        """Writer side: empty an interrupted buffer and let reads resume"""
+        self.read_pos = 0
+        self.write_pos = 0
+        self.eof = False
+        self.interrupted = False
+
+    def wait_for(self, frames, timeout=None):
+        """Wait until `frames` are buffered or the stream ended"""
+        while self.available < frames and not self.eof and not self.closed:
+            self._filled.clear()
+            if self.available >= frames or self.eof:
+                break
+            if not self._filled.wait(timeout):
+                return False
+        return True
+
+
+# ================= DECODERS =================
+class SoundFileReader:
+    """Chunked reader backed by libsndfile (WAV, FLAC, OGG, MP3 on recent builds)"""
+
+    def __init__(self, path):
+        self.file = sf.SoundFile(path)
+        self.sr = self.file.samplerate
+        self.channels = self.file.channels
+        self.frames = self.file.frames
+
+    def read(self, n):
+        return self.file.read(n, dtype='float32', always_2d=True)
+
+    def seek(self, frame):
+        self.file.seek(frame)
+
+    def close(self):
+        self.file.close()
+
+
+class AudioreadReader:
+    """Chunked reader for formats libsndfile can't open (AAC, M4A, WMA, ...)"""
+
+    def __init__(self, path):
+        import audioread
+        self._open = lambda: audioread.audio_open(path)
+        self.file = self._open()
+        self._buffers = iter(self.file)
+        self._pending = np.zeros((0, self.file.channels), dtype=np.float32)
+        self.sr = self.file.samplerate
+        self.channels = self.file.channels
+        self.frames = int(self.file.duration * self.sr)
+        self.position = 0
+
+    def read(self, n):
+        chunks = [self._pending]
+        have = len(self._pending)
+        while have < n:
+            try:
+                pcm = self._pcm(next(self._buffers))
+            except StopIteration:
+                break
+            chunks.append(pcm)
+            have += len(pcm)
+        data = np.concatenate(chunks) if len(chunks) > 1 else self._pending
+        self._pending = data[n:]
+        data = data[:n]
+        self.position += len(data)
+        return data
+
+    def _pcm(self, buf):
+        pcm = np.frombuffer(buf, dtype='<i2').astype(np.float32) / 32768.0
+        return pcm.reshape(-1, self.channels)
+
+    def seek(self, frame):
+        """The backends can only decode forward: going back reopens the file,
+        going forward skips from the current position"""
+        if frame < self.position:
+            self.file.close()
+            self.file = self._open()
+            self._buffers = iter(self.file)
+            self._pending = np.zeros((0, self.channels), dtype=np.float32)
+            self.position = 0
+        while self.position < frame:
+            if len(self._pending):
+                n = min(len(self._pending), frame - self.position)
+                self._pending = self._pending[n:]
+                self.position += n
+                continue
+            try:
+                buf = next(self._buffers)
+            except StopIteration:
+                break
+            frames = len(buf) // (2 * self.channels)
+            if self.position + frames <= frame:
+                # Entirely before the target: dropped without converting it
+                self.position += frames
+            else:
+                self._pending = self._pcm(buf)
+
+    def close(self):
+        self.file.close()
+
+
+def open_reader(path):
+    """Open a chunked decoder for `path`, preferring libsndfile"""
+    try:
+        return SoundFileReader(path)
+    except Exception:
+        return AudioreadReader(path)
+
+
+def decoded_format(reader, sr=None, mono=True):
+    """(rate, channels) of what decode_chunks yields; None keeps the native rate"""
+    return sr or reader.sr, 1 if mono else min(reader.channels, 2)
+
+
+def fold_to_stereo(chunk):
+    """Mix a multichannel chunk down to two channels (odd channels left, even right)"""
+    left = chunk[:, 0::2].mean(axis=1)
+    right = chunk[:, 1::2].mean(axis=1)
+    return np.stack((left, right), axis=1)
+
+
+def decode_chunks(reader, sr=None, mono=True, start_frame=0, chunk_frames=8192):
+    """Yield float32 (frames, channels) chunks from `reader` at rate `sr`.
+
+    Without `mono` the channel layout is kept (anything wider than stereo is
+    folded to two channels). `start_frame` is expressed at the output rate.
+    """
+    sr, channels = decoded_format(reader, sr, mono)
+    if start_frame:
+        reader.seek(int(start_frame * reader.sr / sr))
+    resampler = None
+    if sr != reader.sr:
+        resampler = StreamResampler(reader.sr, sr, channels)
+
+    while True:
+        chunk = reader.read(chunk_frames)
+        if not len(chunk):
+            break
+        if mono and chunk.shape[1] > 1:
+            chunk = chunk.mean(axis=1, keepdims=True)
+        elif chunk.shape[1] > 2:
+            chunk = fold_to_stereo(chunk)
+        if resampler is not None:
+            chunk = resampler.process(chunk)
+        yield chunk
+
+
+# ================= RESAMPLER =================
+class StreamResampler:
+    """Stateful resampler for chunked audio.
+
+    An anti-aliasing low-pass (when downsampling) followed by linear
+    interpolation. Filter state and the fractional read position are
+    carried across chunks so chunk boundaries are seamless.
+    """
+
+    def __init__(self, sr_in, sr_out, channels):
+        self.sr_in = sr_in
+        self.sr_out = sr_out
+        self.step = sr_in / sr_out
+        self._last = np.zeros((1, channels), dtype=np.float32)
+        self._sos = None
+        if sr_out < sr_in:
+            self._sos = sig.butter(8, 0.9 * sr_out / sr_in, output='sos')
+            self._zi = np.zeros((self._sos.shape[0], 2, channels))
+        self.reset()
+
+    def reset(self):
+        """Forget the audio seen so far, keeping the filter design"""
+        self._phase = 1.0
+        self._last.fill(0)
+        if self._sos is not None:
+            self._zi.fill(0)
+
+    def process(self, x):
+        if self._sos is not None:
+            x, self._zi = sig.sosfilt(self._sos, x, axis=0, zi=self._zi)
+        n = len(x)
+        if n == 0:
+            return np.zeros((0, x.shape[1]), dtype=np.float32)
+        buf = np.concatenate((self._last, x))
+        count = max(0, int(np.ceil((n - self._phase) / self.step)))
+        pos = self._phase + self.step * np.arange(count)
+        i0 = pos.astype(np.int64)
+        frac = (pos - i0)[:, None]
+        out = buf[i0] * (1.0 - frac) + buf[i0 + 1] * frac
+        self._phase += count * self.step - n
+        self._last = buf[-1:]
+        return out.astype(np.float32)
+
+
+# ================= SOURCES =================
+class ArraySource:
+    """Playback source over a fully decoded sample array"""
+
+    def __init__(self, samples, sr):
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        self.samples = samples
+        self.sr = sr
+        self.channels = samples.shape[1]
+        self.frames = len(samples)
+        self.position = 0
+
+    @property
+    def duration(self):
+        return self.frames / self.sr
+
+    @property
+    def finished(self):
+        return self.position >= self.frames
+
+    def read_into(self, out):
+        n = min(len(out), self.frames - self.position)
+        if n <= 0:
+            return 0
+        out[:n] = self.samples[self.position:self.position + n]
+        self.position += n
+        return n
+
+    def seek(self, frame):
+        self.position = max(0, min(int(frame), self.frames))
+
+    def close(self):
+        pass
+
+
+class ResamplingSource:
+    """Plays another source at the rate the output device is running at.
+
+    Only used when the device can't open the track's own rate.
+    """
+
+    def __init__(self, source, sr, chunk_frames=4096):
+        self.source = source
+        self.sr = sr
+        self.channels = source.channels
+        self.ratio = sr / source.sr
+        self.position = int(source.position * self.ratio)
+        self._resampler = StreamResampler(source.sr, sr, self.channels)
+        self._in = np.empty((chunk_frames, self.channels), dtype=np.float32)
+        self._pending = self._in[:0]
+
+    @property
+    def frames(self):
+        return int(self.source.frames * self.ratio)
+
+    @property
+    def duration(self):
+        return self.source.duration
+
+    @property
+    def finished(self):
+        return self.source.finished and not len(self._pending)
+
+    def wait_ready(self, frames, timeout=5.0):
+        return self.source.wait_ready(int(frames / self.ratio), timeout)
+
+    def read_into(self, out):
+        wanted = len(out)
+        filled = 0
+        while filled < wanted:
+            if len(self._pending):
+                n = min(len(self._pending), wanted - filled)
+                out[filled:filled + n] = self._pending[:n]
+                self._pending = self._pending[n:]
+                filled += n
+                continue
+            n = self.source.read_into(self._in)
+            if n == 0:
+                break
+            self._pending = self._resampler.process(self._in[:n])
+        self.position += filled
+        return filled
+
+    def seek(self, frame):
+        self.source.seek(int(frame / self.ratio))
+        self._resampler.reset()
+        self._pending = self._in[:0]
+        self.position = int(frame)
+
+    def close(self):
+        self.source.close()
+
+
+class StreamingDecoder(threading.Thread):
+    """Background thread that decodes a file chunk by chunk into a RingBuffer.
+
+    The reader stays open for the life of the decoder and seek() restarts
+    decoding on this thread, so the reader's own seek index (libsndfile's
+    frame index for MP3, FLAC seek tables) is kept from one seek to the next
+    and forward-only readers skip on from where they are instead of
+    decoding from the start. After the end of the file the thread waits for
+    further seeks until stop().
+
+    Optional `sinks` (see audio_cache.CacheWriter and MemoryCapture) receive
+    a copy of every chunk; they are committed only when the whole track was
+    decoded without a seek and aborted otherwise.
+    """
+
+    def __init__(self, path, sr=None, mono=True, start_frame=0,
+                 buffer_seconds=4.0, chunk_frames=8192, sinks=()):
+        super().__init__(daemon=True)
+        self.path = path
+        self.mono = mono
+        self.start_frame = start_frame
+        self.chunk_frames = chunk_frames
+        self.sinks = [sink for sink in sinks if sink is not None]
+        self.error = None
+        self._cancel = threading.Event()
+
+        self.reader = open_reader(path)
+        self.sr, self.channels = decoded_format(self.reader, sr, mono)
+        self.frames = int(round(self.reader.frames * self.sr / self.reader.sr))
+        self.ring = RingBuffer(int(buffer_seconds * self.sr), self.channels)
+        # Frame of the latest seek() not yet picked up by the thread
+        self._request = start_frame
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def run(self):
+        sinks = self.sinks
+        for sink in sinks:
+            sink.begin(self.sr, self.channels)
+        try:
+            while True:
+                frame = self._next_request()
+                if frame is None:
+                    break
+                ring = self.ring
+                if frame:
+                    # Only a decode from the start fills the sinks
+                    self._abort(sinks)
+                    sinks = []
+                self.reader.seek(int(frame * self.reader.sr / self.sr))
+                complete = self._decode(ring, sinks)
+                if complete:
+                    ring.finish()
+                for sink in sinks:
+                    if complete:
+                        sink.commit()
+                    else:
+                        sink.abort()
+                sinks = []
+        except Exception as e:
+            self.error = e
+            print(f"Decoder error for {self.path}: {e}")
+        finally:
+            self.reader.close()
+            with self._lock:
+                if self.ring.interrupted:
+                    self.ring.reset()
+            self.ring.finish()
+            self._abort(sinks)
+
+    def _decode(self, ring, sinks):
+        """Decode into `ring` from the reader's position; False if stopped or
+        superseded by a seek before the end of the file"""
+        for chunk in decode_chunks(self.reader, self.sr, self.mono, chunk_frames=self.chunk_frames):
+            for sink in sinks:
+                sink.write(chunk)
+            if self._cancel.is_set() or not ring.write(chunk):
+                return False
+        return True
+
+    def _next_request(self):
+        """Wait for the next seek and empty the ring for it; None once stopped"""
+        while not self._cancel.is_set():
+            self._wake.clear()
+            with self._lock:
+                request, self._request = self._request, None
+                if request is not None:
+                    # Under the lock, so a newer seek cannot slip in between
+                    self.ring.reset()
+            if request is not None:
+                return request
+            self._wake.wait()
+        return None
+
+    def _abort(self, sinks):
+        for sink in sinks:
+            sink.abort()
+
+    def seek(self, frame):
+        """Restart decoding at `frame` (output rate). The ring reads as empty
+        until the thread has emptied it, so no stale frames are read and
+        nothing is allocated on the caller's (the audio callback's) thread."""
+        with self._lock:
+            self.ring.interrupt()
+            self._request = frame
+        self._wake.set()
+
+    def stop(self):
+        self._cancel.set()
+        self.ring.close()
+        self._wake.set()
+
+
+class StreamSource:
+    """Playback source fed by a StreamingDecoder through a bounded RingBuffer.
+
+    Memory use is bounded by `buffer_seconds` regardless of track length.
+    One decoder serves the whole life of the source; seek() only hands it
+    the new position, so it never opens files or starts threads on the
+    audio callback.
+    """
+
+    def __init__(self, path, sr=None, mono=True, buffer_seconds=4.0, sinks=()):
+        self.path = path
+        self.mono = mono
+        self.buffer_seconds = buffer_seconds
+        self.position = 0
+        self._decoder = StreamingDecoder(path, sr=sr, mono=mono,
+                                         buffer_seconds=buffer_seconds, sinks=sinks)
+        self.sr = self._decoder.sr
+        self.channels = self._decoder.channels
+        self.frames = self._decoder.frames
+        self._ring = self._decoder.ring
+        self._decoder.start()
+
+    @property
+    def duration(self):
+        return self.frames / self.sr
+
+    @property
+    def finished(self):
+        return self._ring.drained
+
+    def wait_ready(self, frames, timeout=5.0):
+        """Block until the first `frames` are decoded (or the track ended)"""
+        return self._ring.wait_for(frames, timeout)
+
+    def read_into(self, out):
+        ring = self._ring
+        n = ring.read_into(out)
+        self.position += n
+        if ring.drained:
+            self.frames = self.position
+        return n
+
+    def seek(self, frame):
+        frame = max(0, min(int(frame), self.frames))
+        self._decoder.seek(frame)
+        self.position = frame
+
+    def close(self):
+        self._decoder.stop()
@@ -0,0 +1,204 @@
+import sys
+import time
+import numpy as np
+
+from effects import PRESETS, EQ_PRESETS, Effect8D, Limiter, ParametricEQ, build_chain, graphic_bands
+from convolution import ConvolutionReverb, synthetic_impulse_response
+from hrtf import BinauralPanner
+from audio_stream import ArraySource
+from timestretch import TimeStretchSource
+from mixer import Crossfade
+
+
+# ================= HELPERS =================
+def realtime_factor(node, sr=44100, block_size=1024, seconds=30.0):
+    """Seconds of audio `node` processes per second of CPU time on one core"""
+    rng = np.random.default_rng(0)
+    source = rng.uniform(-0.5, 0.5, size=(block_size, 2))
+    block = np.empty_like(source)
+    blocks = int(seconds * sr / block_size)
+
+    node.prepare(block_size)
+    # Warm up caches and lazily built state
+    for _ in range(10):
+        block[:] = source
+        node.process(block)
+
+    started = time.process_time()
+    for _ in range(blocks):
+        block[:] = source
+        node.process(block)
+    elapsed = time.process_time() - started
+    return blocks * block_size / sr / max(elapsed, 1e-9)
+
+
+def source_realtime_factor(source, sr=44100, block_size=1024, seconds=30.0):
+    """Seconds of audio read from `source` per second of CPU time"""
+    block = np.empty((block_size, source.channels), dtype=np.float32)
+    for _ in range(10):
+        source.read_into(block)
+
+    frames = 0
+    started = time.process_time()
+    while frames < seconds * sr:
+        frames += source.read_into(block)
+    elapsed = time.process_time() - started
+    return frames / sr / max(elapsed, 1e-9)
+
+
+def report(name, factor, required=None):
+    status = ""
+    if required is not None:
+        status = "  ok" if factor >= required else f"  FAIL (needs {required}x)"
+    print(f"{name:<32} {factor:10.1f}x realtime{status}")
+    return required is None or factor >= required
+
+
+# ================= BENCHMARKS =================
+def bench_effect8d():
+    """Effect8D must run at least 50x realtime at 1024-frame blocks"""
+    return report("Effect8D @1024", realtime_factor(Effect8D(44100), block_size=1024), 50)
+
+
+def bench_presets():
+    ok = True
+    for preset in PRESETS:
+        ok &= report(f"preset {preset} @1024", realtime_factor(build_chain(preset, 44100)))
+    return ok
+
+
+def bench_convolution():
+    """Reverb cost versus IR length; the 2 s IR must stay under 5% of one core"""
+    ok = True
+    for seconds in (0.25, 0.5, 1.0, 2.0, 4.0):
+        node = ConvolutionReverb(synthetic_impulse_response(44100, seconds=seconds))
+        node.set_samplerate(44100)
+        ok &= report(f"reverb IR {seconds:g}s @1024", realtime_factor(node, block_size=1024, seconds=10.0),
+                     20 if seconds == 2.0 else None)
+    return ok
+
+
+def bench_binaural():
+    """The HRTF panner must leave room for the visualizer: at least 50x realtime"""
+    ok = True
+    for block_size in (256, 1024):
+        ok &= report(f"BinauralPanner @{block_size}",
+                     realtime_factor(BinauralPanner(), block_size=block_size, seconds=10.0), 50)
+    return ok
+
+
+def bench_eq():
+    """The 10-band EQ must stay under 1% of a core at the player's 1024-frame
+    blocks, and under 2% while its bands are edited on every block (each
+    edit runs the old and new filters side by side for one block)"""
+    ok = True
+    for block_size, required in ((256, 50), (1024, 100)):
+        node = ParametricEQ(graphic_bands(EQ_PRESETS["Hip-Hop"]))
+        ok &= report(f"ParametricEQ @{block_size}", realtime_factor(node, block_size=block_size), required)
+
+    class EditedEveryBlock(ParametricEQ):
+        curves = [EQ_PRESETS["Hip-Hop"], EQ_PRESETS["Classic"]]
+
+        def process(self, block):
+            self.curves.reverse()
+            self.set_gains(self.curves[0])
+            return super().process(block)
+
+    node = EditedEveryBlock(graphic_bands(EQ_PRESETS["Hip-Hop"]))
+    ok &= report("ParametricEQ edited @1024", realtime_factor(node, block_size=1024), 50)
+    return ok
+
+
+def bench_limiter():
+    """The output limiter runs on every block of every preset: at least 100x
+    realtime at 1024 frames while it is limiting (the benchmark signal peaks
+    within 6 dB of the ceiling, so the detector always runs)"""
+    ok = True
+    for block_size in (256, 1024):
+        ok &= report(f"Limiter @{block_size}", realtime_factor(Limiter(), block_size=block_size),
+                     100 if block_size == 1024 else None)
+    ok &= report("Limiter sample peak @1024", realtime_factor(Limiter(true_peak=False), block_size=1024))
+    return ok
+
+
+def bench_timestretch():
+    """Tempo and key changes run in the audio callback: at least 15x realtime
+    for tempo alone and 10x with the key shifted too (which adds a resampler)"""
+    sr = 44100
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.5, 0.5, size=(sr * 40, 2)).astype(np.float32)
+    ok = True
+    for tempo, semitones, required in ((1.0, 0, None), (1.08, 0, 15), (0.92, 0, 15), (1.0, 3, 10), (1.08, -2, 10)):
+        source = TimeStretchSource(ArraySource(samples, sr), tempo, semitones)
+        ok &= report(f"TimeStretch {tempo:g}x {semitones:+d}st @1024",
+                     source_realtime_factor(source, sr, seconds=20.0), required)
+    return ok
+
+
+def bench_crossfade():
+    """Mixing the incoming deck is per-block vector work on top of its chain:
+    at least 400x realtime at 1024 frames"""
+    sr, block_size = 44100, 1024
+    rng = np.random.default_rng(0)
+    outgoing = rng.uniform(-0.5, 0.5, size=(block_size, 2)).astype(np.float32)
+    incoming = rng.uniform(-0.5, 0.5, size=(block_size, 2))
+    out = np.empty_like(outgoing)
+    work = np.empty_like(incoming)
+    blocks = int(30.0 * sr / block_size)
+    mix = Crossfade(blocks * block_size)
+
+    started = time.process_time()
+    for _ in range(blocks):
+        out[:] = outgoing
+        work[:] = incoming
+        fade_out, fade_in = mix.gains(block_size)
+        out *= fade_out[:, None]
+        work *= fade_in[:, None]
+        out += work
+    elapsed = time.process_time() - started
+    return report("Crossfade @1024", blocks * block_size / sr / max(elapsed, 1e-9), 400)
+
+
+def bench_seek():
+    """A seek renders the old block, 4096 frames of pre-roll (AudioThread.
+    PREROLL_FRAMES) and the new block in one callback: for every preset that
+    must take under a third of a 1024-frame block"""
+    sr, block_size = 44100, 1024
+    passes = 2 + 4096 // block_size
+    rng = np.random.default_rng(0)
+    source = rng.uniform(-0.5, 0.5, size=(block_size, 2))
+    block = np.empty_like(source)
+    ok = True
+    for name in PRESETS:
+        chain = build_chain(name, sr)
+        chain.prepare(block_size)
+        for _ in range(10):
+            block[:] = source
+            chain.process(block)
+        seeks = 50
+        started = time.process_time()
+        for _ in range(seeks * passes):
+            block[:] = source
+            chain.process(block)
+        per_seek = (time.process_time() - started) / seeks
+        ok &= report(f"Seek {name} @1024", block_size / sr / max(per_seek, 1e-9), 3)
+    return ok
+
+
+BENCHMARKS = {
+    "effect8d": bench_effect8d,
+    "presets": bench_presets,
+    "convolution": bench_convolution,
+    "binaural": bench_binaural,
+    "eq": bench_eq,
+    "limiter": bench_limiter,
+    "timestretch": bench_timestretch,
+    "crossfade": bench_crossfade,
+    "seek": bench_seek,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    results = [BENCHMARKS[name]() for name in names]
+    sys.exit(0 if all(results) else 1)
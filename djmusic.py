@@ -1,4 +1,4 @@
-import sys, os, math
+import sys, os
 import numpy as np
 import librosa
 import sounddevice as sd
@@ -13,72 +13,55 @@ from PyQt5.QtGui import QPixmap, QIcon
 
 import pyqtgraph as pg
 
+from effects import PRESETS, build_chain
+
+# This player has no beat grid for "DJ" and no equalizer dialog for "Custom"
+DJ_PRESETS = [name for name in PRESETS if name not in ("DJ", "Custom")]
+
 # ================= AUDIO ENGINE =================
 class AudioThread(QThread):
     def __init__(self):
         super().__init__()
         self.running = False
-        self.effect = "Normal"
+        self.effect = "Flat"
         self.mono = None
         self.sr = 44100
         self.idx = 0
-        self.angle = 0.0
+        self.chain = build_chain(self.effect, self.sr)
+        self.block = np.zeros((1024, 2))
 
     def load(self, file):
         y, self.sr = librosa.load(file, mono=True)
         y = y / max(np.max(np.abs(y)), 1e-6)
         self.mono = y.astype(np.float32)
         self.idx = 0
-        self.angle = 0.0
+        self.chain = build_chain(self.effect, self.sr)
 
     def set_effect(self, fx):
         self.effect = fx
+        self.chain = build_chain(fx, self.sr)
 
     def callback(self, outdata, frames, time, status):
         if not self.running or self.mono is None:
-            outdata[:] = np.zeros((frames, 2))
+            outdata.fill(0)
             return
 
-        out = np.zeros((frames, 2), dtype=np.float32)
+        if len(self.block) < frames:
+            self.block = np.zeros((frames, 2))
+        block = self.block[:frames]
 
-        for i in range(frames):
+        # Loop the track
+        filled = 0
+        while filled < frames:
             if self.idx >= len(self.mono):
                 self.idx = 0
+            n = min(frames - filled, len(self.mono) - self.idx)
+            block[filled:filled + n, 0] = self.mono[self.idx:self.idx + n]
+            filled += n
+            self.idx += n
+        block[:, 1] = block[:, 0]
 
-            base = float(self.mono[self.idx])
-            pan = (math.sin(self.angle) + 1) * 0.5
-            depth = 0.8 + 0.2 * math.cos(self.angle)
-
-            if self.effect == "8D":
-                out_l = base * (1 - pan) * depth * 1.35
-                out_r = base * pan * depth * 1.35
-
-            elif self.effect == "3D":
-                out_l = base * (1 - pan) * 1.25
-                out_r = base * pan * 1.25
-
-            elif self.effect == "Dolby":
-                mid = base * 1.1
-                side = math.sin(self.angle) * 0.25
-                bass = base * 0.2
-                out_l = mid + side + bass
-                out_r = mid - side + bass
-
-            elif self.effect == "Rock":
-                out_l = base * 1.35
-                out_r = base * 1.35
-
-            else:
-                out_l = base
-                out_r = base
-
-            out[i, 0] = np.tanh(out_l)
-            out[i, 1] = np.tanh(out_r)
-
-            self.idx += 1
-            self.angle += 0.002
-
-        outdata[:] = out
+        outdata[:] = self.chain.process(block)
 
     def run(self):
         self.running = True
@@ -140,7 +123,7 @@ class MusicPlayer(QMainWindow):
 
         # 🎧 Effects
         self.effects = QComboBox()
-        self.effects.addItems(["Normal", "3D", "8D", "Dolby", "Rock"])
+        self.effects.addItems(DJ_PRESETS)
         self.effects.currentTextChanged.connect(self.audio.set_effect)
         layout.addWidget(self.effects)
 
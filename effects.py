@@ -1,42 +1,829 @@
 import math
+from collections import namedtuple
+from functools import lru_cache
 import numpy as np
+import scipy.signal as sig
+from scipy.ndimage import maximum_filter1d
 
-class Effect8D:
-    def __init__(self, samplerate,
+
+# Pan LFO speed of the player presets in radians per second
+# (0.0006 rad/sample at 22050 Hz)
+PAN_SPEED = 0.0006 * 22050
+
+
+# ================= EFFECT NODES =================
+class EffectNode:
+    """One stage of an effect chain.
+
+    process() takes a (frames, 2) float64 block and returns a block of the
+    same shape: either the input processed in place or a buffer owned by
+    the node, valid until the next call. State such as LFO phase or filter
+    memory persists across calls, and work buffers are allocated once in
+    prepare() rather than per block.
+
+    Nodes that follow the music (uses_beats) are told the track position of
+    each block through seek() and the track's beat frames through
+    set_beats(). When playback jumps, locate() puts position-dependent state
+    such as LFO phase where it would be had the track played up to there.
+    """
+
+    uses_beats = False
+
+    def __init__(self):
+        self.sr = 44100
+        self._frames = 0
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+
+    def prepare(self, frames):
+        """Preallocate work buffers for blocks of up to `frames`"""
+        if frames > self._frames:
+            self._frames = frames
+            self._allocate(frames)
+
+    def _allocate(self, frames):
+        pass
+
+    def reset(self):
+        """Forget state carried between blocks"""
+        pass
+
+    def seek(self, frame):
+        """Track position (in frames at `sr`) of the next block"""
+        pass
+
+    def locate(self, frame):
+        """Playback jumped to track frame `frame` (at `sr`)"""
+        pass
+
+    def set_beats(self, beats):
+        """Sorted beat frames of the current track at `sr`"""
+        pass
+
+    def process(self, block):
+        return block
+
+
+class EffectChain(EffectNode):
+    """Runs nodes in order; a chain is itself a node"""
+
+    def __init__(self, nodes, sr=44100, name=""):
+        super().__init__()
+        self.nodes = list(nodes)
+        self.name = name
+        self.set_samplerate(sr)
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+        for node in self.nodes:
+            node.set_samplerate(sr)
+
+    def prepare(self, frames):
+        for node in self.nodes:
+            node.prepare(frames)
+
+    def reset(self):
+        for node in self.nodes:
+            node.reset()
+
+    def find(self, node_type):
+        """First node that is a `node_type`, or None"""
+        for node in self.nodes:
+            if isinstance(node, node_type):
+                return node
+        return None
+
+    @property
+    def uses_beats(self):
+        return any(node.uses_beats for node in self.nodes)
+
+    def seek(self, frame):
+        for node in self.nodes:
+            node.seek(frame)
+
+    def locate(self, frame):
+        for node in self.nodes:
+            node.locate(frame)
+
+    def set_beats(self, beats):
+        for node in self.nodes:
+            node.set_beats(beats)
+
+    def process(self, block):
+        if not len(block):
+            # An underrun can leave nothing to process
+            return block
+        for node in self.nodes:
+            block = node.process(block)
+        return block
+
+
+class Gain(EffectNode):
+    def __init__(self, gain):
+        super().__init__()
+        self.gain = gain
+
+    def process(self, block):
+        block *= self.gain
+        return block
+
+
+class SoftClip(EffectNode):
+    """tanh saturation; keeps the summed effects within [-1, 1]"""
+
+    def process(self, block):
+        np.tanh(block, out=block)
+        return block
+
+
+class AutoPan(EffectNode):
+    """Rotates the mid signal around the listener (the 3D / 8D effects).
+
+    The pan position follows sin() of an LFO advancing `speed` radians per
+    second. With `depth` the level also dips by up to `depth` as the source
+    passes in front of / behind the listener.
+    """
+
+    def __init__(self, speed=PAN_SPEED, gain=1.0, depth=0.0):
+        super().__init__()
+        self.speed = speed
+        self.gain = gain
+        self.depth = depth
+        self.angle = 0.0
+
+    def _allocate(self, frames):
+        self._ramp = np.arange(frames, dtype=np.float64)
+        self._angles = np.empty(frames)
+        self._pan = np.empty(frames)
+        self._mid = np.empty(frames)
+        self._mod = np.empty(frames)
+
+    def reset(self):
+        self.angle = 0.0
+
+    def locate(self, frame):
+        self.angle = frame * self.speed / self.sr % (2 * math.pi)
+
+    def process(self, block):
+        n = len(block)
+        self.prepare(n)
+        step = self.speed / self.sr
+
+        angles = self._angles[:n]
+        np.multiply(self._ramp[:n], step, out=angles)
+        angles += self.angle
+        pan = self._pan[:n]
+        np.sin(angles, out=pan)
+        pan += 1.0
+        pan *= 0.5
+
+        mid = self._mid[:n]
+        np.add(block[:, 0], block[:, 1], out=mid)
+        mid *= 0.5 * self.gain
+        if self.depth:
+            # Depth follows the angle after the per-sample increment
+            mod = self._mod[:n]
+            np.add(angles, step, out=mod)
+            np.cos(mod, out=mod)
+            np.abs(mod, out=mod)
+            mod *= -self.depth
+            mod += 1.0
+            mid *= mod
+
+        np.multiply(mid, pan, out=block[:, 1])
+        np.subtract(mid, block[:, 1], out=block[:, 0])
+
+        self.angle = (self.angle + n * step) % (2 * math.pi)
+        return block
+
+
+class DolbySurround(EffectNode):
+    """Boosted mid with a slowly rotating side component"""
+
+    def __init__(self, speed=PAN_SPEED, gain=1.3, side=0.3):
+        super().__init__()
+        self.speed = speed
+        self.gain = gain
+        self.side = side
+        self.angle = 0.0
+
+    def _allocate(self, frames):
+        self._ramp = np.arange(frames, dtype=np.float64)
+        self._mid = np.empty(frames)
+        self._side = np.empty(frames)
+
+    def reset(self):
+        self.angle = 0.0
+
+    def locate(self, frame):
+        self.angle = frame * self.speed / self.sr % (2 * math.pi)
+
+    def process(self, block):
+        n = len(block)
+        self.prepare(n)
+        step = self.speed / self.sr
+
+        side = self._side[:n]
+        np.multiply(self._ramp[:n], step, out=side)
+        side += self.angle + step
+        np.sin(side, out=side)
+        side *= self.side
+
+        mid = self._mid[:n]
+        np.add(block[:, 0], block[:, 1], out=mid)
+        mid *= 0.5 * self.gain
+        np.add(mid, side, out=block[:, 0])
+        np.subtract(mid, side, out=block[:, 1])
+
+        self.angle = (self.angle + n * step) % (2 * math.pi)
+        return block
+
+
+# Designed filters kept per builder, by parameters and sample rate. Bounded,
+# as the equalizer dialog designs a new band set for every slider step.
+SOS_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=SOS_CACHE_SIZE)
+def butter_sos(btype, freqs, sr, order=2):
+    """Butterworth SOS, cached per sample rate; cutoffs are kept below Nyquist"""
+    edges = np.minimum(np.atleast_1d(freqs), 0.45 * sr)
+    return sig.butter(order, edges if len(edges) > 1 else edges[0], btype=btype, fs=sr, output="sos")
+
+
+def shelf_sos(kind, freq, gain_db, sr, slope=1.0):
+    """Second-order low/high shelf (RBJ cookbook) as one SOS row"""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * min(freq, 0.45 * sr) / sr
+    cosw = math.cos(w0)
+    alpha = math.sin(w0) / 2 * math.sqrt((a + 1 / a) * (1 / slope - 1) + 2)
+    k = 2 * math.sqrt(a) * alpha
+    sign = 1 if kind == "low" else -1
+    b0 = a * ((a + 1) - sign * (a - 1) * cosw + k)
+    b1 = sign * 2 * a * ((a - 1) - sign * (a + 1) * cosw)
+    b2 = a * ((a + 1) - sign * (a - 1) * cosw - k)
+    a0 = (a + 1) + sign * (a - 1) * cosw + k
+    a1 = -sign * 2 * ((a - 1) + sign * (a + 1) * cosw)
+    a2 = (a + 1) + sign * (a - 1) * cosw - k
+    return np.array([b0, b1, b2, a0, a1, a2]) / a0
+
+
+def peaking_sos(freq, gain_db, q, sr):
+    """Second-order peaking (bell) filter (RBJ cookbook) as one SOS row"""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * min(freq, 0.45 * sr) / sr
+    cosw = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    a0 = 1 + alpha / a
+    return np.array([1 + alpha * a, -2 * cosw, 1 - alpha * a,
+                     a0, -2 * cosw, 1 - alpha / a]) / a0
+
+
+# ================= EQUALIZER =================
+# Centre frequencies of the 10-band graphic EQ (octave spaced)
+EQ_FREQUENCIES = (31.0, 62.0, 125.0, 250.0, 500.0, 1000.0, 2000.0, 4000.0, 8000.0, 16000.0)
+EQ_RANGE_DB = 12.0
+
+# kind is "low" / "high" (shelves) or "peak"; q is the bandwidth of peaks
+# and the slope of shelves
+EQBand = namedtuple("EQBand", "kind freq gain_db q")
+
+# Gains in dB per EQ_FREQUENCIES band. "Custom" is edited from the player's
+# equalizer dialog.
+EQ_PRESETS = {
+    "Flat": (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+    "Rock": (4, 3, 1.5, 0, -1, -0.5, 1, 2.5, 3, 3),
+    "Hip-Hop": (6, 5.5, 4, 1.5, -1, -1, 0, 1, 1.5, 2),
+    "Classic": (2, 1.5, 1, 0, 0, 0, -0.5, 0.5, 2, 3),
+    "Custom": [0.0] * len(EQ_FREQUENCIES),
+}
+
+
+def graphic_bands(gains, q=1.41):
+    """EQBands for one gain per EQ_FREQUENCIES band: shelves at both ends, peaks between"""
+    last = len(EQ_FREQUENCIES) - 1
+    bands = []
+    for i, (freq, gain) in enumerate(zip(EQ_FREQUENCIES, gains)):
+        kind = "low" if i == 0 else "high" if i == last else "peak"
+        bands.append(EQBand(kind, freq, float(gain), 1.0 if kind != "peak" else q))
+    return tuple(bands)
+
+
+@lru_cache(maxsize=SOS_CACHE_SIZE)
+def eq_sos(bands, sr):
+    """Cascade of one SOS row per band, cached per band set (a tuple) and sample rate"""
+    return np.vstack([
+        peaking_sos(b.freq, b.gain_db, b.q, sr) if b.kind == "peak"
+        else shelf_sos(b.kind, b.freq, b.gain_db, sr, slope=b.q)
+        for b in bands
+    ])
+
+
+class ParametricEQ(EffectNode):
+    """Parametric EQ: all bands run as one SOS cascade over the whole block.
+
+    Bands can be changed while playing with set_bands() / set_gains() from
+    another thread: the new coefficients are published as one tuple and the
+    next block runs both the old and the new filter from the same state and
+    crossfades between them, so an edit never clicks. Coefficients come
+    from the eq_sos() cache, so recently used presets and rates cost
+    nothing to switch to.
+    """
+
+    def __init__(self, bands):
+        super().__init__()
+        self.bands = tuple(bands)
+        # (bands, sr, sos) published by set_bands(); the block loop only reads it
+        self._pending = None
+        self._applied = None
+        self.set_samplerate(self.sr)
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+        pending = self._pending
+        if pending is not None:
+            self.bands = pending[0]
+        self._applied = pending
+        self.sos = eq_sos(self.bands, sr)
+        self.reset()
+
+    def set_bands(self, bands):
+        bands = tuple(bands)
+        sr = self.sr
+        self._pending = (bands, sr, eq_sos(bands, sr))
+
+    def set_gains(self, gains):
+        """Set the gains of the graphic EQ bands (see graphic_bands())"""
+        self.set_bands(graphic_bands(gains))
+
+    def reset(self):
+        self.zi = np.zeros((len(self.sos), 2, 2))
+
+    def _allocate(self, frames):
+        self._fade = np.arange(frames, dtype=np.float64)
+
+    def process(self, block):
+        if not len(block):
+            return block
+        pending = self._pending
+        if pending is None or pending is self._applied:
+            block[:], self.zi = sig.sosfilt(self.sos, block, axis=0, zi=self.zi)
+            return block
+
+        bands, sr, sos = pending
+        if sr != self.sr:
+            sos = eq_sos(bands, self.sr)
+        n = len(block)
+        self.prepare(n)
+        old, _ = sig.sosfilt(self.sos, block, axis=0, zi=self.zi)
+        new, self.zi = sig.sosfilt(sos, block, axis=0, zi=self.zi)
+        # block = old + (new - old) * ramp
+        new -= old
+        new *= self._fade[:n, None] * (1.0 / n)
+        np.add(old, new, out=block)
+        self.sos = sos
+        self.bands = bands
+        self._applied = pending
+        return block
+
+
+class Crossover(EffectNode):
+    """Three-band split (low / mid / high) summed back with per-band gains.
+
+    Each band is a Butterworth SOS filter run over the whole block with its
+    own persistent `zi` per channel; coefficients come from the per-rate
+    cache, so switching tracks between rates doesn't redesign them.
+    `gains` may be changed between blocks.
+    """
+
+    def __init__(self, low_hz=150.0, high_hz=4000.0, gains=(1.0, 1.0, 1.0), order=2):
+        super().__init__()
+        self.low_hz = low_hz
+        self.high_hz = high_hz
+        self.gains = list(gains)
+        self.order = order
+        self.set_samplerate(self.sr)
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+        self.bands = [
+            butter_sos("lowpass", self.low_hz, sr, self.order),
+            butter_sos("bandpass", (self.low_hz, self.high_hz), sr, self.order),
+            butter_sos("highpass", self.high_hz, sr, self.order),
+        ]
+        self.reset()
+
+    def reset(self):
+        self.zi = [np.zeros((len(sos), 2, 2)) for sos in self.bands]
+        # Gain-scaled band signals of the last block
+        self.band_outputs = [None] * len(self.bands)
+
+    def _allocate(self, frames):
+        self._sum = np.empty((frames, 2))
+
+    def process(self, block):
+        n = len(block)
+        if not n:
+            return block
+        self.prepare(n)
+        total = self._sum[:n]
+        total.fill(0)
+        for i, sos in enumerate(self.bands):
+            band, self.zi[i] = sig.sosfilt(sos, block, axis=0, zi=self.zi[i])
+            band *= self.gains[i]
+            total += band
+            self.band_outputs[i] = band
+        block[:] = total
+        return block
+
+
+def beat_envelope(beats, positions, attack, decay, out):
+    """Beat-synchronous envelope in [0, 1] at frame `positions`.
+
+    `beats` are sorted beat frames. Each beat rises linearly over `attack`
+    frames and then decays exponentially with time constant `decay`. The
+    last beat at or before every position is found with searchsorted, so a
+    block costs O(n log beats) with no Python loop.
+    """
+    n = len(positions)
+    out = out[:n]
+    if len(beats) == 0:
+        out.fill(0)
+        return out
+    idx = np.searchsorted(beats, positions, side="right") - 1
+    # Positions before the first beat see it as infinitely far away
+    since = positions - beats[np.maximum(idx, 0)]
+    since = np.where(idx >= 0, since, np.inf)
+    np.subtract(since, attack, out=out)
+    np.maximum(out, 0, out=out)
+    out *= -1.0 / decay
+    np.exp(out, out=out)
+    out *= np.minimum(since / max(attack, 1), 1.0)
+    return out
+
+
+class BeatPump(EffectNode):
+    """Adds extra bass on every beat with a smooth attack / decay envelope.
+
+    The bass is split off with a low-pass SOS filter (persistent zi) and
+    added back scaled by `amount` times beat_envelope().
+    """
+
+    uses_beats = True
+
+    def __init__(self, amount=0.8, cutoff_hz=150.0, attack=0.005, decay=0.12):
+        super().__init__()
+        self.amount = amount
+        self.cutoff_hz = cutoff_hz
+        self.attack = attack
+        self.decay = decay
+        self.beats = np.zeros(0, dtype=np.int64)
+        self.position = 0
+        self.set_samplerate(self.sr)
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+        self.sos = butter_sos("lowpass", self.cutoff_hz, sr)
+        self.reset()
+
+    def reset(self):
+        self.zi = np.zeros((len(self.sos), 2, 2))
+
+    def seek(self, frame):
+        self.position = int(frame)
+
+    def set_beats(self, beats):
+        self.beats = beats
+
+    def _allocate(self, frames):
+        self._ramp = np.arange(frames, dtype=np.int64)
+        self._positions = np.empty(frames, dtype=np.int64)
+        self._envelope = np.empty(frames)
+
+    def process(self, block):
+        n = len(block)
+        self.prepare(n)
+        bass, self.zi = sig.sosfilt(self.sos, block, axis=0, zi=self.zi)
+        beats = self.beats
+        if len(beats):
+            positions = self._positions[:n]
+            np.add(self._ramp[:n], self.position, out=positions)
+            envelope = beat_envelope(beats, positions, self.attack * self.sr,
+                                     self.decay * self.sr, self._envelope)
+            envelope *= self.amount
+            bass *= envelope[:, None]
+            block += bass
+        self.position += n
+        return block
+
+
+class DelayLine:
+    """Fixed delay of `delay` frames kept in a preallocated circular buffer"""
+
+    def __init__(self, delay, channels=2):
+        self.delay = max(1, int(delay))
+        shape = (self.delay, channels) if channels else (self.delay,)
+        self.line = np.zeros(shape)
+        self.pos = 0
+
+    def reset(self):
+        self.line.fill(0)
+        self.pos = 0
+
+    def _read(self, out):
+        first = min(len(out), self.delay - self.pos)
+        out[:first] = self.line[self.pos:self.pos + first]
+        out[first:] = self.line[:len(out) - first]
+
+    def _write(self, data):
+        first = min(len(data), self.delay - self.pos)
+        self.line[self.pos:self.pos + first] = data[:first]
+        self.line[:len(data) - first] = data[first:]
+
+    def process(self, x, out):
+        """Write x delayed by `delay` frames into `out` and push x into the line"""
+        n = len(x)
+        d = self.delay
+        if n <= d:
+            self._read(out)
+            self._write(x)
+            self.pos = (self.pos + n) % d
+        else:
+            self._read(out[:d])
+            out[d:] = x[:n - d]
+            self.line[:] = x[n - d:]
+            self.pos = 0
+        return out
+
+
+# ================= OUTPUT STAGE =================
+def soft_clip(block, knee=0.8):
+    """Linear below `knee`, tanh-shaped between `knee` and 1 above it.
+
+    Only the samples over the knee are touched, so quiet passages pass
+    through exactly.
+    """
+    over = np.abs(block) > knee
+    if over.any():
+        x = block[over]
+        span = 1.0 - knee
+        block[over] = np.copysign(knee + span * np.tanh((np.abs(x) - knee) / span), x)
+    return block
+
+
+class Limiter(EffectNode):
+    """Lookahead peak limiter; the output stage of every preset.
+
+    The audio runs `lookahead` seconds late through a ring buffer, so the
+    gain can be brought down before a peak instead of clipping it. Per
+    block, without a Python loop:
+
+    * the needed attenuation in dB of each frame (above `ceiling_db`; true
+      peaks are estimated by 4x oversampling when `true_peak` is set)
+    * held for the lookahead window with a sliding maximum
+    * released at `release_db` dB per second, which is a running maximum
+      of a ramp (np.maximum.accumulate)
+    * smoothed with a moving average over the lookahead window, which
+      still reaches the full attenuation by the time the peak plays
+
+    The last `lookahead` frames of each stage are carried to the next
+    block. While nothing comes near the ceiling the block is only delayed.
+    `soft_clip` adds soft_clip() after the limiter to round off what the
+    limiter lets through. `gain_reduction_db` is the largest reduction of
+    the last block, for metering.
+    """
+
+    # Frames on either side of a frame used to estimate its true peak
+    TRUE_PEAK_SPAN = 6
+
+    def __init__(self, ceiling_db=-1.0, lookahead=0.0015, release_db=60.0,
+                 true_peak=True, soft_clip=False):
+        super().__init__()
+        self.ceiling_db = ceiling_db
+        self.lookahead = lookahead
+        self.release_db = release_db
+        self.true_peak = true_peak
+        self.soft_clip = soft_clip
+        self.gain_reduction_db = 0.0
+        self.set_samplerate(self.sr)
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+        # Even, so the centred sliding maximum lines up with whole frames
+        self._hold = max(2, int(self.lookahead * sr) // 2 * 2)
+        self._span = self.TRUE_PEAK_SPAN if self.true_peak else 0
+        if self.true_peak:
+            # 4x interpolation filter. Its cutoff is the original Nyquist, so
+            # every 4th tap is zero and phase 0 is the samples themselves;
+            # the other three phases become a (3, window) matrix over the
+            # 2 * span + 1 frames around each frame
+            span = self._span
+            h = sig.firwin(8 * span + 1, 1 / 4) * 4
+            taps = 4 * (2 * span - np.arange(2 * span + 1))[:, None] + np.arange(1, 4)
+            self._phases = np.where(taps < len(h), h[np.minimum(taps, len(h) - 1)], 0.0).T
+        self._line = DelayLine(self._hold + self._span)
+        self._frames = 0
+        self.reset()
+
+    def reset(self):
+        self._line.reset()
+        hold = self._hold
+        self._peak_in = np.zeros((2, 2 * self._span))
+        self._atten = np.zeros(hold)
+        self._envelope = 0.0
+        self._held = np.zeros(hold)
+        self._idle = True
+        self.gain_reduction_db = 0.0
+
+    def _allocate(self, frames):
+        self._delayed = np.empty((frames, 2))
+        self._gain = np.empty(frames)
+        self._ramp = np.arange(frames, dtype=np.float64)
+
+    def _attenuation(self, block, ceiling):
+        """dB above the ceiling of the frames the detector has reached"""
+        span = self._span
+        n = len(block)
+        # Channel-major, so every reduction below is elementwise
+        samples = block.T
+        if span:
+            # The estimate needs `span` frames after each frame, so the
+            # detector runs `span` frames behind the input
+            ext = np.concatenate((self._peak_in, samples), axis=1)
+            self._peak_in[:] = ext[:, n:]
+            samples = ext[:, span:span + n]
+            windows = np.lib.stride_tricks.sliding_window_view(ext, 2 * span + 1, axis=1)
+            between = np.abs(self._phases @ windows.transpose(0, 2, 1)).max(axis=1)
+        peaks = np.maximum(np.abs(samples[0]), np.abs(samples[1]))
+        if span:
+            np.maximum(peaks, between[0], out=peaks)
+            np.maximum(peaks, between[1], out=peaks)
+        peaks *= 1 / ceiling
+        with np.errstate(divide="ignore"):
+            atten = np.log10(peaks, out=peaks)
+        atten *= 20
+        np.maximum(atten, 0, out=atten)
+        return atten
+
+    def process(self, block):
+        n = len(block)
+        if not n:
+            return block
+        self.prepare(n)
+        hold = self._hold
+        ceiling = 10 ** (self.ceiling_db / 20)
+        delayed = self._line.process(block, self._delayed[:n])
+
+        # Nothing within 6 dB of the ceiling and no reduction still in
+        # progress: a true peak can't reach it either, so only delay
+        quiet = max(block.max(), -block.min()) < 0.5 * ceiling
+        if quiet and self._idle:
+            if self._span:
+                self._peak_in[:] = np.concatenate((self._peak_in, block.T), axis=1)[:, n:]
+            self.gain_reduction_db = 0.0
+            return self._finish(delayed)
+
+        # Sliding maximum over the lookahead window, including the frames
+        # carried over from the previous block
+        atten = np.concatenate((self._atten, self._attenuation(block, ceiling)))
+        held = maximum_filter1d(atten, hold + 1)[hold // 2:hold // 2 + n]
+        self._atten[:] = atten[-hold:]
+
+        # Release: envelope[t] = max(held[t], envelope[t - 1] - step)
+        step = self.release_db / self.sr
+        ramp = self._ramp[:n] * step
+        held += ramp
+        held[0] = max(held[0], self._envelope - step)
+        envelope = np.maximum.accumulate(held)
+        envelope -= ramp
+        self._envelope = envelope[-1]
+
+        # Moving average over the lookahead window
+        sums = np.cumsum(np.concatenate((self._held, envelope)))
+        smoothed = sums[hold:] - sums[:n]
+        smoothed *= 1.0 / hold
+        self._held[:] = np.concatenate((self._held, envelope))[-hold:]
+
+        self.gain_reduction_db = float(smoothed.max())
+        self._idle = quiet and not self._held.any() and self._envelope <= 0
+        gain = self._gain[:n]
+        np.multiply(smoothed, -1 / 20, out=gain)
+        np.power(10.0, gain, out=gain)
+        delayed *= gain[:, None]
+        return self._finish(delayed)
+
+    def _finish(self, block):
+        if self.soft_clip:
+            soft_clip(block)
+        return block
+
+
+# ================= PRESETS =================
+def room_reverb(wet, impulse_response=None):
+    """ConvolutionReverb node (convolution.py builds on EffectNode, so it is imported here)"""
+    from convolution import ConvolutionReverb
+    return ConvolutionReverb(impulse_response, wet=wet)
+
+
+def binaural_panner(gain=1.0, depth=0.0):
+    """BinauralPanner node from hrtf.py (imported here for the same reason)"""
+    from hrtf import BinauralPanner
+    return BinauralPanner(gain=gain, depth=depth)
+
+
+def equalizer(name):
+    """ParametricEQ with the graphic EQ curve EQ_PRESETS[name]"""
+    return ParametricEQ(graphic_bands(EQ_PRESETS[name]))
+
+
+PRESETS = {
+    "Flat": lambda: [Limiter()],
+    "Rock": lambda: [equalizer("Rock"), Gain(1.15), Limiter()],
+    "3D": lambda: [binaural_panner(gain=1.3), Limiter()],
+    "8D": lambda: [binaural_panner(gain=1.4, depth=0.3), room_reverb(0.15), Limiter()],
+    "Dolby": lambda: [DolbySurround(gain=1.3, side=0.3), Limiter()],
+    "Hip-Hop": lambda: [equalizer("Hip-Hop"), Gain(0.9), Limiter()],
+    "Classic": lambda: [equalizer("Classic"), Gain(0.9), Limiter()],
+    # DJ bass boost: low band below 150 Hz lifted by 60% and pumped on the beat
+    "DJ": lambda: [Crossover(150.0, 4000.0, gains=(1.6, 1.0, 1.0)), BeatPump(0.8), Limiter(soft_clip=True)],
+    # The user's own curve from the equalizer dialog
+    "Custom": lambda: [equalizer("Custom"), Limiter()],
+}
+
+
+def build_chain(preset, sr=44100):
+    """Fresh chain (with its own state) for a preset name; unknown names play Flat"""
+    factory = PRESETS.get(preset, PRESETS["Flat"])
+    return EffectChain(factory(), sr, name=preset)
+
+
+# ================= 8D =================
+class Effect8D(EffectNode):
+    """Stand-alone 8D effect: rotating pan with depth modulation plus a short
+    echo of the dry signal, all computed per block.
+
+    The echo reads from a circular delay line, so it carries across block
+    boundaries and track loops.
+    """
+
+    def __init__(self, samplerate=44100,
                  rotation_speed=0.8,
                  reverb_amount=0.2,
-                 depth_strength=0.3):
-
+                 depth_strength=0.3,
+                 reverb_delay=500):
+        super().__init__()
         self.sr = samplerate
         self.rotation_speed = rotation_speed
         self.reverb_amount = reverb_amount
         self.depth_strength = depth_strength
+        self.angle = 0.0
+        self._line = DelayLine(reverb_delay, channels=None)
 
-        self.angle = 0
-        self.index = 0
-
-    def process(self, mono, frames):
-        left = np.zeros(frames, dtype=np.float32)
-        right = np.zeros(frames, dtype=np.float32)
+    def _allocate(self, frames):
+        self._ramp = np.arange(1, frames + 1, dtype=np.float64)
+        self._angles = np.empty(frames)
+        self._pan = np.empty(frames)
+        self._depth = np.empty(frames)
+        self._mid = np.empty(frames)
+        self._delayed = np.empty(frames)
 
-        for i in range(frames):
-            if self.index >= len(mono):
-                self.index = 0
+    def reset(self):
+        self.angle = 0.0
+        self._line.reset()
 
-            self.angle += self.rotation_speed / self.sr
-            pan = (math.sin(self.angle) + 1) / 2
-            depth = 1 - (math.cos(self.angle) * self.depth_strength)
+    def locate(self, frame):
+        self.angle = frame * self.rotation_speed / self.sr % (2 * math.pi)
 
-            l = mono[self.index] * (1 - pan) * depth
-            r = mono[self.index] * pan * depth
+    def process(self, block):
+        n = len(block)
+        self.prepare(n)
+        step = self.rotation_speed / self.sr
 
-            if self.index > 500:
-                l += mono[self.index - 500] * self.reverb_amount
-                r += mono[self.index - 500] * self.reverb_amount
+        # The angle advances before each sample is panned
+        angles = self._angles[:n]
+        np.multiply(self._ramp[:n], step, out=angles)
+        angles += self.angle
+        pan = self._pan[:n]
+        np.sin(angles, out=pan)
+        pan += 1.0
+        pan *= 0.5
+        depth = self._depth[:n]
+        np.cos(angles, out=depth)
+        depth *= -self.depth_strength
+        depth += 1.0
 
-            left[i] = l
-            right[i] = r
+        mid = self._mid[:n]
+        np.add(block[:, 0], block[:, 1], out=mid)
+        mid *= 0.5
+        delayed = self._line.process(mid, self._delayed[:n])
+        delayed *= self.reverb_amount
 
-            self.index += 1
+        mid *= depth
+        np.multiply(mid, pan, out=block[:, 1])
+        np.subtract(mid, block[:, 1], out=block[:, 0])
+        block[:, 0] += delayed
+        block[:, 1] += delayed
 
-        return np.column_stack((left, right))
+        self.angle = (self.angle + n * step) % (2 * math.pi)
+        return block
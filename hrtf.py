@@ -0,0 +1,232 @@
+import os
+import re
+import math
+import numpy as np
+import soundfile as sf
+import scipy.signal as sig
+
+from effects import EffectNode, PAN_SPEED
+
+
+# Used by BinauralPanner when no set is given and this file exists
+DEFAULT_HRIR_FILE = "hrir.npz"
+
+HEAD_RADIUS = 0.0875
+SPEED_OF_SOUND = 343.0
+
+
+# ================= HRIR SETS =================
+class HRIRSet:
+    """Head-related impulse responses on a ring of azimuths.
+
+    `hrirs` is (azimuths, taps, 2) for the left and right ear; azimuths are
+    in degrees, 0 in front and increasing towards the right.
+    """
+
+    def __init__(self, azimuths, hrirs, sr):
+        order = np.argsort(np.mod(azimuths, 360))
+        self.azimuths = np.mod(np.asarray(azimuths, dtype=np.float64), 360)[order]
+        self.hrirs = np.asarray(hrirs, dtype=np.float64)[order]
+        self.sr = sr
+
+    @property
+    def taps(self):
+        return self.hrirs.shape[1]
+
+    def resampled(self, sr):
+        if sr == self.sr:
+            return self
+        g = math.gcd(int(self.sr), int(sr))
+        hrirs = sig.resample_poly(self.hrirs, sr // g, self.sr // g, axis=1)
+        return HRIRSet(self.azimuths, hrirs, sr)
+
+
+def synthetic_hrir_set(sr, step=10, taps=256):
+    """Spherical-head HRIRs (Brown & Duda): interaural delay, head shadow on
+    the far ear and slightly duller sound from behind. Small and generated
+    on the fly, so it needs no data files."""
+    freqs = np.fft.rfftfreq(taps, 1 / sr)
+    w = 2 * math.pi * freqs
+    w0 = SPEED_OF_SOUND / HEAD_RADIUS
+    azimuths = np.arange(0, 360, step, dtype=np.float64)
+    hrirs = np.empty((len(azimuths), taps, 2))
+    window = np.hanning(2 * taps)[taps:]
+
+    for i, az in enumerate(azimuths):
+        for ch, ear in enumerate((-90.0, 90.0)):
+            # Angle between the source and this ear's axis
+            theta = math.radians(abs((az - ear + 180) % 360 - 180))
+            alpha = 1.05 + 0.95 * math.cos(theta / math.radians(150) * math.pi)
+            shadow = (1 + 1j * alpha * w / (2 * w0)) / (1 + 1j * w / (2 * w0))
+            if theta < math.pi / 2:
+                delay = -HEAD_RADIUS / SPEED_OF_SOUND * math.cos(theta)
+            else:
+                delay = HEAD_RADIUS / SPEED_OF_SOUND * (theta - math.pi / 2)
+            # Offset so the earliest ear still has a causal response
+            delay += HEAD_RADIUS / SPEED_OF_SOUND + 8 / sr
+            spectrum = shadow * np.exp(-1j * w * delay)
+            rear = -math.cos(math.radians(az))
+            if rear > 0:
+                spectrum = spectrum / (1 + 1j * rear * freqs / 4000.0)
+            hrirs[i, :, ch] = np.fft.irfft(spectrum, n=taps) * window
+    return HRIRSet(azimuths, hrirs, sr)
+
+
+def load_hrir_set(path):
+    """Read an HRIR set from a .npz (azimuths, hrirs, sr) or from a folder of
+    stereo WAVs named like azi_30.wav"""
+    if os.path.isdir(path):
+        azimuths, hrirs, sr = [], [], None
+        for name in sorted(os.listdir(path)):
+            match = re.match(r"azi_(-?\d+(?:\.\d+)?)\.wav$", name)
+            if not match:
+                continue
+            data, sr = sf.read(os.path.join(path, name), dtype="float64", always_2d=True)
+            azimuths.append(float(match.group(1)))
+            hrirs.append(data[:, :2] if data.shape[1] > 1 else np.repeat(data, 2, axis=1))
+        if not hrirs:
+            raise ValueError(f"no azi_<degrees>.wav files in {path}")
+        taps = max(len(h) for h in hrirs)
+        padded = np.zeros((len(hrirs), taps, 2))
+        for i, h in enumerate(hrirs):
+            padded[i, :len(h)] = h
+        return HRIRSet(azimuths, padded, sr)
+
+    data = np.load(path)
+    return HRIRSet(data["azimuths"], data["hrirs"], int(data["sr"]))
+
+
+def save_hrir_set(hrir_set, path):
+    np.savez(path, azimuths=hrir_set.azimuths, hrirs=hrir_set.hrirs, sr=hrir_set.sr)
+
+
+# ================= BINAURAL PANNER =================
+class BinauralPanner(EffectNode):
+    """Rotates the mid signal around the listener through HRIR filtering.
+
+    Each block is filtered in the frequency domain with the HRIR pair for
+    the LFO's azimuth, linearly interpolated between the two nearest
+    measured azimuths. When the azimuth moves, the output crossfades from
+    the previous block's filter to the new one across the block. With
+    `depth` the level dips as the source passes in front of / behind the
+    listener, like AutoPan.
+
+    `hrir_set` is an HRIRSet, a path for load_hrir_set(), or None for
+    DEFAULT_HRIR_FILE when present and the synthetic set otherwise.
+    """
+
+    def __init__(self, speed=PAN_SPEED, gain=1.0, depth=0.0, hrir_set=None):
+        super().__init__()
+        self.speed = speed
+        self.gain = gain
+        self.depth = depth
+        self.hrir_set = hrir_set
+        self.angle = 0.0
+        self._set = None
+        self._fft_frames = 0
+
+    def set_samplerate(self, sr):
+        self.sr = sr
+        source = self.hrir_set
+        if source is None and os.path.exists(DEFAULT_HRIR_FILE):
+            source = DEFAULT_HRIR_FILE
+        if source is None:
+            hrirs = synthetic_hrir_set(sr)
+        elif isinstance(source, str):
+            hrirs = load_hrir_set(source)
+        else:
+            hrirs = source
+        self._set = hrirs.resampled(sr)
+        self._fft_frames = 0
+        if self._frames:
+            self._allocate(self._frames)
+
+    def _allocate(self, frames):
+        if self._set is None:
+            self.set_samplerate(self.sr)
+        taps = self._set.taps
+        size = 1 << (frames + taps - 2).bit_length()
+        if size != self._fft_frames:
+            self._fft_frames = size
+            self._spectra = np.fft.rfft(self._set.hrirs, n=size, axis=1)
+            self._filter = np.empty((size // 2 + 1, 2), dtype=np.complex128)
+            self._prev_filter = None
+            self._tail = np.zeros((taps - 1, 2))
+            self._input = np.zeros(size)
+        self._mid = np.empty(frames)
+        self._mod = np.empty(frames)
+        self._fade = np.empty(frames)
+        self._ramp = np.arange(frames, dtype=np.float64)
+
+    def reset(self):
+        self.angle = 0.0
+        self._prev_filter = None
+        if self._fft_frames:
+            self._tail.fill(0)
+
+    def locate(self, frame):
+        self.angle = frame * self.speed / self.sr % (2 * math.pi)
+
+    def _interpolate(self, azimuth, out):
+        """HRIR pair spectrum for `azimuth` degrees into `out`"""
+        azimuths = self._set.azimuths
+        count = len(azimuths)
+        i = int(np.searchsorted(azimuths, azimuth, side="right")) - 1
+        j = (i + 1) % count
+        span = (azimuths[j] - azimuths[i]) % 360 or 360
+        w = ((azimuth - azimuths[i]) % 360) / span
+        np.multiply(self._spectra[i], 1 - w, out=out)
+        out += self._spectra[j] * w
+        return out
+
+    def process(self, block):
+        n = len(block)
+        self.prepare(n)
+        step = self.speed / self.sr
+        size = self._fft_frames
+        taps = self._set.taps
+
+        mid = self._mid[:n]
+        np.add(block[:, 0], block[:, 1], out=mid)
+        mid *= 0.5 * self.gain
+        if self.depth:
+            mod = self._mod[:n]
+            np.multiply(self._ramp[:n], step, out=mod)
+            mod += self.angle + step
+            np.cos(mod, out=mod)
+            np.abs(mod, out=mod)
+            mod *= -self.depth
+            mod += 1.0
+            mid *= mod
+
+        # Azimuth at the end of the block; 90 degrees is hard right, as with AutoPan
+        end_angle = self.angle + n * step
+        azimuth = math.degrees(end_angle) % 360
+        current = self._interpolate(azimuth, self._filter)
+
+        self._input[:n] = mid
+        self._input[n:] = 0
+        spectrum = np.fft.rfft(self._input)
+        wet = np.fft.irfft(spectrum[:, None] * current, n=size, axis=0)
+
+        prev = self._prev_filter
+        if prev is not None and not np.array_equal(prev, current):
+            old = np.fft.irfft(spectrum[:, None] * prev, n=size, axis=0)
+            fade = self._fade[:n]
+            np.multiply(self._ramp[:n], 1.0 / n, out=fade)
+            # wet[:n] = old + (wet - old) * fade for the part heard in this block
+            wet[:n] -= old[:n]
+            wet[:n] *= fade[:, None]
+            wet[:n] += old[:n]
+        if prev is None:
+            self._prev_filter = current.copy()
+        else:
+            prev[:] = current
+
+        # Overlap-add the filter tail carried over from earlier blocks
+        wet[:taps - 1] += self._tail
+        block[:] = wet[:n]
+        self._tail[:] = wet[n:n + taps - 1]
+
+        self.angle = end_angle % (2 * math.pi)
+        return block
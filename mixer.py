@@ -0,0 +1,94 @@
+import math
+import numpy as np
+
+
+# Automatic transition lengths offered by the player: (seconds, beats).
+# Beats need the outgoing track's tempo; without it the seconds are used.
+CROSSFADE_MODES = {
+    "Gapless": (0.0, 0),
+    "4 s": (4.0, 0),
+    "8 s": (8.0, 0),
+    "12 s": (12.0, 0),
+    "8 beats": (4.0, 8),
+    "16 beats": (8.0, 16),
+    "32 beats": (16.0, 32),
+}
+
+
+# ================= TRANSITIONS =================
+def plan_transition(track_frames, sr, seconds=0.0, beats=0, bpm=None, beat_positions=None):
+    """(start frame, length in frames) of the crossfade out of a track, or
+    None for a plain gapless change.
+
+    The length is `beats` beats at `bpm` when the tempo is known, otherwise
+    `seconds`, and at most half the track. With the track's beat positions
+    (frames) the start moves back to the last beat before it, so the
+    incoming track enters on a beat of the outgoing one.
+    """
+    if beats and bpm:
+        length = beats * 60.0 / bpm * sr
+    else:
+        length = seconds * sr
+    length = int(min(length, track_frames // 2))
+    if length <= 0:
+        return None
+    start = track_frames - length
+    if beat_positions is not None and len(beat_positions):
+        earlier = beat_positions[(beat_positions <= start) & (beat_positions > start - length)]
+        if len(earlier):
+            start = int(earlier[-1])
+    return start, length
+
+
+class Crossfade:
+    """Equal-power crossfade from the playing deck to the incoming one.
+
+    Runs `length` output frames, starting `offset` frames into the block it
+    begins in. gains() hands out the per-frame gains for each block: the
+    cosine and sine of the same angle, so the summed power of two
+    uncorrelated tracks stays constant through the fade.
+    """
+
+    def __init__(self, length, offset=0):
+        self.length = max(1, int(length))
+        self.offset = offset
+        self.done = 0
+        self._size = 0
+
+    @property
+    def finished(self):
+        return self.done >= self.length
+
+    def gains(self, n):
+        """(outgoing, incoming) gain arrays for the next `n` frames"""
+        if self._size < n:
+            self._size = n
+            self._ramp = np.arange(n, dtype=np.float64)
+            self._angle = np.empty(n)
+            self._out = np.empty(n)
+            self._in = np.empty(n)
+        fade_out, fade_in = self._out[:n], self._in[:n]
+        step = 0.5 * math.pi / self.length
+        if self.offset == 0 and self.done + n <= self.length:
+            # Inside the fade: the angle moves so little per block that
+            # straight lines between the exact gains at its ends stay within
+            # 2e-4 of the curves even for a one-second fade, at a fraction of
+            # the cost of cos / sin
+            a0 = self.done * step
+            a1 = (self.done + n) * step
+            self._line(fade_out, math.cos(a0), math.cos(a1), n)
+            self._line(fade_in, math.sin(a0), math.sin(a1), n)
+        else:
+            angle = self._angle[:n]
+            np.subtract(self._ramp[:n], self.offset - self.done, out=angle)
+            angle *= step
+            np.clip(angle, 0.0, 0.5 * math.pi, out=angle)
+            np.cos(angle, out=fade_out)
+            np.sin(angle, out=fade_in)
+        self.done += n - self.offset
+        self.offset = 0
+        return fade_out, fade_in
+
+    def _line(self, out, start, stop, n):
+        np.multiply(self._ramp[:n], (stop - start) / n, out=out)
+        out += start
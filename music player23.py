@@ -1,9 +1,13 @@
 import random
 import sys, os, math
+import threading
+from time import perf_counter, process_time
 import numpy as np
 import sounddevice as sd
 import librosa
 import sqlite3
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from mutagen import File
 from mutagen.id3 import ID3
@@ -19,10 +23,20 @@ from PyQt5.QtWidgets import (
     QPushButton, QFileDialog, QLabel, QComboBox,
     QTableWidget, QTableWidgetItem, QSlider, QStyle,
     QFrame, QGroupBox, QGridLayout, QMessageBox, QMenuBar, QLineEdit,
-    QMenu
+    QMenu, QDialog, QSpinBox
 )
 from PyQt5.QtGui import QIcon, QPainter, QColor, QFont, QLinearGradient, QBrush, QPen, QPolygonF, QPainterPath, QRadialGradient
-from PyQt5.QtCore import QThread, Qt, QTimer, pyqtSignal, QPointF, QSize, QRect
+from PyQt5.QtCore import QThread, QObject, Qt, QTimer, pyqtSignal, QPointF, QLineF, QSize, QRect
+
+from audio_stream import (StreamSource, ArraySource, ResamplingSource, open_reader,
+                          decode_chunks, decoded_format)
+from audio_cache import PCMDiskCache, MemoryTrackCache, track_key
+from effects import PRESETS, EQ_PRESETS, EQ_FREQUENCIES, EQ_RANGE_DB, ParametricEQ, Limiter, build_chain
+from analysis import (BeatCache, track_beats, beat_frames, measure_loudness, loudness_gain,
+                      analyze_track, lower_priority)
+from timestretch import TimeStretchSource, TEMPO_RANGE
+from mixer import CROSSFADE_MODES, Crossfade, plan_transition
+from waveform import WaveformCache, WaveformBuilder, build_waveform
 
 
 # ================= THUMBNAIL EXTRACTION =================
@@ -357,6 +371,28 @@ class MusicDatabase:
             )
         ''')
         
+        # Loudness analysis columns (added to existing libraries on start)
+        cursor.execute('PRAGMA table_info(tracks)')
+        columns = {row[1] for row in cursor.fetchall()}
+        for column, kind in (('loudness_lufs', 'REAL'), ('true_peak_db', 'REAL')):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE tracks ADD COLUMN {column} {kind}')
+        
+        # Tempo, beat grid, key and onset strength from the library analyzer;
+        # a row is only valid for the file version it was measured on
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS track_analysis (
+                file_path TEXT PRIMARY KEY,
+                last_modified TIMESTAMP,
+                bpm REAL,
+                beats BLOB,
+                musical_key TEXT,
+                key_strength REAL,
+                onset_envelope BLOB,
+                analyzed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
         # Create indexes for faster queries
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracks_file_path ON tracks(file_path)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_tracks_artist ON tracks(artist)')
@@ -471,10 +507,14 @@ class MusicDatabase:
             cursor.execute('''
                 INSERT OR REPLACE INTO tracks 
                 (folder_id, file_path, file_name, file_size, duration, title, artist, album, 
-                 genre, year, track_number, bitrate, sample_rate, channels, last_modified, created_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT created_date FROM tracks WHERE file_path = ?), CURRENT_TIMESTAMP))
+                 genre, year, track_number, bitrate, sample_rate, channels, last_modified, created_date,
+                 loudness_lufs, true_peak_db)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE((SELECT created_date FROM tracks WHERE file_path = ?), CURRENT_TIMESTAMP),
+                        (SELECT loudness_lufs FROM tracks WHERE file_path = ? AND last_modified = ?),
+                        (SELECT true_peak_db FROM tracks WHERE file_path = ? AND last_modified = ?))
             ''', (folder_id, file_path, file_name, file_size, duration, title, artist, album, 
-                  genre, year, track_number, bitrate, sample_rate, channels, last_modified, file_path))
+                  genre, year, track_number, bitrate, sample_rate, channels, last_modified, file_path,
+                  file_path, last_modified, file_path, last_modified))
             
             conn.commit()
             return cursor.lastrowid
@@ -502,6 +542,111 @@ class MusicDatabase:
         
         return tracks
     
+    def get_folder_loudness(self, folder_path):
+        """{file_path: (loudness_lufs, true_peak_db)} of the analysed tracks in a folder"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT t.file_path, t.loudness_lufs, t.true_peak_db
+            FROM tracks t
+            JOIN folders f ON t.folder_id = f.id
+            WHERE f.path = ? AND t.loudness_lufs IS NOT NULL
+        ''', (folder_path,))
+        
+        loudness = {path: (lufs, peak) for path, lufs, peak in cursor.fetchall()}
+        conn.close()
+        
+        return loudness
+    
+    def get_tracks_without_loudness(self, folder_path):
+        """Paths of the tracks in a folder that have not been analysed yet"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT t.file_path
+            FROM tracks t
+            JOIN folders f ON t.folder_id = f.id
+            WHERE f.path = ? AND t.loudness_lufs IS NULL
+        ''', (folder_path,))
+        
+        paths = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return paths
+    
+    def set_track_loudness(self, file_path, lufs, peak_db):
+        """Store the loudness analysis of a track"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE tracks 
+                SET loudness_lufs = ?, true_peak_db = ?
+                WHERE file_path = ?
+            ''', (lufs, peak_db, file_path))
+            conn.commit()
+        except Exception as e:
+            print(f"Error storing loudness: {e}")
+        finally:
+            conn.close()
+    
+    def get_folder_analysis(self, folder_path):
+        """{file_path: (bpm, musical_key)} of the analysed tracks in a folder"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT t.file_path, a.bpm, a.musical_key
+            FROM tracks t
+            JOIN folders f ON t.folder_id = f.id
+            JOIN track_analysis a ON a.file_path = t.file_path AND a.last_modified = t.last_modified
+            WHERE f.path = ?
+        ''', (folder_path,))
+        
+        analysis = {path: (bpm, key) for path, bpm, key in cursor.fetchall()}
+        conn.close()
+        
+        return analysis
+    
+    def get_tracks_without_analysis(self, folder_path):
+        """Paths of the tracks in a folder with no analysis of their current version"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT t.file_path
+            FROM tracks t
+            JOIN folders f ON t.folder_id = f.id
+            LEFT JOIN track_analysis a ON a.file_path = t.file_path AND a.last_modified = t.last_modified
+            WHERE f.path = ? AND a.file_path IS NULL
+        ''', (folder_path,))
+        
+        paths = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        
+        return paths
+    
+    def set_track_analysis(self, file_path, analysis):
+        """Store an analysis.TrackAnalysis of a track"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                INSERT OR REPLACE INTO track_analysis
+                (file_path, last_modified, bpm, beats, musical_key, key_strength, onset_envelope, analyzed_date)
+                VALUES (?, (SELECT last_modified FROM tracks WHERE file_path = ?), ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (file_path, file_path, analysis.bpm, analysis.beats, analysis.key,
+                  analysis.key_strength, analysis.onset))
+            conn.commit()
+        except Exception as e:
+            print(f"Error storing analysis: {e}")
+        finally:
+            conn.close()
+    
     def track_exists(self, file_path):
         """Check if track exists in database"""
         conn = sqlite3.connect(self.db_path)
@@ -621,6 +766,7 @@ class MusicDatabase:
             for track_id, file_path in tracks:
                 if not os.path.exists(file_path):
                     cursor.execute('DELETE FROM tracks WHERE id = ?', (track_id,))
+                    cursor.execute('DELETE FROM track_analysis WHERE file_path = ?', (file_path,))
                     deleted_count += 1
             
             conn.commit()
@@ -690,141 +836,1117 @@ class MusicDatabase:
         
         return result[0] if result else None
 
+    def save_config(self, key, value):
+        """Store a player setting as text"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            INSERT OR REPLACE INTO player_config (key, value)
+            VALUES (?, ?)
+        ''', (key, value))
+
+        conn.commit()
+        conn.close()
+
+    def get_config(self, key, default=None):
+        """Get a player setting stored with save_config()"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT value FROM player_config WHERE key = ?
+        ''', (key,))
+
+        result = cursor.fetchone()
+        conn.close()
+
+        return result[0] if result else default
+
+# ================= LOUDNESS SCANNER =================
+class LoudnessScanner(QObject):
+    """Measures integrated loudness and true peak of tracks in worker processes.
+
+    Decoding and filtering a whole track is CPU bound, so it runs in a
+    process pool rather than competing with the GUI and audio threads for
+    the GIL. Results arrive on the GUI thread through `measured`.
+    """
+    # (path, integrated LUFS, true peak dBTP)
+    measured = pyqtSignal(str, float, float)
+
+    def __init__(self, workers=None):
+        super().__init__()
+        workers = workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=lower_priority)
+        self._pending = set()
+
+    def scan(self, paths):
+        for path in paths:
+            if path in self._pending or not os.path.exists(path):
+                continue
+            self._pending.add(path)
+            future = self._pool.submit(measure_loudness, path)
+            future.add_done_callback(lambda f, path=path: self._done(path, f))
+
+    def _done(self, path, future):
+        self._pending.discard(path)
+        if future.cancelled():
+            return
+        try:
+            lufs, peak_db = future.result()
+        except Exception as e:
+            print(f"Loudness analysis failed for {os.path.basename(path)}: {e}")
+            return
+        self.measured.emit(path, lufs, peak_db)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class LibraryAnalyzer(QObject):
+    """Tempo, beat grid, key and onset analysis of library tracks in a
+    low-priority process pool. Beats also land in the BeatCache, so
+    beat-following effects and transitions never decode at play time.
+    """
+    # (path, analysis.TrackAnalysis)
+    analyzed = pyqtSignal(str, object)
+
+    def __init__(self, beat_cache_directory="analysis_cache", workers=None):
+        super().__init__()
+        # librosa's beat and chroma analysis is heavy; leave cores for playback
+        workers = workers or max(1, min(2, (os.cpu_count() or 2) // 4))
+        self.beat_cache_directory = beat_cache_directory
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=lower_priority)
+        self._pending = set()
+
+    def scan(self, paths):
+        for path in paths:
+            if path in self._pending or not os.path.exists(path):
+                continue
+            self._pending.add(path)
+            future = self._pool.submit(analyze_track, path, self.beat_cache_directory)
+            future.add_done_callback(lambda f, path=path: self._done(path, f))
+
+    def _done(self, path, future):
+        self._pending.discard(path)
+        if future.cancelled():
+            return
+        try:
+            analysis = future.result()
+        except Exception as e:
+            print(f"Track analysis failed for {os.path.basename(path)}: {e}")
+            return
+        self.analyzed.emit(path, analysis)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 # ================= AUDIO THREAD =================
+# Immutable parameter snapshot; the GUI publishes a new one and the callback
+# picks it up at the start of its next block
+PlaybackParams = namedtuple("PlaybackParams", "effect volume chain")
+
 class AudioThread(QThread):
     position_changed = pyqtSignal(float)
     loading_complete = pyqtSignal(str)
     loading_started = pyqtSignal(str)
-    
+    track_loaded = pyqtSignal(str)
+    load_failed = pyqtSignal(str)
+    # The preloaded next track took over at the end of the current one
+    track_changed = pyqtSignal(str)
+    # The current track played to its end with nothing queued after it
+    track_finished = pyqtSignal()
+    # Internal: a worker finished preparing a source (source, generation, path)
+    source_ready = pyqtSignal(object, int, str)
+    preload_ready = pyqtSignal(object, int, str)
+    # Internal: beat times (seconds) of a track are known
+    beats_ready = pyqtSignal(object, str)
+    # Waveform overview (WaveformPyramid) of a track is ready
+    waveform_ready = pyqtSignal(object, str)
+
+    # Frames that must be decoded before playback of a streamed track starts
+    PREFILL_FRAMES = 8192
+    # Decode rate of the old mono path (native_playback = False)
+    LEGACY_SR = 22050
+    # Frames run through the effect chain ahead of a seek target (~90 ms)
+    PREROLL_FRAMES = 4096
+
     def __init__(self):
         super().__init__()
         self.running = False
-        self.effect = "Flat"
-        self.volume = 0.8
-
-        self.mono = None
+        # Rate of the track the GUI last asked for; the callback renders at
+        # `_render_sr`, which follows it when the "play" command is applied
         self.sr = 44100
-        self.current_position = 0.0
-        self.angle = 0.0
+        self._render_sr = self.sr
+        self.params = PlaybackParams(effect="Flat", volume=0.8, chain=build_chain("Flat", self.sr))
+        # Snapshot the previous block was rendered with (ramp start point)
+        self._block_params = self.params
+        # Chain the playing deck is rendered with; follows params.chain, but
+        # the callback hands it over to the incoming deck's chain after a crossfade
+        self._chain = self.params.chain
+        # GUI -> callback commands, drained once per block (by run() while the
+        # stream is stopped). Only the callback swaps and closes the decks.
+        self._commands = deque()
+        self._seek_request = None
+
+        # Decode tracks incrementally instead of loading the whole file
+        self.streaming = True
+        # Play tracks at their own rate and channel layout instead of 22050 Hz mono
+        self.native_playback = True
+        # Decoded tracks are kept on disk and memory-mapped on replay
+        self.pcm_cache = PCMDiskCache("pcm_cache", max_bytes=2 * 1024 ** 3)
+        # Recently decoded tracks are also kept in memory for instant prev/next
+        self.memory_cache = MemoryTrackCache(max_bytes=768 * 1024 ** 2)
+        # Two decks: `source` plays, `next_source` is decoded ahead of time and
+        # either switched to gaplessly when `source` runs out or crossfaded in
+        # through its own effect chain (`next_chain`). The decks belong to the
+        # callback; the GUI asks for changes with commands and keeps its own
+        # view of the playing source and the queued (source, file)
+        self.source = None
+        self.next_source = None
+        self.next_file = None
+        self.next_chain = None
+        self._source_file = None
+        self._playing = None
+        self._queued = None
+        # Automatic crossfade length (see mixer.CROSSFADE_MODES); beats are
+        # used when the playing track's tempo is known
+        self.crossfade_seconds = 0.0
+        self.crossfade_beats = 0
+        # (start frame in the playing track, length in frames) of the planned
+        # crossfade, and the one the callback is running
+        self.transition = None
+        self._mix = None
+        # Loudness normalisation: {path: (LUFS, true peak dBTP)} filled in
+        # by the GUI, and the gains of the playing / preloaded tracks
+        self.normalize_loudness = True
+        self.loudness = {}
+        self.source_gain = 1.0
+        self.next_gain = 1.0
+        self._block_gain = 1.0
+        # {path: BPM} from the library analyzer, filled in by the GUI
+        self.track_tempo = {}
+        # Playback speed and key shift, applied to every source (pitch fader)
+        self.tempo = 1.0
+        self.semitones = 0
+        # Rate the output stream should run at, and the rate it is actually open at
+        self.stream_sr = None
+        self._open_sr = None
+        # Wakes run() when the stream has to be (re)opened or the thread should exit
+        self._wake = threading.Event()
+        # Seconds of silence after which the stream is stopped until play()
+        self.idle_timeout = 5.0
+        self.suspended = False
+        self._idle_frames = 0
+        self._suspend_requested = False
+        self.callback_calls = 0
+        self.callback_seconds = 0.0
+        # Frames played in the current source; written by the callback, read by the GUI
+        self.position_frames = 0
+        # Frame the GUI last asked for (play or seek), shown until the callback applies it
+        self._position_request = None
+        self._reported_position = None
+        # Seek in progress: pre-roll frames still to run, and the block to
+        # crossfade from (rendered at the old position, or silence)
+        self._preroll = 0
+        self._seek_from = None
+        # Callback -> GUI events, delivered by poll_events() on the GUI timer
+        self._events = deque()
         self.duration = 0.0
-        self.force_seek = None
+        self._should_exit = False
 
         self.visual_samples = np.zeros(256, dtype=np.float32)
 
+        self._block_size = 0
+        self._ensure_block_buffers(1024)
+
+        # Track loading runs on a single worker; newer requests supersede older ones
+        self._load_pool = ThreadPoolExecutor(max_workers=1)
+        self._load_generation = 0
+        self._pending_load = None
+        self._preload_generation = 0
+        self._pending_preload = None
+        # Background filling of the PCM cache (lowest priority work)
+        self._warm_pool = ThreadPoolExecutor(max_workers=1)
+        # Beat tracking for effects that follow the music, cached on disk
+        self.beat_cache = BeatCache("analysis_cache")
+        self.current_file = None
+        self.beat_times = None
+        self._beats_pending = None
+        self._analysis_pool = ThreadPoolExecutor(max_workers=1)
+        # Seek bar overviews, cached on disk
+        self.waveform_cache = WaveformCache("waveform_cache")
+        self.source_ready.connect(self._on_source_ready)
+        self.preload_ready.connect(self._on_preload_ready)
+        self.beats_ready.connect(self._on_beats_ready)
+
+    @property
+    def current_position(self):
+        """Playback position in seconds"""
+        requested = self._position_request
+        if requested is not None:
+            return requested / self.sr
+        return self.position_frames / self.sr
+
+    def poll_events(self):
+        """Runs on the GUI timer: report the position and deliver callback events.
+
+        The callback never touches Qt; it only updates `position_frames` and
+        queues the rare track events here.
+        """
+        position = self.current_position
+        if position != self._reported_position:
+            self._reported_position = position
+            self.position_changed.emit(position)
+        while self._events:
+            event, file = self._events.popleft()
+            if event == "positioned":
+                # `file` is the frame the callback moved to
+                if file == self._position_request:
+                    self._position_request = None
+            elif event == "advanced":
+                self._playing = self.source
+                if self._queued is not None and self._queued[0] is self.source:
+                    self._queued = None
+                self._track_started(file)
+                self.track_changed.emit(file)
+            elif event == "finished":
+                self.track_finished.emit()
+
+    def _decode_settings(self):
+        """(sr, mono, cache mode) used to decode tracks; sr None keeps the file's rate"""
+        if self.native_playback:
+            return None, False, "native"
+        return self.LEGACY_SR, True, f"{self.LEGACY_SR}x1"
+
+    def _open_source(self, file, is_current=lambda: True):
+        """Open a playback source for `file`; returns None if superseded while opening"""
+        sr, mono, mode = self._decode_settings()
+        cached = None
+        if self.streaming:
+            key = track_key(file, mode)
+            cached = self.memory_cache.get(key)
+            if cached is None:
+                cached = self.pcm_cache.open(file, mode)
+
+        if cached is not None:
+            source = ArraySource(*cached)
+        elif self.streaming:
+            sinks = [self.pcm_cache.writer(file, mode), self.memory_cache.capture(key)]
+            try:
+                source = StreamSource(file, sr=sr, mono=mono, sinks=sinks)
+            except Exception:
+                for sink in sinks:
+                    if sink is not None:
+                        sink.abort()
+                raise
+            while not source.wait_ready(self.PREFILL_FRAMES, timeout=0.05):
+                if not is_current():
+                    source.close()
+                    return None
+        else:
+            y, sr = librosa.load(file, mono=mono, sr=sr)
+            if y.ndim > 1:
+                y = y[:2].T
+            source = ArraySource(np.ascontiguousarray(y, dtype=np.float32), sr)
+
+        if not is_current():
+            source.close()
+            return None
+        return source
+
+    def _playable(self, source):
+        """Resample `source` if the output stream runs at a different rate, and
+        wrap it for tempo and key changes (a pass-through while both are neutral).
+        A preloaded source is already playable and is returned as it is."""
+        if isinstance(source, TimeStretchSource):
+            return source
+        if self.stream_sr is not None and source.sr != self.stream_sr:
+            source = ResamplingSource(source, self.stream_sr)
+        return TimeStretchSource(source, self.tempo, self.semitones)
+
+    def _output_rate(self, sr):
+        """`sr` if the output device accepts it, otherwise the device's default rate"""
+        try:
+            sd.check_output_settings(samplerate=sr, channels=2, dtype="float32")
+            return sr
+        except Exception:
+            return int(sd.query_devices(kind="output")["default_samplerate"])
+
+    def _request_output_rate(self, sr):
+        """Choose the stream rate for a track at `sr`; run() reopens the stream if it changed"""
+        rate = self._output_rate(sr)
+        if rate != self.stream_sr:
+            self.stream_sr = rate
+            self._wake.set()
+
+    def _set_source(self, source, file=None, gain=1.0):
+        """Swap the playing source; the callback picks it up on its next block"""
+        self._request_output_rate(source.sr)
+        source = self._playable(source)
+        if source.sr != self.sr:
+            # The chains for the new rate are built here, never in the callback
+            self.sr = source.sr
+            self.set_effect(self.params.effect)
+        self._position_request = 0
+        self.duration = source.duration
+        self._playing = source
+        self._post("play", (source, file, gain, source.sr))
+        self.position_changed.emit(0.0)
+
     def load(self, file):
-        """Load audio file"""
+        """Load audio file (blocking)"""
         self.loading_started.emit(os.path.basename(file))
         
         try:
-            y, self.sr = librosa.load(file, mono=True, sr=22050)
-            y = y / max(np.max(np.abs(y)), 1e-6)
-            self.mono = y.astype(np.float32)
-            self.current_position = 0.0
-            self.angle = 0.0
-            self.duration = len(y) / self.sr
-            self.position_changed.emit(0.0)
+            source = self._open_source(file)
+            self._set_source(source, file, self.track_gain(file))
             self.loading_complete.emit(os.path.basename(file))
             return True
         except Exception as e:
             print(f"Error loading file: {e}")
             return False
 
-    def seek(self, position):
-        """Force seek to position in seconds"""
-        if self.mono is not None:
-            position = max(0.0, min(position, self.duration))
-            print(f"AudioThread: Seeking to {position:.2f} seconds")
-            self.force_seek = position
-            self.current_position = position
+    def load_async(self, file):
+        """Load audio file on the loader worker, superseding any older pending load"""
+        self._load_generation += 1
+        generation = self._load_generation
+        if self._pending_load is not None:
+            self._pending_load.cancel()
+
+        # The track may already be decoded ahead of time; the callback moves
+        # it from the queued deck to the playing one
+        preloaded = None
+        if self._queued is not None and self._queued[1] == file:
+            preloaded = self._queued[0]
+            self._forget_preload()
+        else:
+            self.cancel_preload()
 
-    def callback(self, outdata, frames, time, status):
-        if status:
-            print(status)
-            
-        if self.mono is None:
-            outdata[:] = np.zeros((frames, 2), np.float32)
+        self.loading_started.emit(os.path.basename(file))
+        if preloaded is not None:
+            self._on_source_ready(preloaded, generation, file)
             return
 
-        out = np.zeros((frames, 2), np.float32)
-        
-        if self.force_seek is not None:
-            self.current_position = self.force_seek
-            self.force_seek = None
-        
-        start_sample = int(self.current_position * self.sr)
-        
-        if start_sample >= len(self.mono):
-            outdata[:] = np.zeros((frames, 2), np.float32)
-            self.running = False
+        self._pending_load = self._load_pool.submit(self._load_worker, file, generation)
+
+    def preload_async(self, file):
+        """Decode the start of the track expected to play next"""
+        if self._mix is not None:
+            # The next track is already fading in; predictions wait for it
             return
-        
-        if not self.running:
-            outdata[:] = np.zeros((frames, 2), np.float32)
+        self.cancel_preload()
+        self._pending_preload = self._load_pool.submit(
+            self._preload_worker, file, self._preload_generation)
+
+    def cancel_preload(self):
+        """Drop the queued track; the callback closes it unless it already plays"""
+        self._forget_preload()
+        self._post("queue", (None, None, 1.0))
+
+    def _forget_preload(self):
+        self._preload_generation += 1
+        if self._pending_preload is not None:
+            self._pending_preload.cancel()
+        self._queued = None
+        self.transition = None
+        self.next_chain = None
+
+    def _load_worker(self, file, generation):
+        is_current = lambda: generation == self._load_generation
+        if not is_current():
             return
-        
-        frames_processed = 0
-        for i in range(frames):
-            if start_sample + i >= len(self.mono):
-                self.running = False
-                break
+        try:
+            source = self._open_source(file, is_current)
+        except Exception as e:
+            print(f"Error loading file: {e}")
+            if is_current():
+                self.load_failed.emit(file)
+            return
+        if source is not None:
+            self.source_ready.emit(source, generation, file)
 
-            base = self.mono[start_sample + i] * self.volume
-            self.visual_samples[i % 256] = base
+    def _on_source_ready(self, source, generation, file):
+        """Runs on the GUI thread; stale results are dropped"""
+        if generation != self._load_generation:
+            source.close()
+            return
+        self._set_source(source, file, self.track_gain(file))
+        self._track_started(file)
+        self.loading_complete.emit(os.path.basename(file))
+        self.track_loaded.emit(file)
+
+    def _track_started(self, file):
+        self.current_file = file
+        self.beat_times = None
+        self._analysis_pool.submit(self._waveform_worker, file)
+        self._update_beats()
+
+    def _update_beats(self):
+        """Hand the current track's beats to beat-following effects, analysing
+        the track in the background the first time they are needed"""
+        chain = self._chain
+        if not chain.uses_beats or self.current_file is None:
+            return
+        if self.beat_times is not None:
+            chain.set_beats(beat_frames(self.beat_times, self.sr))
+        elif self._beats_pending != self.current_file:
+            self._beats_pending = self.current_file
+            self._analysis_pool.submit(self._beat_worker, self.current_file)
 
-            pan = (math.sin(self.angle) + 1) * 0.5
-            self.angle += 0.0006
+    def _beat_worker(self, file):
+        try:
+            _, times = track_beats(file, self.beat_cache)
+        except Exception as e:
+            print(f"Beat analysis failed for {os.path.basename(file)}: {e}")
+            return
+        self.beats_ready.emit(times, file)
+
+    def _on_beats_ready(self, times, file):
+        if self._beats_pending == file:
+            self._beats_pending = None
+        if file == self.current_file:
+            self.beat_times = times
+            self._update_beats()
+
+    def _waveform_worker(self, file):
+        """Emit the overview of `file`, building it from cached PCM or a
+        separate decode when it is not cached yet; the playback decoder only
+        runs at playback speed"""
+        pyramid = self.waveform_cache.get(file)
+        if pyramid is None:
+            _, _, mode = self._decode_settings()
+            cached = self.memory_cache.peek(track_key(file, mode)) or self.pcm_cache.open(file, mode)
+            try:
+                if cached is not None:
+                    pyramid = build_waveform(*cached)
+                else:
+                    pyramid = self._decode_waveform(file)
+            except Exception as e:
+                print(f"Waveform failed for {os.path.basename(file)}: {e}")
+                return
+            if pyramid is None:
+                return
+            self.waveform_cache.put(file, pyramid)
+        self.waveform_ready.emit(pyramid, file)
+
+    def _decode_waveform(self, file):
+        """Build the overview of `file` from a mono decode; None if another
+        track started meanwhile"""
+        builder = WaveformBuilder()
+        reader = open_reader(file)
+        try:
+            builder.begin(*decoded_format(reader))
+            for chunk in decode_chunks(reader):
+                if self._should_exit or file != self.current_file:
+                    builder.abort()
+                    return None
+                builder.write(chunk)
+        finally:
+            reader.close()
+        builder.commit()
+        return builder.pyramid
 
-            L = R = base
+    def _preload_worker(self, file, generation):
+        is_current = lambda: generation == self._preload_generation
+        if not is_current():
+            return
+        try:
+            source = self._open_source(file, is_current)
+        except Exception as e:
+            print(f"Error preloading file: {e}")
+            return
+        if source is not None:
+            self.preload_ready.emit(source, generation, file)
 
-            if self.effect == "Rock":
-                L *= 1.35
-                R *= 1.35
+    def _on_preload_ready(self, source, generation, file):
+        if generation != self._preload_generation:
+            source.close()
+            return
+        source = self._playable(source)
+        self._queued = (source, file)
+        self._post("queue", (source, file, self.track_gain(file)))
+        self._plan_transition()
+
+    def _plan_transition(self):
+        """Plan the crossfade into the preloaded track from the playing
+        track's length and beat grid; without one the switch is gapless"""
+        if self._mix is not None:
+            # The callback owns the incoming deck until it has faded in
+            return
+        transition = None
+        if self._playing is not None and self._queued is not None:
+            bpm = self.track_tempo.get(self.current_file)
+            positions = None
+            cached = self.beat_cache.get(self.current_file) if self.current_file else None
+            if cached is not None:
+                bpm = cached[0]
+                positions = beat_frames(cached[1], self.sr)
+            transition = plan_transition(self._playing.frames, self.sr, self.crossfade_seconds,
+                                         self.crossfade_beats, bpm, positions)
+        if transition is None:
+            self.transition = None
+            self.next_chain = None
+            return
+        # The chain has to be in place before the callback sees the transition
+        if self.next_chain is None:
+            self.next_chain = self._deck_chain(self.params.effect, self._queued[1])
+        self.transition = transition
+
+    def _deck_chain(self, effect, file):
+        """A fresh chain for `effect` on a deck playing `file`, with the file's
+        beats when they are cached"""
+        chain = build_chain(effect, self.sr)
+        chain.prepare(self._block_size)
+        if chain.uses_beats and file is not None:
+            cached = self.beat_cache.get(file)
+            if cached is not None:
+                chain.set_beats(beat_frames(cached[1], self.sr))
+        return chain
+
+    def set_crossfade(self, seconds, beats=0):
+        """Crossfade length for automatic transitions; 0 switches gaplessly"""
+        self.crossfade_seconds = seconds
+        self.crossfade_beats = beats
+        self._plan_transition()
+
+    def warm_cache(self, files):
+        """Decode `files` into the PCM cache in the background so they start instantly"""
+        for file in files:
+            self._warm_pool.submit(self._warm_worker, file)
+
+    def _warm_worker(self, file):
+        sr, mono, mode = self._decode_settings()
+        if self._should_exit or not os.path.exists(file) or self.pcm_cache.contains(file, mode):
+            return
+        writer = self.pcm_cache.writer(file, mode)
+        if writer is None:
+            return
+        # The overview comes from the same decode
+        sinks = [writer]
+        if not self.waveform_cache.contains(file):
+            sinks.append(self.waveform_cache.builder(file))
+        try:
+            reader = open_reader(file)
+            try:
+                for sink in sinks:
+                    sink.begin(*decoded_format(reader, sr, mono))
+                for chunk in decode_chunks(reader, sr, mono=mono):
+                    if self._should_exit:
+                        for sink in sinks:
+                            sink.abort()
+                        return
+                    for sink in sinks:
+                        sink.write(chunk)
+            finally:
+                reader.close()
+            for sink in sinks:
+                sink.commit()
+        except Exception as e:
+            for sink in sinks:
+                sink.abort()
+            print(f"PCM cache: could not decode {os.path.basename(file)}: {e}")
+
+    def set_effect(self, effect):
+        """Publish a freshly built chain for `effect`; the callback crossfades to it"""
+        chain = build_chain(effect, self.sr)
+        chain.prepare(self._block_size)
+        if chain.uses_beats and self.beat_times is not None:
+            chain.set_beats(beat_frames(self.beat_times, self.sr))
+        self.params = self.params._replace(effect=effect, chain=chain)
+        if self.next_chain is not None and self._queued is not None:
+            self.next_chain = self._deck_chain(effect, self._queued[1])
+        self._update_beats()
+
+    def set_eq_gains(self, gains):
+        """Retune the EQ of the playing chains in place; they crossfade to the new curve"""
+        for chain in (self._chain, self.params.chain, self.next_chain):
+            eq = chain.find(ParametricEQ) if chain is not None else None
+            if eq is not None:
+                eq.set_gains(gains)
+
+    def set_tempo(self, tempo, semitones):
+        """Change speed and key of the playing and queued tracks; the callback
+        applies it on its next block"""
+        self.tempo = tempo
+        self.semitones = semitones
+        queued = self._queued[0] if self._queued is not None else None
+        for source in (self._playing, queued):
+            if source is not None:
+                source.set(tempo, semitones)
+
+    def set_volume(self, volume):
+        self.params = self.params._replace(volume=volume)
+
+    def track_gain(self, file):
+        """Loudness normalisation gain for `file`; 1.0 until it has been analysed"""
+        measured = self.loudness.get(file)
+        if not self.normalize_loudness or measured is None:
+            return 1.0
+        return loudness_gain(*measured)
+
+    def set_track_loudness(self, file, lufs, peak_db):
+        """Record a loudness measurement; a playing or queued track picks it up (ramped)"""
+        self.loudness[file] = (lufs, peak_db)
+        if file == self.current_file or (self._queued is not None and file == self._queued[1]):
+            self._post("gain", (file, self.track_gain(file)))
+
+    def gain_reduction(self):
+        """dB the output limiter took off the loudest frame of the last block"""
+        chain = self._chain
+        limiter = chain.find(Limiter) if chain is not None else None
+        return limiter.gain_reduction_db if limiter is not None else 0.0
+
+    def seek(self, frame):
+        """Seek to track frame `frame` (at the output rate); applied by the
+        callback on its next block"""
+        source = self._playing
+        if source is not None:
+            frame = max(0, min(int(frame), source.frames))
+            print(f"AudioThread: Seeking to {frame / self.sr:.2f} seconds")
+            self._post("seek", frame)
+            self._position_request = frame
+
+    def _post(self, command, value):
+        """Queue a command for the callback; wakes run() in case the stream is stopped"""
+        self._commands.append((command, value))
+        self._wake.set()
+
+    def _apply_commands(self):
+        """Apply the GUI's commands in order; only the latest seek is kept. A
+        source taken off a deck is closed once neither deck holds it."""
+        dropped = []
+        while self._commands:
+            command, value = self._commands.popleft()
+            if command == "seek":
+                self._seek_request = value
+            elif command == "play":
+                source, file, gain, sr = value
+                if source is self.source:
+                    # Already promoted from the queued deck
+                    self._events.append(("positioned", 0))
+                    continue
+                if sr != self._render_sr:
+                    self._render_sr = sr
+                    chain = self.params.chain
+                    if chain.sr == sr:
+                        # Published by _set_source for this rate; a new track
+                        # starts on it without a crossfade
+                        self._chain = chain
+                        self._block_params = self._block_params._replace(chain=chain)
+                if source is self.next_source:
+                    # The queued track was chosen by hand
+                    self.next_source = None
+                    self.next_file = None
+                    self._mix = None
+                dropped.append(self.source)
+                self.source = source
+                self._source_file = file
+                self.source_gain = gain
+                # A seek of the old track no longer applies
+                self._seek_request = None
+                self._preroll = 0
+                self._seek_from = None
+                self.position_frames = 0
+                self._events.append(("positioned", 0))
+            elif command == "queue":
+                source, file, gain = value
+                if source is not self.next_source:
+                    dropped.append(self.next_source)
+                    self._mix = None
+                self.next_source = source
+                self.next_file = file
+                self.next_gain = gain
+            elif command == "gain":
+                file, gain = value
+                if file == self._source_file:
+                    self.source_gain = gain
+                if file == self.next_file:
+                    self.next_gain = gain
+        for source in dropped:
+            if source is not None and source is not self.source and source is not self.next_source:
+                source.close()
+
+    def _ensure_block_buffers(self, frames):
+        """(Re)allocate the per-block work buffers when the block size changes"""
+        if self._block_size == frames:
+            return
+        self._block_size = frames
+        self._seek_from = None
+        self._ramp = np.arange(frames, dtype=np.float64)
+        self._src_buf = np.empty((frames, 2), dtype=np.float32)
+        self._seek_buf = np.empty((frames, 2), dtype=np.float32)
+        self._seek_out = np.empty((frames, 2), dtype=np.float32)
+        self._silence = np.zeros((frames, 2), dtype=np.float32)
+        self._fade = np.empty(frames, dtype=np.float64)
+        self._gain = np.empty(frames, dtype=np.float64)
+        self._work = np.empty((frames, 2), dtype=np.float64)
+        self._next_work = np.empty((frames, 2), dtype=np.float64)
+        # Incoming deck during a crossfade
+        self._deck_buf = np.empty((frames, 2), dtype=np.float32)
+        self._deck_work = np.empty((frames, 2), dtype=np.float64)
+        self._base = np.empty(frames, dtype=np.float64)
+
+    def _store_visual_samples(self, base):
+        """Keep the last 256 samples of the block at their i % 256 slots"""
+        n = len(base)
+        size = len(self.visual_samples)
+        tail_start = max(0, n - size)
+        seg = base[tail_start:]
+        pos = tail_start % size
+        first = min(size - pos, len(seg))
+        self.visual_samples[pos:pos + first] = seg[:first]
+        self.visual_samples[:len(seg) - first] = seg[first:]
+
+    def process_block(self, block, out, position=0):
+        """Render one (frames, 2) block of samples into the stereo `out` array.
+
+        Parameters are read once per block from `self.params`. Volume (times
+        the track's loudness gain) is ramped linearly from the previous
+        block's value and an effect switch
+        crossfades the old and new chain across the block. `position` is the
+        track frame of the block's first sample, for beat-following effects.
+        """
+        params = self.params
+        prev = self._block_params
+        if params.chain is not prev.chain and params.chain.sr != self._render_sr:
+            # Built for a track at another rate the callback has not switched to yet
+            params = params._replace(chain=prev.chain)
+        self._block_params = params
+        n = len(block)
+
+        # Volume times the track's loudness gain, ramped from the last block
+        start = prev.volume * self._block_gain
+        target = params.volume * self.source_gain
+        self._block_gain = self.source_gain
+        fade = self._fade[:n]
+        np.multiply(self._ramp[:n], 1.0 / max(n, 1), out=fade)
+        gain = self._gain[:n]
+        np.multiply(fade, target - start, out=gain)
+        gain += start
+
+        work = self._work[:n]
+        np.multiply(block, gain[:, None], out=work)
+        base = self._base[:n]
+        np.add(work[:, 0], work[:, 1], out=base)
+        base *= 0.5
+        self._store_visual_samples(base)
+
+        switching = params.chain is not prev.chain
+        if switching:
+            next_work = self._next_work[:n]
+            next_work[:] = work
+
+        result = self._run_chain(self._chain, work, position)
+        if switching:
+            incoming = self._run_chain(params.chain, next_work, position)
+            # result += (incoming - result) * fade
+            incoming -= result
+            incoming *= fade[:, None]
+            result += incoming
+            self._chain = params.chain
+
+        out[:n] = result
+
+    def _run_chain(self, chain, block, position):
+        if chain.sr != self._render_sr:
+            chain.set_samplerate(self._render_sr)
+        chain.seek(position)
+        return chain.process(block)
+
+    def _read_source(self, source, start, stop, buf=None):
+        """Read into _src_buf[start:stop] as stereo; mono sources fill both columns"""
+        buf = (self._src_buf if buf is None else buf)[start:stop]
+        n = source.read_into(buf[:, :source.channels])
+        if source.channels == 1:
+            buf[:n, 1] = buf[:n, 0]
+        return n
+
+    def play(self):
+        """Start or resume playback; wakes a suspended stream"""
+        self.running = True
+        if self.suspended:
+            self._wake.set()
 
-            elif self.effect == "3D":
-                L = base * (1 - pan) * 1.3
-                R = base * pan * 1.3
+    def pause(self):
+        self.running = False
 
-            elif self.effect == "8D":
-                depth = 1.0 - abs(math.cos(self.angle)) * 0.3
-                L = base * (1 - pan) * depth * 1.4
-                R = base * pan * depth * 1.4
+    def cpu_stats(self):
+        """Callback load and process CPU time, for checking the idle behaviour"""
+        return {
+            "callbacks": self.callback_calls,
+            "callback_seconds": self.callback_seconds,
+            "suspended": self.suspended,
+            "process_cpu_seconds": process_time(),
+        }
 
-            elif self.effect == "Dolby":
-                side = math.sin(self.angle) * 0.3
-                bass = base * 0.3
-                L = base + side + bass
-                R = base - side + bass
+    def callback(self, outdata, frames, time, status):
+        started = perf_counter()
+        self._render(outdata, frames, status)
+        self.callback_calls += 1
+        self.callback_seconds += perf_counter() - started
 
-            out[i, 0] = np.tanh(L)
-            out[i, 1] = np.tanh(R)
-            frames_processed += 1
-        
-        self.current_position += frames_processed / self.sr
-        self.position_changed.emit(self.current_position)
+    def _render(self, outdata, frames, status):
+        if status:
+            print(status)
 
-        outdata[:] = out
+        self._apply_commands()
+        source = self.source
+        if source is None or not self.running or source.sr != self._open_sr:
+            # Nothing to play, or the stream is about to be reopened at the track's rate
+            outdata.fill(0)
+            self._idle_frames += frames
+            if self._idle_frames >= self.idle_timeout * self._render_sr and not self._suspend_requested:
+                self._suspend_requested = True
+                self._wake.set()
+            return
+        self._idle_frames = 0
+
+        self._ensure_block_buffers(frames)
+        seek_to, self._seek_request = self._seek_request, None
+        if seek_to is not None:
+            self._start_seek(source, seek_to, frames)
+        if self._preroll and not self._run_preroll(source):
+            # The decoder has not reached the new position yet: fade out of
+            # the old one now and in from silence once it has
+            outdata.fill(0)
+            self._fade_from_seek(outdata, frames)
+            self._seek_from = self._silence
+            return
+        block_start = source.position
+        frames_processed = self._read_source(source, 0, frames)
+
+        next_source = self.next_source
+        next_chain = self.next_chain
+        mix = self._mix
+        if mix is not None and (next_source is None or next_chain is None):
+            # The incoming track was dropped (another track was chosen)
+            mix = self._mix = None
+        transition = self.transition
+        if mix is None and transition is not None and next_source is not None \
+                and next_chain is not None and next_source.sr == self._render_sr and self._seek_from is None:
+            start, length = transition
+            if block_start + frames * self.tempo > start:
+                offset = min(frames - 1, max(0, int((start - block_start) / self.tempo)))
+                mix = self._mix = Crossfade(length / self.tempo, offset)
+
+        if mix is None and frames_processed < frames and source.finished and next_source is not None \
+                and next_source.sr == self._render_sr:
+            # Gapless switch: the next track continues in the same block
+            next_file = self.next_file
+            self.next_source = None
+            self.next_file = None
+            self.source = next_source
+            self._source_file = next_file
+            self.source_gain = self.next_gain
+            self.duration = next_source.duration
+            source.close()
+            source = next_source
+            frames_processed += self._read_source(source, frames_processed, frames)
+            self._events.append(("advanced", next_file))
+
+        if frames_processed < frames:
+            if mix is not None:
+                # The outgoing track ended; the incoming one plays on
+                self._src_buf[frames_processed:frames] = 0
+                frames_processed = frames
+            else:
+                # Either the end of the track or the decoder fell behind
+                outdata[frames_processed:] = 0
+
+        if frames_processed:
+            self.process_block(self._src_buf[:frames_processed], outdata, block_start)
+        if self._seek_from is not None:
+            self._fade_from_seek(outdata, frames)
+
+        if mix is not None:
+            self._mix_incoming(outdata, frames, mix, next_source, next_chain)
+            if mix.finished:
+                self._finish_transition(next_source, next_chain)
+                source = self.source
+
+        self.position_frames = source.position
+        if source.finished and self._mix is None:
+            self.running = False
+            self.duration = source.duration
+            self._events.append(("finished", None))
+
+    def _start_seek(self, source, frame, frames):
+        """Render the block at the old position to crossfade out of, then move
+        the source PREROLL_FRAMES ahead of `frame` for _run_preroll()"""
+        position = source.position
+        read = self._read_source(source, 0, frames, self._seek_buf)
+        self._seek_buf[read:frames] = 0
+        self.process_block(self._seek_buf[:frames], self._seek_out, position)
+        mix = self._mix
+        if mix is not None:
+            # Seeking the playing track calls the transition off; it starts
+            # again when playback reaches it
+            self._mix = None
+            if self.next_source is not None and self.next_chain is not None:
+                self._mix_incoming(self._seek_out, frames, mix, self.next_source, self.next_chain)
+                self.next_source.seek(0)
+        self._seek_from = self._seek_out
+        start = max(0, frame - self.PREROLL_FRAMES)
+        source.seek(start)
+        self._preroll = int((frame - start) / self.tempo)
+        self.position_frames = frame
+        self._events.append(("positioned", frame))
+        # Pan LFOs reach the target with the phase they would have there
+        lead = frame - self._preroll
+        self._chain.locate(lead)
+        if self.params.chain is not self._chain:
+            self.params.chain.locate(lead)
+
+    def _run_preroll(self, source):
+        """Run the chain over the audio just ahead of a seek target and drop
+        the output, so delay lines, reverb, filters and the limiter hold what
+        precedes the target. False while the source has not decoded it yet."""
+        gain = self.params.volume * self.source_gain
+        while self._preroll:
+            position = source.position
+            read = self._read_source(source, 0, min(self._preroll, self._block_size), self._seek_buf)
+            if not read:
+                if source.finished:
+                    self._preroll = 0
+                break
+            work = self._work[:read]
+            np.multiply(self._seek_buf[:read], gain, out=work)
+            self._run_chain(self._chain, work, position)
+            self._preroll -= read
+        return not self._preroll
+
+    def _fade_from_seek(self, out, frames):
+        """Crossfade `out` from the block a seek left off at"""
+        fade = self._fade[:frames]
+        np.multiply(self._ramp[:frames], 1.0 / frames, out=fade)
+        old = self._seek_from[:frames]
+        self._seek_from = None
+        # out = old + (out - old) * fade
+        out[:frames] -= old
+        out[:frames] *= fade[:, None]
+        out[:frames] += old
+
+    def _mix_incoming(self, out, frames, mix, source, chain):
+        """Render the incoming deck through its own chain and crossfade it with
+        the playing deck's block already in `out`"""
+        offset = mix.offset
+        buf = self._deck_buf
+        buf[:offset] = 0
+        position = source.position
+        read = self._read_source(source, offset, frames, buf)
+        buf[offset + read:frames] = 0
+
+        work = self._deck_work[:frames]
+        np.multiply(buf[:frames], self.params.volume * self.next_gain, out=work)
+        incoming = self._run_chain(chain, work, position - offset)
+
+        fade_out, fade_in = mix.gains(frames)
+        out[:frames] *= fade_out[:, None]
+        incoming *= fade_in[:, None]
+        out[:frames] += incoming
+
+    def _finish_transition(self, source, chain):
+        """The incoming deck has faded in: it becomes the playing deck"""
+        if self.next_source is not source:
+            # Dropped by the GUI in the meantime
+            self._mix = None
+            return
+        old_source = self.source
+        next_file = self.next_file
+        self.source = source
+        self._source_file = next_file
+        self.source_gain = self._block_gain = self.next_gain
+        self._chain = chain
+        self.duration = self.source.duration
+        self.transition = None
+        self.next_source = None
+        self.next_file = None
+        self.next_chain = None
+        self._mix = None
+        old_source.close()
+        self._events.append(("advanced", next_file))
 
     def run(self):
+        """Owns the output stream: one stream is reused across tracks and only
+        reopened when the rate changes. Sleeps until _wake is set."""
         print("AudioThread.run() started")
-        self.running = True
-        with sd.OutputStream(
-            samplerate=self.sr,
-            channels=2,
-            callback=self.callback,
-            blocksize=1024
-        ):
-            while True:
-                sd.sleep(50)
-                if not hasattr(self, '_should_exit'):
-                    self._should_exit = False
-                if self._should_exit:
-                    break
-        
+        stream = None
+        try:
+            while not self._should_exit:
+                self._wake.clear()
+                rate = self.stream_sr
+                if rate is not None and rate != self._open_sr:
+                    stream = self._reopen_stream(stream, rate)
+                if stream is not None:
+                    self._update_suspension(stream)
+                if stream is None or self.suspended:
+                    # No callback runs; the decks are safe to change here
+                    self._apply_commands()
+                self._wake.wait()
+        finally:
+            self._close_stream(stream)
         print("AudioThread.run() ended")
 
+    def _update_suspension(self, stream):
+        """Stop the stream after `idle_timeout` of silence; restart it on play()"""
+        if self.running and self.suspended:
+            self._idle_frames = 0
+            self._suspend_requested = False
+            self.suspended = False
+            stream.start()
+            print("AudioThread: output stream resumed")
+        elif self._suspend_requested and not self.suspended:
+            # Set before `running` is checked, so a play() racing with us
+            # either is seen here or sees `suspended` and wakes us
+            self.suspended = True
+            if self.running:
+                self.suspended = False
+            else:
+                stream.stop()
+                print("AudioThread: output stream suspended while idle")
+        self._suspend_requested = False
+
+    def _reopen_stream(self, stream, rate):
+        self._close_stream(stream)
+        try:
+            stream = sd.OutputStream(
+                samplerate=rate,
+                channels=2,
+                dtype="float32",
+                callback=self.callback,
+                blocksize=1024
+            )
+            self._open_sr = rate
+            self.suspended = False
+            self._idle_frames = 0
+            stream.start()
+            print(f"AudioThread: output stream opened at {rate} Hz")
+            return stream
+        except Exception as e:
+            print(f"AudioThread: could not open output stream at {rate} Hz: {e}")
+            # Let the next track request the rate again
+            self.stream_sr = None
+            return None
+
+    def _close_stream(self, stream):
+        self._open_sr = None
+        if stream is not None:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception as e:
+                print(f"AudioThread: error closing output stream: {e}")
+
     def stop(self):
         self.running = False
         self._should_exit = True
+        self._wake.set()
+        self._load_generation += 1
+        self._load_pool.shutdown(wait=False, cancel_futures=True)
+        self._warm_pool.shutdown(wait=False, cancel_futures=True)
+        self._analysis_pool.shutdown(wait=False, cancel_futures=True)
 
 
 # ================= SPECTRUM VISUALIZER =================
@@ -1088,6 +2210,163 @@ class Spectrum(QWidget):
         self.update()
 
 
+# ================= WAVEFORM SEEK BAR =================
+class WaveformSeekBar(QSlider):
+    """Progress slider drawn as the track's waveform overview: peaks and RMS,
+    with the played part highlighted.
+
+    Keeps QSlider's range, value and pressed / moved / released signals, so
+    it is a drop-in for the plain progress slider; a click seeks straight to
+    the clicked position instead of paging.
+    """
+
+    # (peak, rms) colours
+    PLAYED = (QColor("#1f6feb"), QColor("#58a6ff"))
+    UNPLAYED = (QColor("#30363d"), QColor("#484f58"))
+
+    def __init__(self, parent=None):
+        super().__init__(Qt.Horizontal, parent)
+        self.pyramid = None
+        # (peak lines, rms lines) for the current size, rebuilt on resize
+        self._lines = None
+
+    def set_waveform(self, pyramid):
+        self.pyramid = pyramid
+        self._lines = None
+        self.update()
+
+    def resizeEvent(self, e):
+        self._lines = None
+        super().resizeEvent(e)
+
+    def _waveform_lines(self):
+        if self._lines is None:
+            w, h = self.width(), self.height()
+            mins, maxs, rms = self.pyramid.columns(w)
+            mid = h / 2
+            scale = mid - 1
+            peaks, levels = [], []
+            for x in range(w):
+                cx = x + 0.5
+                # At least one pixel tall, so silence still shows as a line
+                top = mid - max(maxs[x] * scale, 0.5)
+                bottom = mid - min(mins[x] * scale, -0.5)
+                peaks.append(QLineF(cx, top, cx, bottom))
+                r = rms[x] * scale
+                levels.append(QLineF(cx, mid - r, cx, mid + r))
+            self._lines = (peaks, levels)
+        return self._lines
+
+    def _cursor_x(self):
+        return QStyle.sliderPositionFromValue(self.minimum(), self.maximum(),
+                                              self.sliderPosition(), self.width())
+
+    def paintEvent(self, e):
+        painter = QPainter(self)
+        w, h = self.width(), self.height()
+        x = self._cursor_x()
+
+        if self.pyramid is None:
+            # No overview yet: a plain groove
+            groove = QRect(0, h // 2 - 3, w, 6)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(self.UNPLAYED[0])
+            painter.drawRoundedRect(groove, 3, 3)
+            painter.setBrush(self.PLAYED[0])
+            painter.drawRoundedRect(QRect(0, groove.y(), x, 6), 3, 3)
+            painter.drawEllipse(QPointF(min(max(x, 8), w - 8), h / 2), 8, 8)
+            return
+
+        peaks, levels = self._waveform_lines()
+        for colors, clip in ((self.PLAYED, QRect(0, 0, x, h)), (self.UNPLAYED, QRect(x, 0, w - x, h))):
+            painter.setClipRect(clip)
+            painter.setPen(QPen(colors[0], 1))
+            painter.drawLines(peaks)
+            painter.setPen(QPen(colors[1], 1))
+            painter.drawLines(levels)
+        painter.setClipping(False)
+        painter.setPen(QPen(QColor("#c9d1d9"), 2))
+        painter.drawLine(x, 0, x, h)
+
+    def mousePressEvent(self, e):
+        if e.button() != Qt.LeftButton:
+            super().mousePressEvent(e)
+            return
+        self.setSliderDown(True)
+        self._seek_to(e.x())
+
+    def mouseMoveEvent(self, e):
+        if self.isSliderDown():
+            self._seek_to(e.x())
+
+    def mouseReleaseEvent(self, e):
+        if self.isSliderDown():
+            self._seek_to(e.x())
+            self.setSliderDown(False)
+
+    def _seek_to(self, x):
+        value = QStyle.sliderValueFromPosition(self.minimum(), self.maximum(),
+                                               min(max(x, 0), self.width()), self.width())
+        # Emits sliderMoved while the slider is down
+        self.setSliderPosition(value)
+        self.update()
+
+
+# ================= EQUALIZER DIALOG =================
+class EqualizerDialog(QDialog):
+    """Ten vertical sliders (one per EQ band) editing the Custom EQ curve live"""
+    gains_changed = pyqtSignal(list)
+
+    def __init__(self, gains, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Equalizer")
+        self.setStyleSheet("background-color: #0d1117; color: #c9d1d9;")
+
+        layout = QVBoxLayout(self)
+        bands_layout = QHBoxLayout()
+        bands_layout.setSpacing(6)
+        self.sliders = []
+        for freq, gain in zip(EQ_FREQUENCIES, gains):
+            column = QVBoxLayout()
+            slider = QSlider(Qt.Vertical)
+            # Tenths of a dB
+            slider.setRange(int(-EQ_RANGE_DB * 10), int(EQ_RANGE_DB * 10))
+            slider.setValue(int(round(gain * 10)))
+            slider.setFixedHeight(160)
+            slider.valueChanged.connect(self.emit_gains)
+            label = QLabel(f"{freq / 1000:g}k" if freq >= 1000 else f"{freq:g}")
+            label.setAlignment(Qt.AlignCenter)
+            column.addWidget(slider, alignment=Qt.AlignHCenter)
+            column.addWidget(label)
+            bands_layout.addLayout(column)
+            self.sliders.append(slider)
+        layout.addLayout(bands_layout)
+
+        buttons = QHBoxLayout()
+        btn_reset = QPushButton("Reset")
+        btn_reset.clicked.connect(self.reset)
+        btn_close = QPushButton("Close")
+        btn_close.clicked.connect(self.accept)
+        buttons.addWidget(btn_reset)
+        buttons.addStretch()
+        buttons.addWidget(btn_close)
+        layout.addLayout(buttons)
+
+    def gains(self):
+        return [slider.value() / 10 for slider in self.sliders]
+
+    def emit_gains(self):
+        self.gains_changed.emit(self.gains())
+
+    def reset(self):
+        for slider in self.sliders:
+            slider.blockSignals(True)
+            slider.setValue(0)
+            slider.blockSignals(False)
+        self.emit_gains()
+
+
 # ================= MUSIC PLAYER UI =================
 class MusicPlayer(QMainWindow):
     def __init__(self):
@@ -1108,6 +2387,12 @@ class MusicPlayer(QMainWindow):
         """)
         
         self.audio = AudioThread()
+        self.loudness_scanner = LoudnessScanner()
+        self.loudness_scanner.measured.connect(self.on_loudness_measured)
+        self.library_analyzer = LibraryAnalyzer()
+        self.library_analyzer.analyzed.connect(self.on_track_analyzed)
+        # {path: (bpm, musical key)} of analysed tracks
+        self.track_analysis = {}
         self.files = []
         self.durations = []
         self.current_file_index = -1
@@ -1119,22 +2404,32 @@ class MusicPlayer(QMainWindow):
         self.original_indices = []
         self.is_shuffled = False
         self.current_shuffle_index = -1
+        # Track next() will play, predicted ahead of time for gapless preloading
+        self.next_index = None
         
         self.current_folder_path = None
         self.all_tracks = []
         self.all_files = []
         self.all_durations = []
 
+        self.load_custom_eq()
         self.init_ui()
 
         self.audio.position_changed.connect(self.update_progress_from_audio)
         self.audio.loading_started.connect(self.show_loading)
         self.audio.loading_complete.connect(self.hide_loading)
+        self.audio.track_loaded.connect(self.on_track_loaded)
+        self.audio.track_changed.connect(self.on_track_advanced)
+        self.audio.track_finished.connect(self.on_track_finished)
+        self.audio.load_failed.connect(self.on_load_failed)
+        self.audio.waveform_ready.connect(self.on_waveform_ready)
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_visualizer)
+        self.timer.timeout.connect(self.audio.poll_events)
         self.timer.start(30)
         QTimer.singleShot(100, self.load_last_folder)
+        QTimer.singleShot(3000, self.warm_most_played)
 
 
     def init_ui(self):
@@ -1507,12 +2802,18 @@ class MusicPlayer(QMainWindow):
         effects_label.setStyleSheet("color: #c9d1d9; font-weight: bold;")
         
         self.effects_combo = QComboBox()
-        self.effects_combo.addItems(["Flat", "Rock", "3D", "8D", "Dolby"])
-        self.effects_combo.currentTextChanged.connect(lambda e: setattr(self.audio, 'effect', e))
+        self.effects_combo.addItems(list(PRESETS))
+        self.effects_combo.currentTextChanged.connect(self.audio.set_effect)
         self.effects_combo.setFixedWidth(80)
+
+        self.btn_eq = QPushButton("EQ")
+        self.btn_eq.setToolTip("Edit the Custom equalizer curve")
+        self.btn_eq.clicked.connect(self.show_equalizer)
+        self.btn_eq.setFixedWidth(40)
                
         mode_layout.addWidget(effects_label)
         mode_layout.addWidget(self.effects_combo)
+        mode_layout.addWidget(self.btn_eq)
         mode_layout.addStretch()
         
         volume_label = QLabel("Vol:")
@@ -1542,16 +2843,84 @@ class MusicPlayer(QMainWindow):
             }
         """)
         
+        # Output limiter activity
+        self.limiter_label = QLabel("GR 0.0 dB")
+        self.limiter_label.setToolTip("Gain reduction of the output limiter")
+        self.limiter_label.setFixedWidth(70)
+        self.limiter_label.setStyleSheet("color: #8b949e;")
+        self.limiter_level = 0.0
+        
         mode_layout.addWidget(volume_label)
         mode_layout.addWidget(self.volume_slider)
+        mode_layout.addWidget(self.limiter_label)
         controls_layout.addLayout(mode_layout)
         right_panel.addLayout(controls_layout)
+
+        # Tempo (pitch fader) and key
+        tempo_layout = QHBoxLayout()
+        tempo_layout.setSpacing(8)
+
+        tempo_label = QLabel("Tempo:")
+        tempo_label.setStyleSheet("color: #c9d1d9; font-weight: bold;")
+
+        # Tenths of a percent
+        range_steps = int(round(TEMPO_RANGE * 1000))
+        self.tempo_slider = QSlider(Qt.Horizontal)
+        self.tempo_slider.setRange(-range_steps, range_steps)
+        self.tempo_slider.setValue(0)
+        self.tempo_slider.setFixedWidth(160)
+        self.tempo_slider.setToolTip("Playback speed without changing the key")
+        self.tempo_slider.valueChanged.connect(self.on_tempo_changed)
+
+        self.tempo_value = QLabel("+0.0%")
+        self.tempo_value.setFixedWidth(50)
+        self.tempo_value.setStyleSheet("color: #8b949e;")
+
+        key_label = QLabel("Key:")
+        key_label.setStyleSheet("color: #c9d1d9; font-weight: bold;")
+
+        self.key_spin = QSpinBox()
+        self.key_spin.setRange(-12, 12)
+        self.key_spin.setSuffix(" st")
+        self.key_spin.setToolTip("Key shift in semitones, without changing the speed")
+        self.key_spin.setFixedWidth(70)
+        self.key_spin.valueChanged.connect(self.on_tempo_changed)
+
+        self.btn_tempo_reset = QPushButton("Reset")
+        self.btn_tempo_reset.setToolTip("Original tempo and key")
+        self.btn_tempo_reset.clicked.connect(self.reset_tempo)
+        self.btn_tempo_reset.setFixedWidth(60)
+
+        tempo_layout.addWidget(tempo_label)
+        tempo_layout.addWidget(self.tempo_slider)
+        tempo_layout.addWidget(self.tempo_value)
+        tempo_layout.addSpacing(20)
+        tempo_layout.addWidget(key_label)
+        tempo_layout.addWidget(self.key_spin)
+        tempo_layout.addWidget(self.btn_tempo_reset)
+        tempo_layout.addStretch()
+
+        mix_label = QLabel("Mix:")
+        mix_label.setStyleSheet("color: #c9d1d9; font-weight: bold;")
+
+        self.crossfade_combo = QComboBox()
+        self.crossfade_combo.addItems(list(CROSSFADE_MODES))
+        self.crossfade_combo.setToolTip("Crossfade into the next track before the end of the current one")
+        self.crossfade_combo.setFixedWidth(90)
+        self.crossfade_combo.currentTextChanged.connect(self.on_crossfade_changed)
+        saved = self.db.get_config('crossfade', "Gapless")
+        if saved in CROSSFADE_MODES:
+            self.crossfade_combo.setCurrentText(saved)
+
+        tempo_layout.addWidget(mix_label)
+        tempo_layout.addWidget(self.crossfade_combo)
+        right_panel.addLayout(tempo_layout)
         
         right_panel.addSpacing(10)
         
         # Progress section
         progress_frame = QFrame()
-        progress_frame.setFixedHeight(140)
+        progress_frame.setFixedHeight(170)
         progress_frame.setStyleSheet("""
             QFrame {
                 background-color: #161b22;
@@ -1564,27 +2933,10 @@ class MusicPlayer(QMainWindow):
         progress_layout.setContentsMargins(10, 8, 10, 8)
         progress_layout.setSpacing(8)
         
-        self.progress_bar = QSlider(Qt.Horizontal)
+        self.progress_bar = WaveformSeekBar()
         self.progress_bar.setRange(0, 10000)
         self.progress_bar.setValue(0)
-        self.progress_bar.setStyleSheet("""
-            QSlider::groove:horizontal {
-                background-color: #30363d;
-                height: 6px;
-                border-radius: 3px;
-            }
-            QSlider::handle:horizontal {
-                background-color: #1f6feb;
-                width: 16px;
-                height: 16px;
-                margin: -5px 0;
-                border-radius: 8px;
-            }
-            QSlider::sub-page:horizontal {
-                background-color: #1f6feb;
-                border-radius: 3px;
-            }
-        """)
+        self.progress_bar.setFixedHeight(48)
         
         progress_layout.addWidget(self.progress_bar)
         
@@ -1788,6 +3140,42 @@ class MusicPlayer(QMainWindow):
         else:
             print("No last folder found in database")
             
+    def analyze_loudness(self, folder_path):
+        """Hand known loudness values to the audio thread and measure the rest"""
+        self.audio.loudness.update(self.db.get_folder_loudness(folder_path))
+        self.loudness_scanner.scan(self.db.get_tracks_without_loudness(folder_path))
+
+    def on_loudness_measured(self, file_path, lufs, peak_db):
+        self.db.set_track_loudness(file_path, lufs, peak_db)
+        self.audio.set_track_loudness(file_path, lufs, peak_db)
+
+    def analyze_music(self, folder_path):
+        """Load stored tempo / key results and analyse the tracks without them"""
+        analysis = self.db.get_folder_analysis(folder_path)
+        self.track_analysis.update(analysis)
+        self.audio.track_tempo.update({path: bpm for path, (bpm, _) in analysis.items()})
+        self.library_analyzer.scan(self.db.get_tracks_without_analysis(folder_path))
+
+    def on_track_analyzed(self, file_path, analysis):
+        self.db.set_track_analysis(file_path, analysis)
+        self.track_analysis[file_path] = (analysis.bpm, analysis.key)
+        self.audio.track_tempo[file_path] = analysis.bpm
+        if 0 <= self.current_file_index < len(self.files) and self.files[self.current_file_index] == file_path:
+            self.title_label.setText(self.track_title(file_path))
+
+    def track_title(self, file_path):
+        """Now-playing title, with tempo and key once the track is analysed"""
+        title = f"🎧 {os.path.basename(file_path)}"
+        analysis = self.track_analysis.get(file_path)
+        if analysis is not None:
+            bpm, key = analysis
+            title += f"  ·  {bpm:.0f} BPM" + (f"  ·  {key}" if key else "")
+        return title
+
+    def warm_most_played(self, limit=20):
+        """Decode the most played tracks into the PCM cache so they start instantly"""
+        self.audio.warm_cache([track[0] for track in self.db.get_most_played(limit)])
+            
     def load_folder_from_db(self, folder_path):
         """Load folder tracks from database (fast loading)"""
         print(f"Loading tracks from database for: {folder_path}")
@@ -1852,6 +3240,8 @@ class MusicPlayer(QMainWindow):
         
         # Add to recent folders
         self.db.add_recent_folder(folder_path)
+        self.analyze_loudness(folder_path)
+        self.analyze_music(folder_path)
     
     def load_folder(self):
         """Load music folder and scan for audio files"""
@@ -1966,6 +3356,8 @@ class MusicPlayer(QMainWindow):
         
         # Add to recent folders
         self.db.add_recent_folder(folder)
+        self.analyze_loudness(folder)
+        self.analyze_music(folder)
       
     def display_tracks(self, files, durations):
         """Display tracks in the table"""
@@ -1996,6 +3388,8 @@ class MusicPlayer(QMainWindow):
             duration_item = QTableWidgetItem(duration_text)
             duration_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
             self.table.setItem(r, 1, duration_item)    
+        
+        self.reset_next_prediction()
     
     def filter_tracks(self):
         """Filter tracks based on search text"""
@@ -2036,6 +3430,7 @@ class MusicPlayer(QMainWindow):
         self.original_indices.clear()
         self.current_shuffle_index = -1
         self.table.setRowCount(0)
+        self.reset_next_prediction()
         self.stop()
 
     # ================= PLAYBACK CONTROLS =================
@@ -2057,93 +3452,106 @@ class MusicPlayer(QMainWindow):
             
             # Store current index
             self.current_file_index = row
-            
-            # Clear previous playing track highlight
-            for i in range(self.table.rowCount()):
-                # Clear playing flag from all items
-                for col in range(4):  # Changed from 2 to 4 columns
-                    item = self.table.item(i, col)
-                    if item:
-                        item.setData(Qt.UserRole + 1, None)  # Clear playing flag
-                        
-                # Reset track disc to gray for non-playing tracks
-                track_item = self.table.item(i, 0)
-                if track_item:
-                    text = track_item.text()
-                    # Remove any color emoji and set back to CD emoji
-                    if "🔴" in text or "🟢" in text or "🔵" in text or "🟡" in text or "🟣" in text or "🟠" in text:
-                        # Extract just the filename
-                        parts = text.split(" ", 1)
-                        if len(parts) > 1:
-                            track_item.setText(f"💿 {parts[1]}")
-            
-            file_path = self.files[row]
-            
-            if self.audio.load(file_path):
-                # Update database play stats
-                self.db.update_track_play_stats(file_path)
-                
-                self.title_label.setText(f"🎧 {os.path.basename(file_path)}")
-                
-                if not self.audio.isRunning():
-                    self.audio.start()
-                
-                self.audio.running = True
-                self.update_play_button_icon(playing=True)
-                
-                # Update duration display
-                mins = int(self.audio.duration // 60)
-                secs = int(self.audio.duration % 60)
-                duration_text = f"{mins:02d}:{secs:02d}"
-                
-                # Update duration in table
-                duration_item = self.table.item(row, 3)  # Changed from 1 to 3
-                if duration_item:
-                    duration_item.setText(duration_text)
-                
-                # Store the actual duration
-                self.durations[row] = self.audio.duration
-                
-                # Update progress bar duration
-                self.duration_label.setText(duration_text)
-                
-                # Reset progress
-                self.progress_bar.setValue(0)
-                
-                # Highlight playing track with colorful disc
-                track_item = self.table.item(row, 0)
-                if track_item:
-                    # Get current text (remove the 💿 if present)
-                    current_text = track_item.text()
-                    parts = current_text.split(" ", 1)
-                    filename = parts[1] if len(parts) > 1 else current_text
-                    
-                    # Choose a color based on track index (rotating colors)
-                    colors = ["🔴", "🟢", "🔵", "🟡", "🟣", "🟠"]  # Red, Green, Blue, Yellow, Purple, Orange
-                    color_index = row % len(colors)
-                    colorful_disc = colors[color_index]
+            self.next_index = None
+            
+            # Decode on the loader worker; on_track_loaded finishes the switch
+            self.audio.load_async(self.files[row])
+
+    def on_track_loaded(self, file_path):
+        """Update the UI once the requested track is ready to play"""
+        row = self.current_file_index
+        if not (0 <= row < len(self.files)) or self.files[row] != file_path:
+            if file_path not in self.files:
+                return
+            row = self.files.index(file_path)
+        
+        # Clear previous playing track highlight
+        for i in range(self.table.rowCount()):
+            # Clear playing flag from all items
+            for col in range(4):  # Changed from 2 to 4 columns
+                item = self.table.item(i, col)
+                if item:
+                    item.setData(Qt.UserRole + 1, None)  # Clear playing flag
                     
-                    # Set colorful disc
-                    track_item.setText(f"{colorful_disc} {filename}")
-                    
-                    # Set playing flag for styling
-                    track_item.setData(Qt.UserRole + 1, "playing")
-                
-                # Also highlight other cells
-                for col in range(1, 4):  # Highlight artist, album, duration columns
-                    item = self.table.item(row, col)
-                    if item:
-                        item.setData(Qt.UserRole + 1, "playing")
-                
-                # Select the row for visual feedback
-                self.table.selectRow(row)
-                
-                # Force style update
-                self.table.viewport().update()
-                
-                # Load thumbnail if in thumbnail mode
-                if self.spectrum.mode == "Thumbnail":
-                    self.load_thumbnail_for_current_track()
+            # Reset track disc to gray for non-playing tracks
+            track_item = self.table.item(i, 0)
+            if track_item:
+                text = track_item.text()
+                # Remove any color emoji and set back to CD emoji
+                if "🔴" in text or "🟢" in text or "🔵" in text or "🟡" in text or "🟣" in text or "🟠" in text:
+                    # Extract just the filename
+                    parts = text.split(" ", 1)
+                    if len(parts) > 1:
+                        track_item.setText(f"💿 {parts[1]}")
+        
+        # Update database play stats
+        self.db.update_track_play_stats(file_path)
+        
+        self.title_label.setText(self.track_title(file_path))
+        
+        if not self.audio.isRunning():
+            self.audio.start()
+        
+        self.audio.play()
+        self.update_play_button_icon(playing=True)
+        
+        # Update duration display
+        mins = int(self.audio.duration // 60)
+        secs = int(self.audio.duration % 60)
+        duration_text = f"{mins:02d}:{secs:02d}"
+        
+        # Update duration in table
+        duration_item = self.table.item(row, 3)  # Changed from 1 to 3
+        if duration_item:
+            duration_item.setText(duration_text)
+        
+        # Store the actual duration
+        self.durations[row] = self.audio.duration
+        
+        # Update progress bar duration
+        self.duration_label.setText(duration_text)
+        
+        # Reset progress; the waveform follows from the audio thread
+        self.progress_bar.setValue(0)
+        self.progress_bar.set_waveform(None)
+        
+        # Highlight playing track with colorful disc
+        track_item = self.table.item(row, 0)
+        if track_item:
+            # Get current text (remove the 💿 if present)
+            current_text = track_item.text()
+            parts = current_text.split(" ", 1)
+            filename = parts[1] if len(parts) > 1 else current_text
+            
+            # Choose a color based on track index (rotating colors)
+            colors = ["🔴", "🟢", "🔵", "🟡", "🟣", "🟠"]  # Red, Green, Blue, Yellow, Purple, Orange
+            color_index = row % len(colors)
+            colorful_disc = colors[color_index]
+            
+            # Set colorful disc
+            track_item.setText(f"{colorful_disc} {filename}")
+            
+            # Set playing flag for styling
+            track_item.setData(Qt.UserRole + 1, "playing")
+        
+        # Also highlight other cells
+        for col in range(1, 4):  # Highlight artist, album, duration columns
+            item = self.table.item(row, col)
+            if item:
+                item.setData(Qt.UserRole + 1, "playing")
+        
+        # Select the row for visual feedback
+        self.table.selectRow(row)
+        
+        # Force style update
+        self.table.viewport().update()
+        
+        # Load thumbnail if in thumbnail mode
+        if self.spectrum.mode == "Thumbnail":
+            self.load_thumbnail_for_current_track()
+        
+        # Decode the following track ahead of time for a gapless transition
+        self.reset_next_prediction()
 
     def load_thumbnail_for_current_track(self):
         """Load thumbnail for the currently playing track"""
@@ -2192,13 +3600,13 @@ class MusicPlayer(QMainWindow):
 
 
     def toggle_play(self):
-        if self.audio.mono is None and self.files:
+        if self.audio._playing is None and self.files:
             self.play_selected(0)
-        elif self.audio.mono is not None:
+        elif self.audio._playing is not None:
             if self.audio.running:
-                self.audio.running = False
+                self.audio.pause()
             else:
-                self.audio.running = True
+                self.audio.play()
                 
                 if not self.audio.isRunning():
                     self.audio.start()
@@ -2234,28 +3642,56 @@ class MusicPlayer(QMainWindow):
         self.btn_play.update()
 
     def stop(self):
-        self.audio.running = False
+        self.audio.pause()
         self.update_play_button_icon(playing=False)
         self.progress_bar.setValue(0)
         self.current_time_label.setText("00:00")
 
-    def next(self):
+    def peek_next_index(self):
+        """Index that next() will play; chosen once per track so it can be preloaded"""
         if not self.files:
-            return
-        
-        if self.play_mode == "repeat_one":
-            self.play_selected(self.current_file_index)
-            return
+            return None
         
-        if self.play_mode == "shuffle":
-            if len(self.files) == 1:
-                next_index = 0
+        if self.next_index is None or not (0 <= self.next_index < len(self.files)):
+            if self.play_mode == "repeat_one" and self.current_file_index >= 0:
+                self.next_index = self.current_file_index
+            elif self.play_mode == "shuffle":
+                if len(self.files) == 1:
+                    self.next_index = 0
+                else:
+                    available_indices = [i for i in range(len(self.files)) if i != self.current_file_index]
+                    self.next_index = random.choice(available_indices)
             else:
-                available_indices = [i for i in range(len(self.files)) if i != self.current_file_index]
-                next_index = random.choice(available_indices)
+                self.next_index = (self.current_file_index + 1) % len(self.files)
+        
+        return self.next_index
+
+    def reset_next_prediction(self):
+        """Forget the predicted next track and preload a fresh prediction"""
+        self.next_index = None
+        next_index = None
+        if self.audio._playing is not None and self.current_file_index >= 0:
+            next_index = self.peek_next_index()
+        
+        if next_index is not None:
+            self.audio.preload_async(self.files[next_index])
         else:
-            next_index = (self.current_file_index + 1) % len(self.files)
+            self.audio.cancel_preload()
+
+    def on_track_advanced(self, file_path):
+        """The audio engine moved on to the preloaded track without a gap"""
+        if self.next_index is not None and 0 <= self.next_index < len(self.files) \
+                and self.files[self.next_index] == file_path:
+            self.current_file_index = self.next_index
+        elif file_path in self.files:
+            self.current_file_index = self.files.index(file_path)
+        self.on_track_loaded(file_path)
+
+    def next(self):
+        if not self.files:
+            return
         
+        next_index = self.peek_next_index()
         self.table.selectRow(next_index)
         self.play_selected(next_index)
 
@@ -2285,6 +3721,7 @@ class MusicPlayer(QMainWindow):
         next_index = (current_index + 1) % len(modes)
         self.play_mode = modes[next_index]
         self.update_shuffle_button_icon()
+        self.reset_next_prediction()
 
     def update_shuffle_button_icon(self):
         """Update shuffle button icon based on current mode"""
@@ -2323,47 +3760,48 @@ class MusicPlayer(QMainWindow):
     # ================= PROGRESS BAR =================
     
     def update_progress_from_audio(self, position):
-        if not self.user_is_seeking and self.audio.mono is not None and self.audio.duration > 0:
+        if not self.user_is_seeking and self.audio._playing is not None and self.audio.duration > 0:
             value = int((position / self.audio.duration) * 10000)
             self.progress_bar.setValue(value)
             
             mins = int(position // 60)
             secs = int(position % 60)
             self.current_time_label.setText(f"{mins:02d}:{secs:02d}")
-            
-            if position >= self.audio.duration and not hasattr(self, '_track_completed'):
-                self._track_completed = True
-                
-                if self.play_mode == "repeat_one":
-                    self.play_selected(self.current_file_index)
-                else:
-                    QTimer.singleShot(100, self.next)
-                
-                QTimer.singleShot(2000, lambda: delattr(self, '_track_completed'))
+
+    def on_waveform_ready(self, pyramid, file_path):
+        if file_path == self.audio.current_file:
+            self.progress_bar.set_waveform(pyramid)
+
+    def on_track_finished(self):
+        if self.play_mode == "repeat_one":
+            self.play_selected(self.current_file_index)
+        else:
+            QTimer.singleShot(100, self.next)
 
     def start_seeking(self):
         self.user_is_seeking = True
 
     def update_seek_preview(self, value):
-        if self.audio.mono is not None and self.audio.duration > 0:
+        if self.audio._playing is not None and self.audio.duration > 0:
             position = (value / 10000.0) * self.audio.duration
             mins = int(position // 60)
             secs = int(position % 60)
             self.current_time_label.setText(f"{mins:02d}:{secs:02d}")
 
     def end_seeking(self):
-        if self.audio.mono is not None and self.audio.duration > 0:
+        if self.audio._playing is not None and self.audio.duration > 0:
             value = self.progress_bar.value()
-            position = (value / 10000.0) * self.audio.duration
-            
-            self.audio.seek(position)
+            # The engine seeks by frame; seconds are only for the label
+            frame = value * self.audio._playing.frames // 10000
+            self.audio.seek(frame)
+            position = frame / self.audio.sr
             
             mins = int(position // 60)
             secs = int(position % 60)
             self.current_time_label.setText(f"{mins:02d}:{secs:02d}")
             
             if not self.audio.running:
-                self.audio.running = True
+                self.audio.play()
                 self.update_play_button_icon(playing=True)
             
             self.user_is_seeking = False
@@ -2372,6 +3810,16 @@ class MusicPlayer(QMainWindow):
     
     def update_visualizer(self):
         self.spectrum.update()
+        self.update_limiter_meter()
+
+    def update_limiter_meter(self):
+        # Falls back slowly so short reductions stay readable
+        level = max(self.audio.gain_reduction(), self.limiter_level - 0.3)
+        level = max(level, 0.0)
+        if round(level, 1) != round(self.limiter_level, 1):
+            self.limiter_label.setText(f"GR {level:.1f} dB")
+            self.limiter_label.setStyleSheet("color: #f0883e;" if level >= 3 else "color: #8b949e;")
+        self.limiter_level = level
 
     # ================= UI HELPERS =================
     
@@ -2383,6 +3831,53 @@ class MusicPlayer(QMainWindow):
         self.loading_label.setText("")
         self.loading_label.setVisible(False)
 
+    def on_load_failed(self, file_path):
+        self.hide_loading(os.path.basename(file_path))
+        self.title_label.setText(f"⚠ Could not load {os.path.basename(file_path)}")
+
+    # ================= EQUALIZER =================
+
+    def load_custom_eq(self):
+        """Restore the Custom EQ curve saved by show_equalizer()"""
+        saved = self.db.get_config('custom_eq')
+        if saved:
+            try:
+                gains = [float(g) for g in saved.split(",")]
+            except ValueError:
+                print(f"Ignoring invalid saved EQ curve: {saved}")
+                return
+            if len(gains) == len(EQ_FREQUENCIES):
+                EQ_PRESETS["Custom"][:] = gains
+
+    def show_equalizer(self):
+        dialog = EqualizerDialog(EQ_PRESETS["Custom"], self)
+        dialog.gains_changed.connect(self.on_eq_changed)
+        dialog.exec_()
+        self.db.save_config('custom_eq', ",".join(f"{g:g}" for g in EQ_PRESETS["Custom"]))
+
+    def on_eq_changed(self, gains):
+        EQ_PRESETS["Custom"][:] = gains
+        if self.effects_combo.currentText() != "Custom":
+            # Builds a fresh chain from the edited curve
+            self.effects_combo.setCurrentText("Custom")
+        else:
+            self.audio.set_eq_gains(gains)
+
+    # ================= TEMPO & MIX =================
+
+    def on_tempo_changed(self, _=None):
+        tempo = 1.0 + self.tempo_slider.value() / 1000
+        self.tempo_value.setText(f"{(tempo - 1.0) * 100:+.1f}%")
+        self.audio.set_tempo(tempo, self.key_spin.value())
+
+    def reset_tempo(self):
+        self.tempo_slider.setValue(0)
+        self.key_spin.setValue(0)
+
+    def on_crossfade_changed(self, mode):
+        self.audio.set_crossfade(*CROSSFADE_MODES[mode])
+        self.db.save_config('crossfade', mode)
+
     # ================= MENU ACTIONS =================
     
     def show_most_played_dialog(self):
@@ -2396,10 +3891,10 @@ class MusicPlayer(QMainWindow):
     # ================= CLEANUP =================
     
     def closeEvent(self, e):
+        self.loudness_scanner.shutdown()
+        self.library_analyzer.shutdown()
         self.audio.stop()
-        if self.audio.isRunning():
-            self.audio.terminate()
-            self.audio.wait()
+        self.audio.wait()
         e.accept()
 
 
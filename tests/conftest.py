@@ -0,0 +1,19 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def player():
+    """The current player module ("music player23.py"); needs its GUI and audio dependencies"""
+    for name in ("PyQt5", "sounddevice", "librosa", "mutagen"):
+        pytest.importorskip(name)
+    spec = importlib.util.spec_from_file_location("music_player", os.path.join(ROOT, "music player23.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
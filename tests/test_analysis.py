@@ -0,0 +1,71 @@
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip("librosa")
+
+from analysis import LoudnessMeter, pack_beats, pack_envelope, unpack_beats, unpack_envelope
+
+
+def sine(db, seconds, sr=48000, freq=1000.0):
+    """Stereo sine whose peak is `db` dBFS on each channel"""
+    t = np.arange(int(seconds * sr)) / sr
+    y = 10 ** (db / 20) * np.sin(2 * np.pi * freq * t)
+    return np.stack((y, y), axis=1)
+
+
+def measure(samples, sr=48000, chunk=4410):
+    meter = LoudnessMeter(sr)
+    for start in range(0, len(samples), chunk):
+        meter.add(samples[start:start + chunk])
+    return meter
+
+
+@pytest.mark.parametrize("sr", [44100, 48000])
+def test_reference_sine_reads_minus_23_lufs(sr):
+    # EBU Tech 3341 case 1: 1 kHz stereo sine at -23 dBFS
+    meter = measure(sine(-23.0, 20, sr), sr)
+    assert meter.integrated() == pytest.approx(-23.0, abs=0.1)
+    assert meter.true_peak_db() == pytest.approx(-23.0, abs=0.2)
+
+
+def test_quiet_passages_are_gated_out():
+    # EBU Tech 3341 case 3: -36 / -23 / -36 dBFS for 10 / 60 / 10 s
+    samples = np.concatenate((sine(-36.0, 10), sine(-23.0, 60), sine(-36.0, 10)))
+    assert measure(samples).integrated() == pytest.approx(-23.0, abs=0.1)
+
+
+def test_true_peak_sees_intersample_peaks():
+    # A quarter-rate sine sampled 45 degrees off its crests peaks 3 dB
+    # above its largest sample
+    sr = 48000
+    t = np.arange(sr)
+    y = 0.5 * np.sin(2 * np.pi * t / 4 + math.pi / 4)
+    meter = measure(np.stack((y, y), axis=1), sr)
+    sample_peak = 20 * math.log10(np.abs(y).max())
+    assert meter.true_peak_db() == pytest.approx(sample_peak + 3.01, abs=0.3)
+
+
+def test_beats_round_trip_to_the_millisecond():
+    times = np.cumsum(np.random.default_rng(5).uniform(0.3, 0.7, 400))
+    blob = pack_beats(times)
+    assert len(blob) < 2 * len(times) + 64
+    np.testing.assert_allclose(unpack_beats(blob), times, atol=0.0005)
+
+
+@pytest.mark.parametrize("times", [[1.0, 0.5, 2.0], [1.0, 90.0, 91.0]])
+def test_unsorted_or_sparse_beats_round_trip(times):
+    np.testing.assert_allclose(unpack_beats(pack_beats(times)), times)
+
+
+def test_empty_beats_and_envelopes():
+    assert len(unpack_beats(pack_beats([]))) == 0
+    assert len(unpack_beats(b"")) == 0
+    assert len(unpack_envelope(pack_envelope([]))) == 0
+
+
+def test_envelope_is_scaled_to_its_peak():
+    envelope = np.array([0.0, 1.0, 2.5, 5.0, 4.0])
+    np.testing.assert_allclose(unpack_envelope(pack_envelope(envelope)), envelope / 5.0, atol=0.5 / 255)
+    np.testing.assert_array_equal(unpack_envelope(pack_envelope(np.zeros(3))), 0.0)
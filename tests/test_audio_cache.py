@@ -0,0 +1,33 @@
+import numpy as np
+
+from audio_cache import MemoryTrackCache
+
+
+def test_memory_cache_keeps_full_length_native_tracks():
+    # A six-minute 44.1 kHz stereo track, streamed in decoder-sized chunks
+    sr = 44100
+    chunk = np.zeros((8192, 2), dtype=np.float32)
+    chunks = 6 * 60 * sr // len(chunk)
+    cache = MemoryTrackCache()
+
+    capture = cache.capture("track")
+    capture.begin(sr, 2)
+    for _ in range(chunks):
+        capture.write(chunk)
+    capture.commit()
+
+    entry = cache.get("track")
+    assert entry is not None
+    assert len(entry[0]) == chunks * len(chunk)
+    # ... and the budget holds several typical (four-minute) tracks
+    assert cache.max_bytes // (4 * 60 * sr * 2 * 4) >= 4
+
+
+def test_peek_leaves_the_stats_alone():
+    cache = MemoryTrackCache()
+    cache.put("a", np.zeros((10, 2), dtype=np.float32), 44100)
+    cache.put("b", np.zeros((10, 2), dtype=np.float32), 44100)
+    assert cache.peek("a") is not None
+    assert cache.peek("missing") is None
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+    assert list(cache.entries) == ["a", "b"]
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+
+from audio_stream import StreamSource
+
+
+def read(source, frames, timeout=5.0):
+    out = np.zeros((frames, source.channels), dtype=np.float32)
+    got = 0
+    deadline = time.monotonic() + timeout
+    while got < frames and not source.finished and time.monotonic() < deadline:
+        n = source.read_into(out[got:])
+        got += n
+        if not n:
+            time.sleep(0.001)
+    return out[:got]
+
+
+def test_seek_refills_the_same_ring_from_the_target(tmp_path):
+    ramp = (np.arange(44100 * 3) % 10007 / 10007.0).astype(np.float32)
+    samples = np.stack([ramp, -ramp], axis=1)
+    path = str(tmp_path / "ramp.wav")
+    sf.write(path, samples, 44100, subtype="FLOAT")
+
+    source = StreamSource(path, mono=False, buffer_seconds=0.5)
+    try:
+        ring = source._ring
+        read(source, 1000)
+        for target in (80000, 1234, 44100 * 3 - 500, 0):
+            source.seek(target)
+            got = read(source, 2000)
+            assert source._ring is ring
+            np.testing.assert_array_equal(got, samples[target:target + 2000])
+    finally:
+        source.close()
+
+
+def test_resampling_seek_keeps_the_filter():
+    from audio_stream import ArraySource, ResamplingSource
+
+    samples = np.random.default_rng(7).uniform(-0.5, 0.5, (48000, 2)).astype(np.float32)
+    source = ResamplingSource(ArraySource(samples, 48000), 44100)
+    out = np.zeros((1000, 2), dtype=np.float32)
+    source.read_into(out)
+    resampler = source._resampler
+    source.seek(22050)
+    got = out[:source.read_into(out)].copy()
+    assert source._resampler is resampler
+
+    fresh = ResamplingSource(ArraySource(samples, 48000), 44100)
+    fresh.seek(22050)
+    np.testing.assert_array_equal(got, out[:fresh.read_into(out)])
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+import scipy.signal as sig
+
+from convolution import ConvolutionReverb
+
+
+@pytest.mark.parametrize("partition", [256, 1024])
+def test_reverb_matches_direct_convolution(partition):
+    rng = np.random.default_rng(3)
+    ir = rng.standard_normal((3000, 2)) * np.exp(-np.arange(3000) / 600)[:, None] * 0.1
+    x = rng.uniform(-0.5, 0.5, (20000, 2))
+    node = ConvolutionReverb(ir, wet=0.3, dry=0.8, partition=partition)
+    node.set_samplerate(44100)
+
+    out = []
+    start = 0
+    for size in [100, 1024, 37, 2048, 1000] * 5:
+        stop = start + size
+        out.append(node.process(x[start:stop].copy()).copy())
+        start = stop
+    out = np.concatenate(out)
+
+    # The wet path runs one partition behind the dry signal
+    wet = np.stack([sig.fftconvolve(x[:, c], ir[:, c]) for c in range(2)], axis=1)
+    expected = 0.8 * x[:len(out)]
+    expected[partition:] += 0.3 * wet[:len(out) - partition]
+    np.testing.assert_allclose(out, expected, atol=1e-5)
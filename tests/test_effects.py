@@ -0,0 +1,162 @@
+import math
+
+import numpy as np
+import pytest
+
+from effects import (PRESETS, SOS_CACHE_SIZE, AutoPan, BeatPump, DolbySurround, Effect8D, EffectChain, Gain,
+                     ParametricEQ, SoftClip, beat_envelope, build_chain, eq_sos, graphic_bands)
+
+
+class StarvedSource:
+    """Delivers `pattern[i]` frames on the i-th read, like a decoder that falls behind"""
+
+    def __init__(self, pattern, channels=2):
+        self.pattern = list(pattern)
+        self.channels = channels
+        self.rng = np.random.default_rng(0)
+
+    def read_into(self, out):
+        n = min(self.pattern.pop(0) if self.pattern else 0, len(out))
+        out[:n] = self.rng.uniform(-0.5, 0.5, size=(n, self.channels))
+        return n
+
+
+@pytest.mark.parametrize("preset", list(PRESETS))
+@pytest.mark.parametrize("prepared", [True, False])
+def test_presets_survive_an_underrunning_source(preset, prepared):
+    chain = build_chain(preset, 44100)
+    if prepared:
+        chain.prepare(1024)
+    source = StarvedSource([0, 1024, 0, 0, 300, 1, 0, 1024])
+    buf = np.empty((1024, 2))
+    for _ in range(8):
+        n = source.read_into(buf)
+        out = chain.process(buf[:n])
+        assert out.shape == (n, 2)
+        assert np.isfinite(out).all()
+
+
+def pan_angles(chain):
+    return [node.angle for node in chain.nodes if hasattr(node, "angle")]
+
+
+@pytest.mark.parametrize("preset", list(PRESETS))
+def test_locate_puts_pan_lfos_where_playback_would_have(preset):
+    played = build_chain(preset, 44100)
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        played.process(rng.uniform(-0.5, 0.5, size=(1000, 2)))
+    located = build_chain(preset, 44100)
+    located.locate(50 * 1000)
+    assert np.allclose(pan_angles(located), pan_angles(played))
+
+
+def per_sample_reference(effect, mono):
+    """The per-sample loop the block engine replaced, at 22050 Hz mono"""
+    out = np.zeros((len(mono), 2))
+    angle = 0.0
+    for i, base in enumerate(mono):
+        pan = (math.sin(angle) + 1) * 0.5
+        angle += 0.0006
+        left = right = base
+        if effect == "Rock":
+            left = right = base * 1.35
+        elif effect == "3D":
+            left = base * (1 - pan) * 1.3
+            right = base * pan * 1.3
+        elif effect == "8D":
+            depth = 1.0 - abs(math.cos(angle)) * 0.3
+            left = base * (1 - pan) * depth * 1.4
+            right = base * pan * depth * 1.4
+        elif effect == "Dolby":
+            side = math.sin(angle) * 0.3
+            left = base * 1.3 + side
+            right = base * 1.3 - side
+        out[i] = np.tanh(left), np.tanh(right)
+    return out
+
+
+BLOCK_ENGINE = {
+    "Flat": lambda: [SoftClip()],
+    "Rock": lambda: [Gain(1.35), SoftClip()],
+    "3D": lambda: [AutoPan(gain=1.3), SoftClip()],
+    "8D": lambda: [AutoPan(gain=1.4, depth=0.3), SoftClip()],
+    "Dolby": lambda: [DolbySurround(gain=1.3, side=0.3), SoftClip()],
+}
+
+
+@pytest.mark.parametrize("effect", list(BLOCK_ENGINE))
+def test_block_engine_matches_the_per_sample_loop(effect):
+    mono = np.random.default_rng(1).uniform(-0.8, 0.8, 5000)
+    chain = EffectChain(BLOCK_ENGINE[effect](), 22050)
+    out = []
+    # Uneven blocks carry the LFO phase across their boundaries
+    for start, stop in zip([0, 1024, 1500, 2524, 4000], [1024, 1500, 2524, 4000, 5000]):
+        block = np.repeat(mono[start:stop, None], 2, axis=1)
+        out.append(chain.process(block).copy())
+    np.testing.assert_allclose(np.concatenate(out), per_sample_reference(effect, mono), atol=1e-9)
+
+
+def test_effect8d_echo_crosses_block_boundaries():
+    sr = 44100
+    mono = np.random.default_rng(2).uniform(-0.5, 0.5, 6000)
+    # The original per-sample loop over the whole track, without its
+    # drop-outs: the echo is the dry signal 500 frames earlier
+    expected = np.zeros((len(mono), 2))
+    angle = 0.0
+    for i, x in enumerate(mono):
+        angle += 0.8 / sr
+        pan = (math.sin(angle) + 1) / 2
+        depth = 1 - math.cos(angle) * 0.3
+        echo = mono[i - 500] * 0.2 if i >= 500 else 0.0
+        expected[i] = x * (1 - pan) * depth + echo, x * pan * depth + echo
+
+    node = Effect8D(sr)
+    out = []
+    for start, stop in zip([0, 300, 1324, 1400, 3000], [300, 1324, 1400, 3000, 6000]):
+        out.append(node.process(np.repeat(mono[start:stop, None], 2, axis=1)).copy())
+    np.testing.assert_allclose(np.concatenate(out), expected, atol=1e-9)
+
+
+def test_beat_envelope_values():
+    beats = np.array([1000, 5000, 5200])
+    positions = np.arange(8000)
+    attack, decay = 100, 500.0
+    out = beat_envelope(beats, positions, attack, decay, np.empty(len(positions)))
+    for p in (0, 999, 1000, 1050, 1100, 1600, 4999, 5100, 5199, 5200, 5250, 7999):
+        earlier = beats[beats <= p]
+        if not len(earlier):
+            expected = 0.0
+        else:
+            since = p - earlier[-1]
+            expected = min(since / attack, 1.0) * math.exp(-max(since - attack, 0) / decay)
+        assert out[p] == pytest.approx(expected), p
+    assert out.min() >= 0 and out.max() <= 1
+
+
+def test_beat_pump_follows_the_track_position_across_blocks():
+    x = np.random.default_rng(4).uniform(-0.5, 0.5, (8192, 2))
+    beats = np.array([500, 3000, 6000])
+    whole = BeatPump()
+    whole.set_beats(beats)
+    whole.seek(0)
+    expected = whole.process(x.copy())
+    pump = BeatPump()
+    pump.set_beats(beats)
+    out = []
+    for start in range(0, len(x), 1000):
+        pump.seek(start)
+        out.append(pump.process(x[start:start + 1000].copy()).copy())
+    np.testing.assert_allclose(np.concatenate(out), expected, atol=1e-12)
+    # The bass is only added after the first beat
+    np.testing.assert_array_equal(expected[:500], x[:500])
+    assert not np.allclose(expected[500:], x[500:])
+
+
+def test_equalizer_edits_keep_the_filter_cache_bounded():
+    eq = ParametricEQ(graphic_bands([0.0] * 10))
+    for step in range(3 * SOS_CACHE_SIZE):
+        eq.set_gains([step / 10.0] * 10)
+    assert eq_sos.cache_info().currsize <= SOS_CACHE_SIZE
+    # A repeated band set is served from the cache
+    assert eq_sos(graphic_bands([0.0] * 10), 44100) is eq_sos(graphic_bands([0.0] * 10), 44100)
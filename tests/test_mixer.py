@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from mixer import Crossfade, plan_transition
+
+
+def test_plan_transition_lengths():
+    sr = 44100
+    assert plan_transition(100 * sr, sr) is None
+    assert plan_transition(100 * sr, sr, seconds=8.0) == (92 * sr, 8 * sr)
+    # 16 beats at 120 BPM are 8 s, whatever the seconds say
+    assert plan_transition(100 * sr, sr, seconds=4.0, beats=16, bpm=120.0) == (92 * sr, 8 * sr)
+    # Without a tempo the seconds are used
+    assert plan_transition(100 * sr, sr, seconds=4.0, beats=16) == (96 * sr, 4 * sr)
+    # Never more than half the track
+    assert plan_transition(10 * sr, sr, seconds=8.0) == (5 * sr, 5 * sr)
+
+
+def test_plan_transition_starts_on_a_beat():
+    sr = 44100
+    beats = np.arange(0, 100 * sr, sr // 2) + 1234
+    start, length = plan_transition(100 * sr, sr, seconds=8.0, beat_positions=beats)
+    assert length == 8 * sr
+    assert start in beats
+    assert 92 * sr - sr // 2 < start <= 92 * sr
+
+
+@pytest.mark.parametrize("offset", [0, 300])
+@pytest.mark.parametrize("length", [1000, 44100])
+def test_crossfade_keeps_equal_power(length, offset):
+    fade = Crossfade(length, offset)
+    outs, ins = [], []
+    while not fade.finished:
+        fade_out, fade_in = fade.gains(1024)
+        outs.append(fade_out.copy())
+        ins.append(fade_in.copy())
+    fade_out, fade_in = np.concatenate(outs), np.concatenate(ins)
+
+    power = fade_out ** 2 + fade_in ** 2
+    np.testing.assert_allclose(power, 1.0, atol=1e-3)
+    # Nothing fades before the offset; then out falls and in rises to the end
+    np.testing.assert_array_equal(fade_out[:offset + 1], 1.0)
+    np.testing.assert_array_equal(fade_in[:offset + 1], 0.0)
+    assert np.all(np.diff(fade_out) <= 1e-12) and np.all(np.diff(fade_in) >= -1e-12)
+    assert fade_in[offset + length:] == pytest.approx(1.0)
+    assert fade_out[offset + length:] == pytest.approx(0.0, abs=1e-12)
+    # Halfway through both decks play at -3 dB
+    assert fade_in[offset + length // 2] == pytest.approx(np.sqrt(0.5), abs=1e-3)
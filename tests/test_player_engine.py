@@ -0,0 +1,208 @@
+import numpy as np
+import pytest
+
+from audio_stream import ArraySource
+from effects import PRESETS
+from timestretch import TimeStretchSource
+from test_effects import StarvedSource
+
+
+class StarvedTrack(StarvedSource):
+    """Playback source whose decoder never catches up"""
+
+    sr = 44100
+    frames = 44100 * 60
+    position = 0
+    finished = False
+
+    def read_into(self, out):
+        n = super().read_into(out)
+        self.position += n
+        return n
+
+    def seek(self, frame):
+        self.position = frame
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def engine(player, tmp_path, monkeypatch):
+    """An AudioThread driven by hand, without an output stream"""
+    monkeypatch.chdir(tmp_path)
+    audio = player.AudioThread()
+    # Every rate is accepted, as by a device that resamples itself
+    monkeypatch.setattr(audio, "_output_rate", lambda sr: sr)
+    audio.running = True
+    yield audio
+    audio.stop()
+
+
+def start(audio, source):
+    audio.source = audio._playing = audio._playable(source)
+    audio.sr = audio._open_sr = audio._render_sr = source.sr
+    audio.duration = source.duration if hasattr(source, "duration") else 60.0
+
+
+def render(audio, blocks, frames=1024):
+    out = np.zeros((frames, 2), dtype=np.float32)
+    rendered = []
+    for _ in range(blocks):
+        audio.callback(out, frames, None, None)
+        rendered.append(out.copy())
+    return np.concatenate(rendered)
+
+
+@pytest.mark.parametrize("preset", list(PRESETS))
+def test_render_survives_decoder_underrun(engine, preset):
+    engine.set_effect(preset)
+    start(engine, StarvedTrack([0, 1024, 0, 300, 0, 0, 1024]))
+    out = render(engine, 8)
+    assert np.isfinite(out).all()
+    assert engine.running
+
+
+def tone(freq, seconds=4.0, sr=44100):
+    t = np.arange(int(seconds * sr)) / sr
+    return np.repeat(0.3 * np.sin(2 * np.pi * freq * t)[:, None], 2, axis=1).astype(np.float32)
+
+
+def test_skipping_to_a_preloaded_track_stretches_it_once(engine):
+    engine._set_source(ArraySource(tone(440), 44100))
+    engine.set_tempo(1.08, 2)
+    engine._on_preload_ready(ArraySource(tone(660), 44100), engine._preload_generation, "next.wav")
+
+    engine.load_async("next.wav")
+    render(engine, 1)
+    assert isinstance(engine.source, TimeStretchSource)
+    assert not isinstance(engine.source.source, TimeStretchSource)
+
+    engine.set_tempo(1.0, 0)
+    render(engine, 4)
+    assert not engine.source.active
+
+
+class ClosingSource(ArraySource):
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+def test_only_the_callback_closes_the_queued_track(engine):
+    engine._set_source(ArraySource(tone(440, 0.05), 44100), "a.wav")
+    engine._open_sr = 44100
+    dropped = ClosingSource(tone(550), 44100)
+    engine._on_preload_ready(dropped, engine._preload_generation, "b.wav")
+    engine.cancel_preload()
+    assert not dropped.closed
+    render(engine, 1)
+    assert dropped.closed and engine.next_source is None
+
+    queued = ClosingSource(tone(660), 44100)
+    engine._on_preload_ready(queued, engine._preload_generation, "c.wav")
+    render(engine, 3)
+    assert engine.source.source is queued
+    # The GUI drops its preload before it has seen the callback switch to it
+    engine.cancel_preload()
+    out = render(engine, 2)
+    assert not queued.closed
+    assert engine.source.source is queued and np.abs(out).max() > 0.1
+
+
+def test_a_new_track_drops_the_old_tracks_seek(engine):
+    start(engine, StarvedTrack([1024] + [0] * 20))
+    render(engine, 1)
+    engine.seek(44100 * 30)
+    render(engine, 1)
+    assert engine._preroll
+
+    engine._set_source(ArraySource(tone(440), 44100))
+    out = render(engine, 2)
+    assert not engine._preroll and engine._seek_from is None
+    assert engine.source.position == 2048
+    assert np.abs(out[1024:]).max() > 0.1
+
+
+def test_seek_position_is_shown_until_the_callback_applies_it(engine):
+    start(engine, ArraySource(tone(440, 40.0), 44100))
+    render(engine, 1)
+    engine.seek(44100 * 20)
+    # Only the callback moves its own counter; the GUI shows the request meanwhile
+    assert engine.position_frames == 1024
+    assert engine.current_position == 20.0
+
+    render(engine, 1)
+    assert engine.position_frames == 44100 * 20 + 1024
+    engine.poll_events()
+    assert engine._position_request is None
+    assert engine.current_position == (44100 * 20 + 1024) / 44100
+
+
+class FakeStream:
+    stopped = False
+
+    def start(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_play_during_suspension_is_not_lost(player):
+    class RacingThread(player.AudioThread):
+        """play() lands right after `running` has been read `race` times"""
+
+        race = 0
+
+        @property
+        def running(self):
+            value = self._running
+            if self.race:
+                self.race -= 1
+                if not self.race:
+                    self.play()
+            return value
+
+        @running.setter
+        def running(self, value):
+            self._running = value
+
+    audio = RacingThread()
+    try:
+        stream = FakeStream()
+        audio._suspend_requested = True
+        audio._wake.clear()
+        # The resume check reads `running` first, the suspension second
+        audio.race = 2
+        audio._update_suspension(stream)
+        # Either the stream keeps running or run() is woken to restart it
+        assert not stream.stopped or audio._wake.is_set()
+        audio._wake.clear()
+        audio._update_suspension(stream)
+        assert not stream.stopped and not audio.suspended
+    finally:
+        audio.stop()
+
+
+def test_the_callback_never_rerates_a_chain(engine):
+    engine.set_effect("8D")
+    start(engine, ArraySource(tone(440), 44100))
+    render(engine, 2)
+    old_chain = engine._chain
+
+    engine._set_source(ArraySource(tone(440), 48000))
+    new_chain = engine.params.chain
+    assert new_chain.sr == 48000
+    # A block of the old track before the callback takes the new one
+    play = engine._commands.pop()
+    render(engine, 1)
+    assert engine._chain is old_chain and old_chain.sr == 44100
+
+    engine._commands.append(play)
+    engine._open_sr = 48000
+    render(engine, 2)
+    assert engine._chain is new_chain and new_chain.sr == 48000
+    assert old_chain.sr == 44100
@@ -0,0 +1,66 @@
+import math
+import threading
+
+import numpy as np
+import pytest
+
+from audio_stream import ArraySource
+from timestretch import TimeStretchSource, semitone_ratio
+
+
+SR = 44100
+
+
+def sine(freq=440.0, seconds=3.0, amplitude=0.5):
+    t = np.arange(int(seconds * SR)) / SR
+    return np.repeat((amplitude * np.sin(2 * np.pi * freq * t))[:, None], 2, axis=1).astype(np.float32)
+
+
+@pytest.mark.parametrize("semitones", [0, 2])
+@pytest.mark.parametrize("block_size", [256, 1000, 1024])
+def test_switching_back_to_direct_playback_does_not_click(semitones, block_size):
+    # The largest step a clean sine makes at the highest pitch played
+    limit = 1.3 * 2 * math.pi * 440.0 * max(1.0, semitone_ratio(semitones)) / SR * 0.5
+    out = np.zeros((block_size, 2), dtype=np.float32)
+    for switch in range(5, 25, 3):
+        source = TimeStretchSource(ArraySource(sine(), SR), 1.08, semitones)
+        played = []
+        for i in range(40):
+            if i == switch:
+                source.set(1.0, 0.0)
+                at = sum(len(block) for block in played)
+            n = source.read_into(out)
+            played.append(out[:n, 0].copy())
+        y = np.concatenate(played)
+        steps = np.abs(np.diff(y[at - 64:at + 2048]))
+        assert steps.max() < limit, (switch, steps.max())
+
+
+def test_switching_back_keeps_a_streamed_source_playing(tmp_path):
+    sf = pytest.importorskip("soundfile")
+    from audio_stream import StreamSource
+
+    path = str(tmp_path / "sine.wav")
+    sf.write(path, sine(), SR, subtype="FLOAT")
+    stream = StreamSource(path, mono=False)
+    try:
+        assert stream.wait_ready(4 * SR)
+        source = TimeStretchSource(stream, 1.08, 0)
+        out = np.zeros((1024, 2), dtype=np.float32)
+        played = []
+        for _ in range(10):
+            played.append(out[:source.read_into(out), 0].copy())
+        heard = source.position
+        # The decoder thread has decoded the whole file and sleeps; a seek
+        # would not wake it, as when the callback outruns the decoder
+        stream._decoder._wake = threading.Event()
+        source.set(1.0, 0.0)
+        for _ in range(4):
+            n = source.read_into(out)
+            assert n == len(out)
+            played.append(out[:n, 0].copy())
+        assert abs(source.position - (heard + 4 * len(out))) <= 1
+        steps = np.abs(np.diff(np.concatenate(played)[9 * 1024:]))
+        assert steps.max() < 1.3 * 2 * math.pi * 440.0 / SR * 0.5
+    finally:
+        stream.close()
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from waveform import BASE_FRAMES, build_waveform
+
+
+def brute_force_columns(mono, pyramid, width):
+    """Min / max / RMS of the samples under each of `width` columns, read
+    at the level columns() picks"""
+    level = max(i for i, columns in enumerate(pyramid.levels) if len(columns) >= width)
+    span = BASE_FRAMES << level
+    n = len(pyramid.levels[level])
+    starts = np.arange(width + 1) * n // width * span
+    mins, maxs, rms = [], [], []
+    for start, stop in zip(starts[:-1], starts[1:]):
+        part = mono[start:stop]
+        mins.append(part.min())
+        maxs.append(part.max())
+        rms.append(max(np.sqrt(np.mean(np.square(part[i:i + span])))
+                       for i in range(0, len(part), span)))
+    return np.array(mins), np.array(maxs), np.array(rms)
+
+
+@pytest.mark.parametrize("frames", [BASE_FRAMES * 2560, 44100 * 30 + 123])
+@pytest.mark.parametrize("width", [64, 300, 777, 1500])
+def test_columns_match_brute_force_min_max(width, frames):
+    rng = np.random.default_rng(6)
+    envelope = np.abs(np.sin(np.arange(frames) / 44100.0))
+    samples = (rng.uniform(-1, 1, (frames, 2)) * envelope[:, None]).astype(np.float32)
+    pyramid = build_waveform(samples, 44100)
+    mono = samples.mean(axis=1, dtype=np.float32)
+
+    mins, maxs, rms = pyramid.columns(width)
+    expected = brute_force_columns(mono, pyramid, width)
+    assert len(mins) == len(maxs) == len(rms) == width
+    # The RMS of a partial last column is averaged in as a full one
+    checked = 3 if frames % (BASE_FRAMES * 2560) == 0 else 2
+    # int8 columns hold the values to within half a step
+    for got, want in zip((mins, maxs, rms)[:checked], expected[:checked]):
+        np.testing.assert_allclose(got, want, atol=0.5 / 127 + 1e-6)
+
+
+def test_short_tracks_stretch_over_the_width():
+    samples = np.linspace(-1, 1, 10 * BASE_FRAMES, dtype=np.float32)[:, None]
+    mins, maxs, _ = build_waveform(samples, 44100).columns(40)
+    assert len(mins) == 40
+    # Each of the 10 columns spans 4 pixels
+    np.testing.assert_array_equal(mins[::4], mins[1::4])
+    assert np.all(np.diff(maxs[::4]) > 0)
@@ -0,0 +1,348 @@
+import math
+import numpy as np
+
+from audio_stream import StreamResampler
+
+
+# Tempo range of the player's pitch fader (+-16%, as on DJ turntables)
+TEMPO_RANGE = 0.16
+
+
+def semitone_ratio(semitones):
+    return 2.0 ** (semitones / 12.0)
+
+
+# ================= PHASE VOCODER =================
+class PhaseVocoder:
+    """Streaming phase vocoder with identity phase locking.
+
+    Input is pushed in chunks of any size and synthesis frames are pulled
+    one at a time; every frame reads the input `analysis_hop` further on
+    while the output always advances by `hop`, so the output runs `stretch`
+    times as long as the input. Each frame's phase advance is measured
+    between two analysis frames exactly `hop` apart, and the bins around
+    every spectral peak keep their phase relation to the peak (Laroche &
+    Dolson), which avoids most of the phasiness of a plain vocoder. All
+    spectra are (bins, channels), so channels are processed together.
+    """
+
+    def __init__(self, sr, channels, frame_size=None):
+        self.channels = channels
+        self.frame_size = frame_size or 1 << int(round(math.log2(0.046 * sr)))
+        self.hop = self.frame_size // 4
+        n = self.frame_size
+        self.window = np.hanning(n + 1)[:n, None]
+        # Hann analysis and synthesis windows at 75% overlap sum to 1.5
+        self._norm = 1.0 / 1.5
+        self._nearest = np.empty((n // 2 + 1, channels), dtype=np.int64)
+        self._columns = np.arange(channels)
+        self.stretch = 1.0
+        self.reset()
+
+    def reset(self):
+        # Input starts with `hop` frames of silence so the first frame has a
+        # predecessor
+        self._in = np.zeros((self.hop, self.channels))
+        self._pos = float(self.hop)
+        self._phase = None
+        self._ola = np.zeros((self.frame_size, self.channels))
+        # Current and previous analysis frames side by side, one FFT for both
+        self._frames = np.empty((self.frame_size, 2 * self.channels))
+
+    def push(self, chunk):
+        self._in = np.concatenate((self._in, chunk))
+
+    def ready(self):
+        """True when the input holds the next analysis frame"""
+        return int(self._pos) + self.frame_size <= len(self._in)
+
+    def pull(self):
+        """Synthesize the next `hop` output frames"""
+        n = self.frame_size
+        ch = self.channels
+        a = int(self._pos)
+        frames = self._frames
+        np.multiply(self._in[a:a + n], self.window, out=frames[:, :ch])
+        np.multiply(self._in[a - self.hop:a - self.hop + n], self.window, out=frames[:, ch:])
+        spectra = np.fft.rfft(frames, axis=0)
+        # The offset gives silent bins phase 0 instead of no phasor at all,
+        # which would zero the phase they carry forward
+        spectra += 1e-12
+        magnitude = np.abs(spectra)
+        # Unit phasors of both frames
+        units = spectra / magnitude
+        current = spectra[:, :ch]
+        unit = units[:, :ch]
+
+        # The frames are exactly one synthesis hop apart, so their phase
+        # difference is the phase advance of each bin; phases are kept as
+        # unit phasors, which needs no angle() / exp() per bin
+        if self._phase is None:
+            self._phase = unit.copy()
+        else:
+            self._phase *= unit
+            self._phase *= units[:, ch:].conj()
+
+        # Identity phase locking: every bin keeps its phase offset from its
+        # nearest peak, i.e. takes the peak's rotation
+        rotation = self._phase * unit.conj()
+        peaks = (magnitude[1:-1, :ch] > magnitude[:-2, :ch]) & (magnitude[1:-1, :ch] >= magnitude[2:, :ch])
+        bins = len(magnitude)
+        for c in range(ch):
+            index = np.flatnonzero(peaks[:, c]) + 1
+            if not len(index):
+                index = np.zeros(1, dtype=np.int64)
+            # Each bin belongs to the peak on its side of the midpoints
+            bounds = np.concatenate(([0], (index[:-1] + index[1:]) // 2 + 1, [bins]))
+            self._nearest[:, c] = np.repeat(index, np.diff(bounds))
+        rotation = rotation.take(self._nearest * ch + self._columns)
+        current *= rotation
+        np.multiply(unit, rotation, out=self._phase)
+
+        frame = np.fft.irfft(current, n=n, axis=0)
+        frame *= self.window
+        ola = self._ola
+        ola += frame
+        out = ola[:self.hop] * self._norm
+        ola[:-self.hop] = ola[self.hop:]
+        ola[-self.hop:] = 0
+
+        self._pos += self.hop / self.stretch
+        # Drop input no later frame can reach
+        drop = int(self._pos) - self.hop
+        if drop > 0:
+            self._in = self._in[drop:]
+            self._pos -= drop
+        return out
+
+
+# ================= TIME-STRETCH SOURCE =================
+class TimeStretchSource:
+    """Plays another source at `tempo` times its speed, shifted by `semitones`.
+
+    Tempo and pitch are independent: the phase vocoder stretches the audio
+    by pitch / tempo and a resampler then plays it `pitch` times faster.
+    With neither set the source is read directly. Like ResamplingSource it
+    wraps any source and fills exact frame counts, so the audio callback
+    uses it unchanged; set() may be called from another thread and takes
+    effect on the next read.
+
+    `position` and `duration` stay in the track's own frames / seconds.
+    """
+
+    def __init__(self, source, tempo=1.0, semitones=0.0, chunk_frames=2048):
+        self.source = source
+        self.sr = source.sr
+        self.channels = source.channels
+        self.tempo = 1.0
+        self.semitones = 0.0
+        self._settings = (float(tempo), float(semitones))
+        self._applied = None
+        self._vocoder = PhaseVocoder(self.sr, self.channels)
+        self._resampler = None
+        self._in = np.empty((chunk_frames, self.channels), dtype=np.float32)
+        # Last input frames, to restart the vocoder without a gap
+        self._history = np.zeros((self._vocoder.frame_size, self.channels))
+        self._pending = np.zeros((0, self.channels))
+        # Vocoder frames still to drop after a restart (already played)
+        self._discard = 0
+        # Last vocoder output, faded out when switching back to bypass
+        self._tail = None
+        # Source frames read by the vocoder but not heard yet (from track
+        # frame `_ahead_start`), and those still to play after switching back
+        # to bypass; the source itself is never sought back
+        self._ahead = np.zeros((0, self.channels), dtype=np.float32)
+        self._ahead_start = source.position
+        self._backlog = self._ahead
+        self._last_pulled = np.zeros((0, self.channels))
+        # Resampler of the previous key, crossfaded out after a key change
+        self._retuned = False
+        self._old_resampler = None
+        self._flushed = False
+        self._position = float(source.position)
+
+    @property
+    def active(self):
+        return self.tempo != 1.0 or self.semitones != 0.0
+
+    @property
+    def position(self):
+        return int(self._position) if self.active else self._heard()
+
+    @property
+    def frames(self):
+        return self.source.frames
+
+    @property
+    def duration(self):
+        return self.source.duration
+
+    @property
+    def finished(self):
+        source_finished = self.source.finished and not len(self._backlog)
+        if not self.active:
+            return source_finished
+        return source_finished and self._flushed and not self._vocoder.ready() \
+            and not len(self._pending)
+
+    def _heard(self):
+        """Track frame of the next frame read directly"""
+        return self.source.position - len(self._backlog)
+
+    def wait_ready(self, frames, timeout=5.0):
+        return self.source.wait_ready(int(frames * self.tempo) + self._vocoder.frame_size, timeout)
+
+    def set(self, tempo=1.0, semitones=0.0):
+        self._settings = (float(tempo), float(semitones))
+
+    def _apply_settings(self):
+        settings = self._settings
+        if settings is self._applied:
+            return
+        was_active = self.active
+        vocoder = self._vocoder
+        if was_active and settings == (1.0, 0.0):
+            self._tail = self._next_output()
+        self.tempo, self.semitones = settings
+        self._applied = settings
+        pitch = semitone_ratio(self.semitones)
+        step = self._resampler.step if self._resampler is not None else 1.0
+        if pitch != step:
+            resampler = None
+            if pitch != 1.0:
+                resampler = StreamResampler(pitch, 1.0, self.channels)
+                # Settle its filter on the audio just played
+                resampler.process(self._last_pulled if was_active else self._history)
+            if was_active and self.active:
+                # Crossfade from the old key over the next output block
+                self._retuned = True
+                self._old_resampler = self._resampler
+            self._resampler = resampler
+
+        if self.active and not was_active:
+            # Restart from the frames just played: at stretch 1 the vocoder
+            # reproduces its input, so once the frames covering them are
+            # dropped the output continues seamlessly
+            self._position = float(self._heard())
+            self._ahead = self._ahead[:0]
+            self._ahead_start = self._heard()
+            vocoder.reset()
+            vocoder.push(self._history)
+            vocoder.stretch = 1.0
+            self._discard = len(self._history) // vocoder.hop
+            self._pending = np.zeros((0, self.channels))
+        elif not self.active and was_active:
+            # The vocoder has read ahead of what was heard: play the frames
+            # it holds first and crossfade from its last output
+            skip = min(max(0, int(self._position) - self._ahead_start), len(self._ahead))
+            self._backlog = np.concatenate((self._ahead[skip:], self._backlog))
+            self._ahead = self._ahead[:0]
+            self._history = np.zeros_like(self._history)
+        if not self._discard:
+            vocoder.stretch = pitch / self.tempo
+
+    def read_into(self, out):
+        self._apply_settings()
+        if not self.active:
+            n = self._read_source(out)
+            self._remember(out[:n])
+            if self._tail is not None and n:
+                m = min(n, len(self._tail))
+                fade = np.linspace(0.0, 1.0, m, endpoint=False)[:, None]
+                out[:m] = self._tail[:m] + (out[:m] - self._tail[:m]) * fade
+                self._tail = None
+            return n
+
+        wanted = len(out)
+        filled = 0
+        while filled < wanted:
+            if not len(self._pending) and not self._produce():
+                break
+            n = min(len(self._pending), wanted - filled)
+            out[filled:filled + n] = self._pending[:n]
+            self._pending = self._pending[n:]
+            filled += n
+        self._position = min(self._position + filled * self.tempo, self.source.frames)
+        heard = int(self._position) - self._ahead_start
+        if heard > 0:
+            self._ahead = self._ahead[heard:]
+            self._ahead_start += heard
+        return filled
+
+    def _read_source(self, out):
+        """Read on from the source, starting with the backlog"""
+        n = min(len(self._backlog), len(out))
+        if n:
+            out[:n] = self._backlog[:n]
+            self._backlog = self._backlog[n:]
+        if n < len(out):
+            n += self.source.read_into(out[n:])
+        return n
+
+    def _produce(self):
+        """Put the next synthesized hop in `_pending`, reading the source as
+        the vocoder needs input; False when there is nothing to read yet or
+        the track has ended"""
+        vocoder = self._vocoder
+        while True:
+            if vocoder.ready():
+                frames = self._last_pulled = vocoder.pull()
+                if self._discard:
+                    self._discard -= 1
+                    if not self._discard:
+                        vocoder.stretch = semitone_ratio(self.semitones) / self.tempo
+                    continue
+                self._pending = self._resample(frames, self._resampler)
+                if self._retuned:
+                    old = self._resample(frames, self._old_resampler)
+                    m = min(len(old), len(self._pending))
+                    fade = np.linspace(0.0, 1.0, m, endpoint=False)[:, None]
+                    self._pending[:m] = old[:m] + (self._pending[:m] - old[:m]) * fade
+                    self._retuned = False
+                    self._old_resampler = None
+                return True
+            n = self._read_source(self._in)
+            if n:
+                vocoder.push(self._in[:n])
+                self._remember(self._in[:n])
+                self._ahead = np.concatenate((self._ahead, self._in[:n]))
+            elif self.source.finished and not self._flushed:
+                # Push silence through so the last frames come out
+                vocoder.push(np.zeros((vocoder.frame_size, self.channels)))
+                self._flushed = True
+            else:
+                return False
+
+    def _next_output(self):
+        """Output the vocoder would play next. It may read ahead in the
+        source; those frames are kept for direct playback. At least a hop
+        long, so the crossfade from it is never a step."""
+        tail = self._pending
+        self._pending = tail[:0]
+        while len(tail) < self._vocoder.hop and self._produce():
+            tail = np.concatenate((tail, self._pending))
+            self._pending = tail[:0]
+        return tail if len(tail) else None
+
+    def _resample(self, frames, resampler):
+        return frames if resampler is None else resampler.process(frames)
+
+    def _remember(self, frames):
+        n = min(len(frames), len(self._history))
+        self._history = np.concatenate((self._history[n:], frames[len(frames) - n:]))
+
+    def seek(self, frame):
+        self.source.seek(frame)
+        self._position = float(frame)
+        self._ahead = self._backlog = self._ahead[:0]
+        self._ahead_start = frame
+        self._vocoder.reset()
+        self._history = np.zeros_like(self._history)
+        self._pending = np.zeros((0, self.channels))
+        self._discard = 0
+        self._tail = None
+        self._flushed = False
+        self._vocoder.stretch = semitone_ratio(self.semitones) / self.tempo
+
+    def close(self):
+        self.source.close()
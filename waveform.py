@@ -0,0 +1,196 @@
+import os
+import numpy as np
+
+from audio_cache import track_key
+
+
+# Frames summarised by one column of the finest level (about 12 ms at
+# 44.1 kHz); every further level merges pairs of columns
+BASE_FRAMES = 512
+# No level is built narrower than this
+MIN_COLUMNS = 64
+
+
+# ================= PYRAMID =================
+class WaveformPyramid:
+    """Multi-resolution min / max / RMS overview of a track's mono mixdown.
+
+    `levels[0]` has one column per BASE_FRAMES frames and each next level
+    half as many. Columns are int8 (min, max, rms): peaks scaled to
+    -127..127 and RMS to 0..127, so all levels of a five-minute track take
+    about 150 KB before compression.
+    """
+
+    def __init__(self, levels, frames, sr):
+        self.levels = levels
+        self.frames = frames
+        self.sr = sr
+
+    @classmethod
+    def from_columns(cls, mins, maxs, mean_squares, frames, sr):
+        """Build every level from full-precision level-0 columns"""
+        levels = []
+        while True:
+            levels.append(np.stack((
+                _quantize(mins, -127, 127),
+                _quantize(maxs, -127, 127),
+                _quantize(np.sqrt(mean_squares), 0, 127),
+            ), axis=1))
+            if len(mins) <= MIN_COLUMNS:
+                break
+            if len(mins) % 2:
+                # The odd last column stands in for its missing pair
+                mins, maxs, mean_squares = (np.append(a, a[-1]) for a in (mins, maxs, mean_squares))
+            mins = np.minimum(mins[0::2], mins[1::2])
+            maxs = np.maximum(maxs[0::2], maxs[1::2])
+            mean_squares = 0.5 * (mean_squares[0::2] + mean_squares[1::2])
+        return cls(levels, frames, sr)
+
+    def columns(self, width):
+        """(mins, maxs, rms) as -1..1 floats, exactly `width` columns wide.
+
+        Reads the coarsest level that still has `width` columns, which holds
+        fewer than twice as many, so the cost is O(width) for any track
+        length.
+        """
+        level = self.levels[0]
+        for candidate in reversed(self.levels):
+            if len(candidate) >= width:
+                level = candidate
+                break
+        n = len(level)
+        if n == 0 or width <= 0:
+            empty = np.zeros(max(width, 0))
+            return empty, empty, empty
+        if n < width:
+            # Shorter than the widget: stretch columns over several pixels
+            level = level[np.arange(width) * n // width]
+            mins, maxs, rms = level[:, 0], level[:, 1], level[:, 2]
+        else:
+            starts = np.arange(width) * n // width
+            mins = np.minimum.reduceat(level[:, 0], starts)
+            maxs = np.maximum.reduceat(level[:, 1], starts)
+            rms = np.maximum.reduceat(level[:, 2], starts)
+        scale = 1.0 / 127
+        return mins * scale, maxs * scale, rms * scale
+
+    def save(self, path):
+        arrays = {f"level{i}": level for i, level in enumerate(self.levels)}
+        np.savez_compressed(path, frames=self.frames, sr=self.sr, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            count = sum(1 for name in data.files if name.startswith("level"))
+            levels = [data[f"level{i}"] for i in range(count)]
+            return cls(levels, int(data["frames"]), int(data["sr"]))
+
+
+def _quantize(values, low, high):
+    return np.clip(np.round(values * 127), low, high).astype(np.int8)
+
+
+# ================= BUILDER =================
+class WaveformBuilder:
+    """Decoder sink that summarises chunks into a WaveformPyramid as they
+    arrive; only level-0 columns are kept while decoding.
+
+    Follows the begin / write / commit / abort protocol of the PCM cache
+    sinks. `on_ready(pyramid)` is called from commit(), on the decoding
+    thread.
+    """
+
+    def __init__(self, on_ready=None):
+        self.on_ready = on_ready
+        self.pyramid = None
+        self.sr = None
+        self._carry = np.zeros(0, dtype=np.float32)
+        self._columns = []
+        self._frames = 0
+
+    def begin(self, sr, channels):
+        self.sr = sr
+
+    def write(self, chunk):
+        if self._columns is None:
+            return
+        chunk = np.asarray(chunk, dtype=np.float32)
+        mono = chunk.mean(axis=1) if chunk.ndim > 1 else chunk
+        self._frames += len(mono)
+        data = np.concatenate((self._carry, mono))
+        full = len(data) // BASE_FRAMES * BASE_FRAMES
+        if full:
+            self._add_columns(data[:full].reshape(-1, BASE_FRAMES))
+        self._carry = data[full:]
+
+    def _add_columns(self, blocks):
+        mean_squares = np.einsum("ij,ij->i", blocks, blocks, dtype=np.float64) / blocks.shape[1]
+        self._columns.append((blocks.min(axis=1), blocks.max(axis=1), mean_squares))
+
+    def commit(self):
+        if self._columns is None:
+            return
+        if len(self._carry):
+            self._add_columns(self._carry[None, :])
+        if self._columns:
+            mins, maxs, mean_squares = (np.concatenate(parts) for parts in zip(*self._columns))
+        else:
+            mins = maxs = mean_squares = np.zeros(0)
+        self._columns = None
+        self.pyramid = WaveformPyramid.from_columns(mins, maxs, mean_squares, self._frames, self.sr)
+        if self.on_ready is not None:
+            self.on_ready(self.pyramid)
+
+    def abort(self):
+        self._columns = None
+
+
+def build_waveform(samples, sr, chunk_frames=1 << 20):
+    """Pyramid of an already decoded (frames, channels) array, e.g. cached PCM"""
+    builder = WaveformBuilder()
+    builder.begin(sr, samples.shape[1] if samples.ndim > 1 else 1)
+    for start in range(0, len(samples), chunk_frames):
+        builder.write(samples[start:start + chunk_frames])
+    builder.commit()
+    return builder.pyramid
+
+
+# ================= CACHE =================
+class WaveformCache:
+    """Waveform pyramids stored as one compressed .npz per track.
+
+    Keyed like the PCM cache, so an edited file gets a new overview.
+    """
+
+    def __init__(self, directory="waveform_cache"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, path):
+        return os.path.join(self.directory, track_key(path, "waveform") + ".npz")
+
+    def contains(self, path):
+        try:
+            return os.path.exists(self.entry_path(path))
+        except OSError:
+            return False
+
+    def get(self, path):
+        try:
+            return WaveformPyramid.load(self.entry_path(path))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put(self, path, pyramid):
+        try:
+            pyramid.save(self.entry_path(path))
+        except OSError as e:
+            print(f"Waveform cache: could not store {os.path.basename(path)}: {e}")
+
+    def builder(self, path, on_ready=None):
+        """Decoder sink that stores the finished pyramid for `path`"""
+        def store(pyramid):
+            self.put(path, pyramid)
+            if on_ready is not None:
+                on_ready(pyramid)
+        return WaveformBuilder(store)
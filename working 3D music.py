@@ -1,12 +1,13 @@
 import sounddevice as sd
 import numpy as np
 import soundfile as sf
-import math
+
+from effects import AutoPan, EffectChain, room_reverb
 
 # 8D Settings
 rotation_speed = 0.7
 reverb_amount = 0.12
-angle = 0
+impulse_response = None  # reverb IR as a WAV file; None uses a synthetic room
 
 # Load audio file
 filename = "song.wav"   # CHANGE TO YOUR FILE
@@ -19,10 +20,13 @@ if len(audio.shape) == 1:
 # Normalize
 audio = audio.astype(np.float32)
 
+chain = EffectChain([AutoPan(speed=rotation_speed), room_reverb(reverb_amount, impulse_response)],
+                    samplerate)
+block = np.zeros((4096, 2))
 position = 0
 
 def callback(outdata, frames, time, status):
-    global position, angle
+    global position, block
 
     if status:
         print(status)
@@ -33,25 +37,14 @@ def callback(outdata, frames, time, status):
         outdata[:] = np.zeros((frames, 2), dtype='float32')
         raise sd.CallbackStop()
 
-    chunk = audio[position:end]
+    if len(block) < frames:
+        block = np.zeros((frames, 2))
+    chunk = block[:frames]
+    chunk[:] = audio[position:end, :2]
     position = end
 
-    # Convert to mono for effect
-    mono = chunk.mean(axis=1)
-
-    # Pan rotation
-    angle += rotation_speed * (frames / samplerate)
-    pan = (math.sin(angle) + 1) / 2
-
-    left = mono * (1 - pan)
-    right = mono * pan
-    stereo = np.column_stack((left, right))
-
-    # Reverb effect
-    echo = np.roll(stereo, 1500, axis=0) * reverb_amount
-    stereo += echo
-
-    outdata[:] = stereo.astype(np.float32)
+    # Rotation around the mid signal plus convolution reverb
+    outdata[:] = chain.process(chunk)
 
 print("🎧 Playing 8D Audio from File...")
 